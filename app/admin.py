@@ -1,9 +1,15 @@
 import json
 from django import forms
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.core.exceptions import ValidationError
+from django.db.models import Count
 
-from .models import Customer, TEPCode, Material, MaterialList, Forecast
+from .models import Customer, TEPCode, Material, MaterialList, Forecast, ChangeEvent, SlowQuery
+from .propagation import propagate_masters
+from .trigram import search_masters
+
+
+ADMIN_FUZZY_LIMIT = 500
 
 
 class TEPCodeInline(admin.TabularInline):
@@ -84,9 +90,13 @@ class CustomerAdmin(admin.ModelAdmin):
         return len(obj.parts or [])
     parts_count.short_description = "Parts"
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(tep_total=Count("tep_codes"))
+
     def tep_count(self, obj: Customer):
-        return obj.tep_codes.count()
+        return obj.tep_total
     tep_count.short_description = "TEP Codes"
+    tep_count.admin_order_field = "tep_total"
 
     def save_model(self, request, obj, form, change):
         super().save_model(request, obj, form, change)
@@ -196,10 +206,15 @@ class TEPCodeAdmin(admin.ModelAdmin):
     inlines = [MaterialInline]
 
     autocomplete_fields = ("customer",)
+    list_select_related = ("customer",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(materials_total=Count("materials"))
 
     def materials_count(self, obj: TEPCode):
-        return obj.materials.count()
+        return obj.materials_total
     materials_count.short_description = "Materials"
+    materials_count.admin_order_field = "materials_total"
 
     def save_model(self, request, obj, form, change):
         super().save_model(request, obj, form, change)
@@ -243,6 +258,7 @@ class MaterialAdmin(admin.ModelAdmin):
         "tep_code__customer__customer_name",
     )
     list_filter = ("unit", "tep_code__customer")
+    list_select_related = ("tep_code__customer",)
     autocomplete_fields = ("tep_code",)
 
     def part_code(self, obj: Material):
@@ -259,6 +275,24 @@ class MaterialListAdmin(admin.ModelAdmin):
     search_fields = ("mat_partcode", "mat_partname", "mat_maker")
     list_filter = ("mat_maker",)
 
+    def get_search_results(self, request, queryset, search_term):
+        # Trigram index instead of three icontains scans; also finds near-misses.
+        if not search_term.strip():
+            return queryset, False
+        hits = search_masters(search_term, limit=ADMIN_FUZZY_LIMIT + 1)
+        if len(hits) > ADMIN_FUZZY_LIMIT:
+            hits = hits[:ADMIN_FUZZY_LIMIT]
+            messages.info(
+                request,
+                f"Showing the best {ADMIN_FUZZY_LIMIT} matches for \"{search_term}\"; refine the search to see others.",
+            )
+        return queryset.filter(id__in=[h.id for h in hits]), False
+
+    def save_model(self, request, obj, form, change):
+        old_code = form.initial.get("mat_partcode") if change else None
+        super().save_model(request, obj, form, change)
+        propagate_masters({old_code or obj.mat_partcode: obj.id})
+
 
 def _date_to_month_name(val):
     """Convert date string (Jan-2026, JAN, 1, January) to full month name."""
@@ -329,4 +363,35 @@ class ForecastAdmin(admin.ModelAdmin):
     def total_amount_display(self, obj):
         return obj.total_amount
     total_amount_display.short_description = "Total amount"
-    
+
+
+@admin.register(ChangeEvent)
+class ChangeEventAdmin(admin.ModelAdmin):
+    list_display = ("id", "entity", "action", "object_key", "created_at")
+    list_filter = ("entity", "action")
+    search_fields = ("object_key",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ("id", "created_at", "duration_ms", "endpoint", "call_site", "short_sql")
+    list_filter = ("endpoint",)
+    search_fields = ("sql", "call_site", "plan")
+    fields = ("created_at", "duration_ms", "endpoint", "call_site", "sql", "params", "plan")
+    readonly_fields = fields
+
+    def short_sql(self, obj: SlowQuery):
+        return obj.sql if len(obj.sql) <= 120 else obj.sql[:117] + "..."
+    short_sql.short_description = "SQL"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -1,23 +1,34 @@
 from ninja import NinjaAPI, File
 from ninja.files import UploadedFile
-from django.http import JsonResponse
-from django.db import IntegrityError, transaction
+from django.core.cache import cache
+from django.http import Http404, JsonResponse
+from django.db import IntegrityError, connection, transaction
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
-from django.db.models import Prefetch
-import csv, io, re
-from .models import Customer, TEPCode, Material, CustomerCSV, MaterialList, Forecast
+from django.db.models import Count, Prefetch, Sum
+import re
+from collections import defaultdict
+from .models import Customer, TEPCode, Material, MaterialList, Forecast, ChangeEvent
+from .changes import serialize_event, record_instances
+from .propagation import propagate_masters
+from .readmodel import get_snapshot
+from .scenarios import MAX_RULES, MAX_SCENARIOS, ScenarioError, compile_rule, get_cube
+from .importing import (
+    allocate_material_name_in_memory, import_bom, month_index_from_string, previous_import, record_import, upload_rows,
+)
+from .storage import hash_file
+from .trigram import search_masters
 #new, naglagay nung MaterialList sa itaas na import
-from .schemas import (CustomerIn, CustomerOut, CustomerFullOut, TEPCodeIn, TEPCodeOut, MaterialIn, MaterialOut, MaterialListIn, ForecastIn, ForecastBatchIn, ForecastBatchPartIn)
+from .schemas import (CustomerIn, CustomerOut, CustomerFullOut, TEPCodeIn, TEPCodeOut, MaterialIn, MaterialOut, MaterialListIn, ForecastIn, ForecastBatchIn, ForecastBatchPartIn, BatchIn, ScenarioBatchIn)
 
 
+# Columns of the documented MaterialOut shape, for .values() fast paths.
+MATERIAL_OUT_FIELDS = ("mat_partcode", "mat_partname", "mat_maker", "unit", "dim_qty", "loss_percent", "total")
+
 api = NinjaAPI(title="Sales API")
 
 def jresponse(data, status=200):
     return JsonResponse(data, status=status, safe=False)
 
-import re
-
 def _normalize_space(s):
     return re.sub(r"\s+", " ", (s or "").strip())
 
@@ -149,56 +160,20 @@ def customers_tree(request, q: str = ""):
       ]
     }
     """
-    qs = (
-        Customer.objects
-        .prefetch_related("tep_codes__materials")
-        .order_by("customer_name")
-    )
-
-    if q:
-        qs = qs.filter(
-            Q(customer_name__icontains=q)
-            | Q(tep_codes__tep_code__icontains=q)
-            | Q(tep_codes__part_code__icontains=q)
-            | Q(tep_codes__materials__mat_partcode__icontains=q)
-            | Q(tep_codes__materials__mat_partname__icontains=q)
-            | Q(tep_codes__materials__mat_maker__icontains=q)
-        ).distinct()
-
+    snap = get_snapshot()
     out = []
 
-    for cust in qs:
-        parts = cust.parts or []
+    for cust in snap.search(q):
         customer_parts = []
 
-        for p in parts:
-            if not isinstance(p, dict):
-                continue
-
-            partcode = (p.get("Partcode") or "").strip()
-            partname = (p.get("Partname") or "").strip()
-            if not partcode:
-                continue
-
+        for partcode, partname in cust.parts:
             tep_list = []
-            tep_objs = [t for t in cust.tep_codes.all() if t.part_code == partcode]
+            tep_objs = [t for t in snap.teps_of(cust.id) if t.part_code == partcode]
 
             for tep in tep_objs:
-                mats = []
-                for m in tep.materials.all():
-                    mats.append({
-                        "mat_partcode": m.mat_partcode,
-                        "mat_partname": m.mat_partname,
-                        "mat_maker": m.mat_maker,
-                        "unit": m.unit,
-                        "dim_qty": m.dim_qty,
-                        "loss_percent": m.loss_percent,
-                        "total": m.total,
-                    })
-
                 tep_list.append({
                     "TEP Code": tep.tep_code,
-                    "Materials": mats
+                    "Materials": [m.as_dict() for m in snap.materials_of(tep.id)]
                 })
 
             customer_parts.append({
@@ -215,6 +190,90 @@ def customers_tree(request, q: str = ""):
     return jresponse(out, status=200)
 
 
+TREE_MAX_KEYS = 500
+
+
+def _split_param(raw):
+    return [s.strip() for s in (raw or "").split(",") if s.strip()]
+
+
+@api.get("/tree", tags=["CUSTOMER"])
+def tree(request, customer_ids: str = "", tep_codes: str = "", fields: str = ""):
+    """
+    Subtrees in the /customers shape, for exactly the listed keys:
+      customer_ids=1,2        those customers with all their parts and TEPs
+      tep_codes=T-100,T-200   just those TEPs, under their customer and part
+      fields=mat_partcode,total   material keys to return (default: all)
+    Both lists may be combined. Served from the read model, so the query
+    count does not depend on how much is asked for.
+    """
+    try:
+        wanted_customers = {int(x) for x in _split_param(customer_ids)}
+    except ValueError:
+        return jresponse({"error": "customer_ids must be comma-separated integers"}, status=400)
+    wanted_teps = set(_split_param(tep_codes))
+    if not wanted_customers and not wanted_teps:
+        return jresponse({"error": "customer_ids or tep_codes is required"}, status=400)
+    if len(wanted_customers) + len(wanted_teps) > TREE_MAX_KEYS:
+        return jresponse({"error": f"at most {TREE_MAX_KEYS} customer_ids and tep_codes per request"}, status=400)
+
+    mat_fields = _split_param(fields) or list(MATERIAL_OUT_FIELDS)
+    unknown = [f for f in mat_fields if f not in MATERIAL_OUT_FIELDS]
+    if unknown:
+        return jresponse(
+            {"error": f"unknown fields: {', '.join(unknown)}", "allowed": list(MATERIAL_OUT_FIELDS)},
+            status=400,
+        )
+
+    snap = get_snapshot()
+
+    # customer id -> its TEPs to show; whole customers take precedence.
+    selected = {cid: snap.teps_of(cid) for cid in wanted_customers if cid in snap.customers}
+    partial = defaultdict(list)
+    for code in wanted_teps:
+        for t in snap.teps_by_code(code):
+            if t.customer_id not in selected:
+                partial[t.customer_id].append(t)
+    for cid, teps in partial.items():
+        selected[cid] = sorted(teps, key=lambda t: t.id)
+
+    out = []
+    for cid in sorted(selected, key=lambda cid: (snap.customers[cid].customer_name, cid)):
+        cust = snap.customers[cid]
+        teps_by_part = defaultdict(list)
+        for t in selected[cid]:
+            teps_by_part[t.part_code].append(t)
+
+        if cid in partial:
+            part_names = dict(cust.parts)
+            parts = [(code, part_names.get(code, "")) for code in teps_by_part]
+        else:
+            parts = cust.parts
+
+        out.append({
+            "customer_name": cust.customer_name,
+            "Customer Part": [
+                {
+                    "Partcode": partcode,
+                    "Partname": partname,
+                    "TEP Codes": [
+                        {
+                            "TEP Code": t.tep_code,
+                            "Materials": [
+                                {f: getattr(m, f) for f in mat_fields}
+                                for m in snap.materials_of(t.id)
+                            ],
+                        }
+                        for t in teps_by_part.get(partcode, [])
+                    ],
+                }
+                for partcode, partname in parts
+            ],
+        })
+
+    return jresponse(out)
+
+
 @api.post("/customers", response=CustomerOut, tags=["CUSTOMER"])
 def create_customer(request, payload: CustomerIn):
     parts = payload.parts or []
@@ -246,11 +305,31 @@ def delete_customer(request, customer_id: int):
 
 @api.get("/customers/{customer_id}/tep-codes", response=list[TEPCodeOut], tags=["TEP"])
 def list_tep_codes(request, customer_id: int, part_code: str = ""):
-    customer = get_object_or_404(Customer, id=customer_id)
-    qs = customer.tep_codes.all().order_by("tep_code")
+    """
+    Serialized straight from .values(): one query for the TEPs and one for all
+    of their materials, emitted in the TEPCodeOut / MaterialOut shape.
+    """
+    if not Customer.objects.filter(id=customer_id).exists():
+        raise Http404("No Customer matches the given query.")
+
+    teps = TEPCode.objects.filter(customer_id=customer_id)
+    mats = Material.objects.filter(tep_code__customer_id=customer_id)
     if part_code:
-        qs = qs.filter(part_code=part_code)
-    return qs
+        teps = teps.filter(part_code=part_code)
+        mats = mats.filter(tep_code__part_code=part_code)
+
+    mats_by_tep = defaultdict(list)
+    for row in mats.order_by("id").values("tep_code_id", *MATERIAL_OUT_FIELDS):
+        mats_by_tep[row.pop("tep_code_id")].append(row)
+
+    return jresponse([
+        {
+            "part_code": t["part_code"],
+            "tep_code": t["tep_code"],
+            "materials": mats_by_tep.get(t["id"], []),
+        }
+        for t in teps.order_by("tep_code").values("id", "part_code", "tep_code")
+    ])
 
 
 @api.post("/parts/{part_code}/tep-codes", response=TEPCodeOut, tags=["TEP"])
@@ -263,21 +342,13 @@ def create_tep_code_by_part_code(request, part_code: str, payload: TEPCodeIn):
     if not tep_code:
         return jresponse({"error": "tep_code is required"}, status=400)
 
-    customer = None
-    for c in Customer.objects.all():
-        parts = c.parts or []
-        if any(
-            isinstance(p, dict) and str(p.get("Partcode", "")).strip() == part_code
-            for p in parts
-        ):
-            customer = c
-            break
+    customer = get_snapshot().part_owner(part_code)
 
     if not customer:
         return jresponse({"error": f"part_code '{part_code}' not found in any customer.parts"}, status=404)
 
     tep, created = TEPCode.objects.get_or_create(
-        customer=customer,
+        customer_id=customer.id,
         part_code=part_code,
         tep_code=tep_code,
     )
@@ -313,9 +384,14 @@ def list_materials_by_tep_code(request, tep_code: str):
     if not tep_code:
         return jresponse({"error": "tep_code is required"}, status=400)
 
-    tep = get_object_or_404(TEPCode, tep_code=tep_code)
+    tep = get_object_or_404(TEPCode.objects.only("id"), tep_code=tep_code)
 
-    return tep.materials.all().order_by("mat_partname")
+    return jresponse(list(
+        Material.objects
+        .filter(tep_code_id=tep.id)
+        .order_by("mat_partname")
+        .values(*MATERIAL_OUT_FIELDS)
+    ))
 
 
 
@@ -351,7 +427,7 @@ def create_material_by_tep_code(
     if not mat_partcode:
         return jresponse({"error": "mat_partcode is required"}, status=400)
 
-    master = MaterialList.objects.filter(mat_partcode=mat_partcode).first()
+    master = get_snapshot().master(mat_partcode)
     if not master:
         return jresponse(
             {"error": f"mat_partcode '{mat_partcode}' not found in master list."},
@@ -461,166 +537,295 @@ def delete_material_by_tep_and_partcode(request, tep_code: str, mat_partcode: st
         status=200
     )
 
-@api.post("/upload-csv", tags=["CSV"])
-def upload_csv(request, file: UploadedFile = File(...)):
-    if not file:
-        return jresponse({"error": "No file uploaded."}, status=400)
-
-    try:
-        content = file.read().decode("utf-8", errors="ignore")
-        csv_file = io.StringIO(content)
-        reader = csv.DictReader(csv_file)
-
-        reader.fieldnames = [h.strip().lstrip("\ufeff") for h in (reader.fieldnames or [])]
-
-        inserted = 0
-        updated = 0
-        master_inserted = 0
-        master_updated = 0
-
-        ALLOWED_UNITS = {"pc", "pcs", "m", "g", "kg"}
+def _material_out(m):
+    return {
+        "mat_partcode": m.mat_partcode,
+        "mat_partname": m.mat_partname,
+        "mat_maker": m.mat_maker,
+        "unit": m.unit,
+        "dim_qty": m.dim_qty,
+        "loss_percent": m.loss_percent,
+        "total": m.total,
+    }
 
-        def fnum(x, default=0.0):
-            try:
-                if x is None:
-                    return float(default)
-                s = str(x).strip()
-                if s == "":
-                    return float(default)
-                return float(s)
-            except Exception:
-                return float(default)
-
-        def sget(row, *keys, default=""):
-            for k in keys:
-                v = row.get(k)
-                if v is not None and str(v).strip() != "":
-                    return str(v).strip()
-            return default
 
-        with transaction.atomic():
-            try:
-                CustomerCSV.objects.create(csv_file=file)
-            except Exception:
-                pass
-
-            for row in reader:
-                mat_partcode = sget(row, "mat_partcode", "material_part_code")
-                mat_partname = sget(row, "mat_partname", "material_name")
-                mat_maker = sget(row, "mat_maker", "maker")
-                unit = sget(row, "unit", default="pc").lower()
+@api.post("/batch", tags=["MATERIAL"])
+def batch_mutate(request, payload: BatchIn):
+    """
+    Apply many TEP / material mutations in one round trip and one transaction.
+
+    Every op needs tep_code; part_code and customer_name narrow the TEP lookup
+    the same way the single endpoints do.
+      - create_tep       part_code
+      - delete_tep
+      - create_material  mat_partcode, dim_qty, loss_percent (default 10)
+      - update_material  mat_partcode, dim_qty and/or loss_percent
+      - delete_material  mat_partcode
+
+    All referenced TEPs, master rows and their materials are read up front,
+    ops are applied in order against that snapshot, and nothing is written
+    unless every op succeeds. Results are returned per op.
+    """
+    ops = [
+        {
+            "op": (o.op or "").strip(),
+            "tep_code": (o.tep_code or "").strip(),
+            "part_code": (o.part_code or "").strip(),
+            "customer_name": (o.customer_name or "").strip(),
+            "mat_partcode": (o.mat_partcode or "").strip(),
+            "dim_qty": o.dim_qty,
+            "loss_percent": o.loss_percent,
+        }
+        for o in (payload.ops or [])
+    ]
+    if not ops:
+        return jresponse({"error": "ops list cannot be empty"}, status=400)
 
-                if unit not in ALLOWED_UNITS:
-                    unit = "pc"
+    with transaction.atomic():
+        # ── resolve everything the batch touches in a fixed number of queries ──
+        teps_by_code = defaultdict(list)
+        tep_qs = (
+            TEPCode.objects
+            .select_related("customer")
+            .filter(tep_code__in={o["tep_code"] for o in ops if o["tep_code"]})
+            .order_by("id")
+        )
+        for t in tep_qs:
+            t.batch_materials = []
+            teps_by_code[t.tep_code].append(t)
+
+        teps_by_id = {t.id: t for lst in teps_by_code.values() for t in lst}
+        for m in Material.objects.filter(tep_code_id__in=teps_by_id.keys()).order_by("id"):
+            teps_by_id[m.tep_code_id].batch_materials.append(m)
+
+        masters = {
+            m.mat_partcode: m
+            for m in MaterialList.objects.filter(
+                mat_partcode__in={o["mat_partcode"] for o in ops if o["op"] == "create_material"}
+            )
+        }
 
-                if not mat_partcode:
+        part_owner = {}
+        if any(o["op"] == "create_tep" for o in ops):
+            for c in Customer.objects.order_by("id"):
+                for p in (c.parts or []):
+                    if isinstance(p, dict):
+                        pc = str(p.get("Partcode", "")).strip()
+                        if pc and pc not in part_owner:
+                            part_owner[pc] = c
+
+        def matching_teps(o):
+            for t in teps_by_code.get(o["tep_code"], []):
+                if o["part_code"] and t.part_code != o["part_code"]:
                     continue
-
-                master, created_master = MaterialList.objects.get_or_create(
-                    mat_partcode=mat_partcode,
-                    defaults={
-                        "mat_partname": mat_partname or mat_partcode,
-                        "mat_maker": mat_maker or "Unknown",
-                        "unit": unit,
-                    }
-                )
-
-                if created_master:
-                    master_inserted += 1
-                else:
-                    changed = False
-                    if mat_partname and master.mat_partname != mat_partname:
-                        master.mat_partname = mat_partname
-                        changed = True
-                    if mat_maker and master.mat_maker != mat_maker:
-                        master.mat_maker = mat_maker
-                        changed = True
-                    if unit and master.unit != unit:
-                        master.unit = unit
-                        changed = True
-                    if changed:
-                        master.save()
-                        master_updated += 1
-
-                customer_name = sget(row, "customer_name")
-                partcode = sget(row, "Partcode", "part_code")
-                partname = sget(row, "Partname", "part_name")
-                tep_code = sget(row, "tep_code")
-
-                dim_qty = fnum(row.get("dim_qty"), 0.0)
-                loss_percent = fnum(row.get("loss_percent"), 10.0)
-
-                total_csv = row.get("total")
-                if total_csv is None or str(total_csv).strip() == "":
-                    total = round(float(dim_qty) * (1 + (float(loss_percent) / 100.0)), 4)
-                else:
-                    total = round(fnum(total_csv, 0.0), 4)
-
-                if not (customer_name and partcode and partname and tep_code):
+                if o["customer_name"] and t.customer.customer_name != o["customer_name"]:
                     continue
-
-                customer, _ = Customer.objects.get_or_create(customer_name=customer_name)
-
-                parts = customer.parts or []
-                exists = any(
-                    isinstance(p, dict) and str(p.get("Partcode", "")).strip() == partcode
-                    for p in parts
-                )
-                if not exists:
-                    parts.append({"Partcode": partcode, "Partname": partname})
-                    customer.parts = parts
-                    customer.save()
-
-                tep, _ = TEPCode.objects.get_or_create(
-                    customer=customer,
-                    part_code=partcode,
-                    tep_code=tep_code,
-                )
-
-                with transaction.atomic():
-                    existing_mat = Material.objects.filter(
-                        tep_code=tep,
-                        mat_partcode=master.mat_partcode
-                    ).first()
-
-                    if existing_mat:
-                        if dim_qty != 0:
-                            existing_mat.dim_qty = dim_qty
-                        if loss_percent != 0:
-                            existing_mat.loss_percent = loss_percent
-
-                        if total_csv is None or str(total_csv).strip() == "":
-                            existing_mat.total = round(
-                                float(existing_mat.dim_qty) * (1 + (float(existing_mat.loss_percent) / 100.0)),
-                                4
-                            )
+                yield t
+
+        def find_material(o):
+            for t in matching_teps(o):
+                for m in t.batch_materials:
+                    if m.mat_partcode == o["mat_partcode"]:
+                        return t, m
+            return None, None
+
+        new_teps = []
+        new_mats = []
+        dirty_mats = {}
+        deleted_mat_ids = set()
+        deleted_tep_ids = set()
+
+        def drop_material(tep, m):
+            tep.batch_materials.remove(m)
+            if m.pk:
+                deleted_mat_ids.add(m.pk)
+                dirty_mats.pop(m.pk, None)
+            else:
+                new_mats.remove(m)
+
+        # ── apply ops in order against the in-memory snapshot ─────────────────
+        results = []
+        failed = False
+
+        for i, o in enumerate(ops):
+            op = o["op"]
+            tc = o["tep_code"]
+            res = {"index": i, "op": op, "tep_code": tc}
+            error = None
+
+            if not tc:
+                error = "tep_code is required"
+
+            elif op == "create_tep":
+                pc = o["part_code"]
+                owner = part_owner.get(pc) if pc else None
+                if not pc:
+                    error = "part_code is required"
+                elif not owner:
+                    error = f"part_code '{pc}' not found in any customer.parts"
+                else:
+                    existing = next(
+                        (t for t in teps_by_code.get(tc, []) if t.customer_id == owner.id and t.part_code == pc),
+                        None,
+                    )
+                    if not existing:
+                        tep = TEPCode(customer=owner, part_code=pc, tep_code=tc)
+                        tep.batch_materials = []
+                        teps_by_code[tc].append(tep)
+                        new_teps.append(tep)
+                    res["part_code"] = pc
+                    res["created"] = existing is None
+
+            elif op == "delete_tep":
+                matched = list(matching_teps(o))
+                if not matched:
+                    error = f"TEP code '{tc}' not found"
+                for t in matched:
+                    teps_by_code[tc].remove(t)
+                    for m in list(t.batch_materials):
+                        if m.pk:
+                            dirty_mats.pop(m.pk, None)
                         else:
-                            existing_mat.total = total
-
-                        existing_mat.mat_maker = master.mat_maker
-                        existing_mat.unit = master.unit
-                        existing_mat.save()
-
-                        updated += 1
-                        continue
-
-                    final_name = _allocate_material_name(
-                        tep=tep,
-                        base_name=master.mat_partname,
-                        exclude_partcode=master.mat_partcode
+                            new_mats.remove(m)
+                    if t.pk:
+                        deleted_tep_ids.add(t.pk)
+                    else:
+                        new_teps.remove(t)
+                res["deleted"] = len(matched)
+
+            elif op == "create_material":
+                mc = o["mat_partcode"]
+                tep = next(matching_teps(o), None)
+                if not tep:
+                    error = "TEP code not found. Provide part_code and/or customer_name."
+                elif not mc:
+                    error = "mat_partcode is required"
+                elif o["dim_qty"] is None:
+                    error = "dim_qty is required"
+                elif mc not in masters:
+                    error = f"mat_partcode '{mc}' not found in master list."
+                elif any(m.mat_partcode == mc for m in tep.batch_materials):
+                    error = "Material already exists for this TEP + mat_partcode."
+                else:
+                    master = masters[mc]
+                    loss = o["loss_percent"] if o["loss_percent"] is not None else 10.0
+                    dim_qty = float(o["dim_qty"])
+                    final_name, renamed = allocate_material_name_in_memory(
+                        tep.batch_materials, master.mat_partname, exclude_partcode=mc
                     )
+                    if renamed is not None and renamed.pk:
+                        dirty_mats[renamed.pk] = renamed
 
-                    Material.objects.create(
+                    m = Material(
                         tep_code=tep,
-                        mat_partcode=master.mat_partcode,
+                        mat_partcode=mc,
                         mat_partname=final_name,
                         mat_maker=master.mat_maker,
                         unit=master.unit,
                         dim_qty=dim_qty,
-                        loss_percent=loss_percent,
-                        total=total,
+                        loss_percent=float(loss),
+                        total=round(dim_qty * (1 + (float(loss) / 100.0)), 4),
                     )
-                    inserted += 1
+                    tep.batch_materials.append(m)
+                    new_mats.append(m)
+                    res["material"] = _material_out(m)
+
+            elif op == "update_material":
+                tep, m = find_material(o) if o["mat_partcode"] else (None, None)
+                if not o["mat_partcode"]:
+                    error = "mat_partcode is required"
+                elif not m:
+                    error = f"No material found for tep_code '{tc}' and mat_partcode '{o['mat_partcode']}'"
+                else:
+                    if o["dim_qty"] is not None:
+                        m.dim_qty = float(o["dim_qty"])
+                    if o["loss_percent"] is not None:
+                        m.loss_percent = float(o["loss_percent"])
+                    m.total = round(float(m.dim_qty) * (1 + (float(m.loss_percent) / 100.0)), 4)
+                    if m.pk:
+                        dirty_mats[m.pk] = m
+                    res["material"] = _material_out(m)
+
+            elif op == "delete_material":
+                tep, m = find_material(o) if o["mat_partcode"] else (None, None)
+                if not o["mat_partcode"]:
+                    error = "mat_partcode is required"
+                elif not m:
+                    error = f"No material found for tep_code '{tc}' and mat_partcode '{o['mat_partcode']}'"
+                else:
+                    drop_material(tep, m)
+                    res["mat_partcode"] = o["mat_partcode"]
+
+            else:
+                error = f"Unknown op '{op}'"
+
+            if error:
+                failed = True
+                res["status"] = "error"
+                res["error"] = error
+            else:
+                res["status"] = "ok"
+            results.append(res)
+
+        if failed:
+            return jresponse({"applied": False, "results": results}, status=400)
+
+        # ── write: a handful of statements regardless of batch size ───────────
+        if deleted_mat_ids:
+            Material.objects.filter(id__in=deleted_mat_ids).delete()
+        if deleted_tep_ids:
+            TEPCode.objects.filter(id__in=deleted_tep_ids).delete()
+        if new_teps:
+            TEPCode.objects.bulk_create(new_teps)
+            record_instances(new_teps, "create")
+        if new_mats:
+            Material.objects.bulk_create(new_mats)
+            record_instances(new_mats, "create")
+        if dirty_mats:
+            Material.objects.bulk_update(
+                list(dirty_mats.values()),
+                ["mat_partname", "dim_qty", "loss_percent", "total"],
+            )
+            record_instances(dirty_mats.values(), "update")
+
+    return jresponse({"applied": True, "results": results}, status=200)
+
+@api.post("/upload-csv", tags=["CSV"])
+def upload_csv(request, file: UploadedFile = File(...)):
+    if not file:
+        return jresponse({"error": "No file uploaded."}, status=400)
+
+    try:
+        digest = hash_file(file)
+        previous = previous_import("bom")
+        if previous and previous.content_hash == digest:
+            return jresponse(
+                {
+                    "message": "CSV is identical to the previous upload; nothing imported",
+                    "duplicate": True,
+                    "master_inserted": 0,
+                    "master_updated": 0,
+                    "inserted_materials": 0,
+                    "updated_materials": 0,
+                    "skipped_rows": len(previous.row_hashes or []),
+                },
+                status=200
+            )
+
+        header, rows = upload_rows(file, decode=lambda raw: raw.decode("utf-8", errors="ignore"))
+
+        with transaction.atomic():
+            result = import_bom(
+                header, rows,
+                skip_hashes=set(previous.row_hashes or []) if previous else (),
+            )
+            record_import("bom", file, digest, result["row_hashes"])
+
+        master_inserted = result["master_inserted"]
+        master_updated = result["master_updated"]
+        inserted = result["inserted"]
+        updated = result["updated"]
+        skipped = result["skipped"]
 
         return jresponse(
             {
@@ -629,6 +834,7 @@ def upload_csv(request, file: UploadedFile = File(...)):
                 "master_updated": master_updated,
                 "inserted_materials": inserted,
                 "updated_materials": updated,
+                "skipped_rows": skipped,
             },
             status=200
         )
@@ -696,44 +902,36 @@ def output_format(request):
     return jresponse(result)
 
 
-def _month_index_from_string(val: str) -> int | None:
-    """
-    Convert various month representations (Jan-2026, JAN, January, 1, 01/2026) to 1-12.
-    Returns None if it cannot be parsed.
+@api.get("/changes", tags=["GET DETAILS"])
+def list_changes(request, since: int = 0, limit: int = 500):
     """
-    if not val:
-        return None
-    s = str(val).strip()
-    if not s:
-        return None
-
-    months = [
-        "january", "february", "march", "april", "may", "june",
-        "july", "august", "september", "october", "november", "december",
-    ]
-    abbr = ["jan", "feb", "mar", "apr", "may", "jun",
-            "jul", "aug", "sep", "oct", "nov", "dec"]
-
-    lower = s.lower()
-    for i, a in enumerate(abbr):
-        if lower.startswith(a) or lower == a:
-            return i + 1
+    Incremental change feed for downstream sync.
 
-    # Try full month names
-    for i, name in enumerate(months):
-        if lower.startswith(name) or lower == name:
-            return i + 1
+    Pass the `next_cursor` of the previous call as `since` to receive only
+    the create/update/delete events written after it, oldest first.
+    A consumer starting from scratch loads /output-format once and then
+    follows this feed from `latest_cursor`.
+    """
+    limit = max(1, min(int(limit or 500), 5000))
+    since = max(0, int(since or 0))
+
+    rows = list(
+        ChangeEvent.objects
+        .filter(id__gt=since)
+        .order_by("id")
+        .values("id", "entity", "action", "object_key", "data", "created_at")[: limit + 1]
+    )
 
-    # Try numeric forms (1, 01, 1-2026, 01/2026, etc.)
-    try:
-        head = s.split("-")[0] if "-" in s else s.split("/")[0] if "/" in s else s
-        n = int(head)
-        if 1 <= n <= 12:
-            return n
-    except (ValueError, IndexError):
-        return None
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    latest = ChangeEvent.objects.order_by("-id").values_list("id", flat=True).first() or 0
 
-    return None
+    return jresponse({
+        "changes": [serialize_event(r) for r in rows],
+        "next_cursor": rows[-1]["id"] if rows else since,
+        "latest_cursor": latest,
+        "has_more": has_more,
+    })
 
 
 def _forecast_to_output(forecast):
@@ -849,37 +1047,26 @@ def create_forecast(request, payload: ForecastBatchIn):
     return jresponse(response, status=201)
 
 
-@api.get("/forecasts/by-customer/{customer_name}", tags=["FORECAST"])
-def get_forecasts_by_customer(
-    request,
-    customer_name: str,
-    from_month: str = "",
-    to_month: str = "",
-):
-    """Get all forecasts for a customer by customer name.
-
-    Optionally provide from_month and to_month (e.g. January, Feb, 1, 3)
-    to compute total amount for the selected month range per forecast.
+def _month_range(from_month, to_month):
     """
-    customer_name = (customer_name or "").strip()
-    if not customer_name:
-        return jresponse({"error": "customer_name is required"}, status=400)
-
-    customer = Customer.objects.filter(customer_name__iexact=customer_name).first()
-    if not customer:
-        return jresponse({"error": f"Customer '{customer_name}' not found"}, status=404)
-
-    from_idx = _month_index_from_string(from_month) if from_month else None
-    to_idx = _month_index_from_string(to_month) if to_month else None
+    (from_idx, to_idx) for the optional from_month/to_month filter, both None
+    when it is not given; raises ValueError for a bad or half-given range.
+    """
+    from_idx = month_index_from_string(from_month) if from_month else None
+    to_idx = month_index_from_string(to_month) if to_month else None
     if (from_month or to_month) and (from_idx is None or to_idx is None):
-        return jresponse(
-            {"error": "from_month/to_month must be valid month names or numbers (e.g. January, Feb, 1, 12)."},
-            status=400,
-        )
+        raise ValueError("from_month/to_month must be valid month names or numbers (e.g. January, Feb, 1, 12).")
     if from_idx is not None and to_idx is not None and from_idx > to_idx:
         from_idx, to_idx = to_idx, from_idx
+    return from_idx, to_idx
+
 
-    forecasts = Forecast.objects.filter(customer=customer).select_related("customer").order_by("part_number")
+def _forecast_rows(forecasts, from_idx=None, to_idx=None):
+    """
+    Output rows for GET /forecasts/by-customer/{customer_name}, with each
+    forecast's amount over the month range when one is given. Pure Python,
+    shared with the async twin in api_async.py.
+    """
     result = []
     for f in forecasts:
         out = _forecast_to_output(f)
@@ -888,7 +1075,7 @@ def get_forecasts_by_customer(
             total_range = 0.0
             for m in (f.monthly_forecasts or []):
                 if isinstance(m, dict):
-                    mi = _month_index_from_string(m.get("date", ""))
+                    mi = month_index_from_string(m.get("date", ""))
                     if mi is None:
                         continue
                     if from_idx <= mi <= to_idx:
@@ -897,7 +1084,79 @@ def get_forecasts_by_customer(
                         total_range += price * qty
             out["total_amount_selected_months"] = total_range
         result.append(out)
-    return jresponse(result)
+    return result
+
+
+@api.get("/forecasts/by-customer/{customer_name}", tags=["FORECAST"])
+def get_forecasts_by_customer(
+    request,
+    customer_name: str,
+    from_month: str = "",
+    to_month: str = "",
+):
+    """Get all forecasts for a customer by customer name.
+
+    Optionally provide from_month and to_month (e.g. January, Feb, 1, 3)
+    to compute total amount for the selected month range per forecast.
+    """
+    customer_name = (customer_name or "").strip()
+    if not customer_name:
+        return jresponse({"error": "customer_name is required"}, status=400)
+
+    customer = Customer.objects.filter(name_key=Customer.normalize_name(customer_name)).first()
+    if not customer:
+        return jresponse({"error": f"Customer '{customer_name}' not found"}, status=404)
+
+    try:
+        from_idx, to_idx = _month_range(from_month, to_month)
+    except ValueError as e:
+        return jresponse({"error": str(e)}, status=400)
+
+    forecasts = Forecast.objects.filter(customer=customer).order_by("part_number")
+    return jresponse(_forecast_rows(forecasts, from_idx, to_idx), status=200)
+
+
+@api.post("/forecasts/scenarios", tags=["FORECAST"])
+def forecast_scenarios(request, payload: ScenarioBatchIn):
+    """
+    Evaluate what-if scenarios against all forecasts without writing anything.
+    Expected JSON:
+    {
+        "scenarios": [
+            {
+                "name": "Q2 push",
+                "rules": [
+                    {"customer_name": "EPPI", "from_month": "Apr", "to_month": "Jun", "percent": 15},
+                    {"part_number": "45677890", "percent": -30}
+                ]
+            }
+        ]
+    }
+    A rule narrows by any of customer_name, part_number, from_month/to_month
+    and year, and changes quantity by percent or by an absolute amount
+    (never below 0). Rules apply in order. Each scenario returns adjusted
+    monthly quantity and amount next to the baseline.
+    """
+    scenarios = payload.scenarios or []
+    if not scenarios:
+        return jresponse({"error": "scenarios list cannot be empty"}, status=400)
+    if len(scenarios) > MAX_SCENARIOS:
+        return jresponse({"error": f"at most {MAX_SCENARIOS} scenarios per request"}, status=400)
+
+    compiled = []
+    for n, scenario in enumerate(scenarios, start=1):
+        if len(scenario.rules or []) > MAX_RULES:
+            return jresponse({"error": f"scenario #{n}: at most {MAX_RULES} rules"}, status=400)
+        try:
+            compiled.append((scenario.name, [compile_rule(r) for r in scenario.rules or []]))
+        except ScenarioError as e:
+            return jresponse({"error": f"scenario #{n}: {e}"}, status=400)
+
+    cube = get_cube()
+    return jresponse({
+        "version": cube.version,
+        "scenarios": [{"name": name, **cube.evaluate(rules)} for name, rules in compiled],
+    })
 
 
 @api.put("/forecasts/{customer_name}/{part_number}", tags=["FORECAST"])
@@ -913,7 +1172,7 @@ def update_forecast(request, customer_name: str, part_number: str, payload: Fore
         return jresponse({"error": "part_number is required"}, status=400)
 
     # Find original customer
-    original_customer = Customer.objects.filter(customer_name__iexact=original_customer_name).first()
+    original_customer = Customer.objects.filter(name_key=Customer.normalize_name(original_customer_name)).first()
     if not original_customer:
         return jresponse({"error": f"Customer '{original_customer_name}' not found"}, status=404)
 
@@ -1026,7 +1285,7 @@ def delete_forecast(request, customer_name: str, part_number: str):
         return jresponse({"error": "part_number is required"}, status=400)
 
     # Find customer
-    customer = Customer.objects.filter(customer_name__iexact=customer_name).first()
+    customer = Customer.objects.filter(name_key=Customer.normalize_name(customer_name)).first()
     if not customer:
         return jresponse({"error": f"Customer '{customer_name}' not found"}, status=404)
 
@@ -1071,6 +1330,7 @@ def create_master_material(request, payload: MaterialListIn):
     )
     if not created:
         return jresponse({"error": "mat_partcode already exists in master list"}, status=409)
+    propagate_masters({obj.mat_partcode: obj.id})
     return jresponse(
         {
             "message": "Master material created",
@@ -1081,3 +1341,155 @@ def create_master_material(request, payload: MaterialListIn):
         },
         status=201
     )
+
+
+@api.get("/master/materials/search", tags=["MASTER LIST"])
+def search_master_materials(request, q: str = "", limit: int = 20):
+    """
+    Fuzzy master-list search ranked by trigram similarity, so typos and
+    spacing differences ("AVSS 0.3f BLACK" vs "AVSS0.3F BLK") still match.
+    """
+    q = (q or "").strip()
+    if not q:
+        return jresponse({"error": "q is required"}, status=400)
+    limit = max(1, min(limit, 200))
+    return jresponse([h.as_dict() for h in search_masters(q, limit=limit)])
+
+
+WHERE_USED_CACHE_SECONDS = 3600
+# Past this many new change-log events a cached entry is rebuilt instead of checked.
+WHERE_USED_RECHECK_EVENTS = 2000
+
+
+@api.get("/master/materials/{code}/where-used", tags=["MASTER LIST"])
+def material_where_used(request, code: str):
+    """
+    Every customer / part / TEP code using a material, with line counts and
+    summed quantities, from one grouped query (the (mat_partcode, tep_code)
+    index finds the rows; the sums read them). Results are cached per code.
+    When the change log has moved, only the events since the cached version
+    are checked, and the entry is rebuilt only if one of them concerns this
+    code: its master row, a material carrying it, or a TEP, part or customer
+    the cached answer lists.
+    """
+    code = (code or "").strip()
+    if not code:
+        return jresponse({"error": "code is required"}, status=400)
+
+    snap = get_snapshot()
+    key = f"where-used:{code}"
+    cached = entry = cache.get(key)
+    if entry is None or entry["version"] > snap.version or _where_used_touched(entry, code, snap.version):
+        entry = _where_used_entry(snap, code)
+    elif entry["version"] != snap.version:
+        entry = {**entry, "version": snap.version}
+    if entry is not cached and not connection.in_atomic_block:
+        cache.set(key, entry, WHERE_USED_CACHE_SECONDS)
+
+    out = entry["out"]
+    if out is False:
+        return jresponse({"error": f"mat_partcode '{code}' is neither in the master list nor used"}, status=404)
+    return jresponse(out)
+
+
+def _where_used_entry(snap, code):
+    out, tep_ids, customer_ids = _where_used(snap, code)
+    master = snap.master(code)
+    return {
+        "version": snap.version,
+        "out": out,
+        "teps": tep_ids,
+        "customers": customer_ids,
+        "master_id": master.id if master else None,
+    }
+
+
+def _where_used_touched(entry, code, version):
+    """Whether an event in (entry version, version] can change the cached where-used entry."""
+    if entry["version"] == version:
+        return False
+    events = list(
+        ChangeEvent.objects
+        .filter(id__gt=entry["version"], id__lte=version)
+        .order_by("id")
+        .values_list("entity", "object_key", "data")[:WHERE_USED_RECHECK_EVENTS + 1]
+    )
+    if len(events) > WHERE_USED_RECHECK_EVENTS:
+        return True
+
+    teps, customers = set(entry["teps"]), set(entry["customers"])
+    for entity, key, data in events:
+        data = data if isinstance(data, dict) else {}
+        if entity == "material":
+            if data.get("mat_partcode") == code or data.get("tep_id") in teps:
+                return True
+        elif entity == "master_material":
+            if data.get("mat_partcode") == code or data.get("id") == entry["master_id"]:
+                return True
+        elif entity in ("tep", "customer", "part"):
+            try:
+                pk = int(key.split(":", 1)[0])
+            except (TypeError, ValueError):
+                return True    # e.g. the "*" event a snapshot restore logs
+            if pk in (teps if entity == "tep" else customers):
+                return True
+    return False
+
+
+def _where_used(snap, code):
+    rows = (
+        Material.objects
+        .filter(mat_partcode=code)
+        .values(
+            "tep_code_id",
+            "tep_code__tep_code",
+            "tep_code__part_code",
+            "tep_code__customer_id",
+            "tep_code__customer__customer_name",
+        )
+        .annotate(lines=Count("id"), dim_qty=Sum("dim_qty"), total=Sum("total"))
+        .order_by("tep_code__customer__customer_name", "tep_code__part_code", "tep_code__tep_code")
+    )
+
+    usages = []
+    tep_ids = []
+    customer_ids = set()
+    for r in rows:
+        tep_ids.append(r["tep_code_id"])
+        customer_ids.add(r["tep_code__customer_id"])
+        customer = snap.customers.get(r["tep_code__customer_id"])
+        part_names = dict(customer.parts) if customer else {}
+        usages.append({
+            "customer_name": r["tep_code__customer__customer_name"],
+            "part_code": r["tep_code__part_code"],
+            "part_name": part_names.get(r["tep_code__part_code"], ""),
+            "tep_code": r["tep_code__tep_code"],
+            "lines": r["lines"],
+            "dim_qty": r["dim_qty"],
+            "total": r["total"],
+        })
+
+    master = snap.master(code)
+    if master is None and not usages:
+        return False, tep_ids, sorted(customer_ids)
+
+    return {
+        "mat_partcode": code,
+        "master": {
+            "mat_partname": master.mat_partname,
+            "mat_maker": master.mat_maker,
+            "unit": master.unit,
+        } if master else None,
+        "customers": len({u["customer_name"] for u in usages}),
+        "parts": len({(u["customer_name"], u["part_code"]) for u in usages}),
+        "tep_codes": len(usages),
+        "lines": sum(u["lines"] for u in usages),
+        "total_quantity": sum(u["total"] or 0 for u in usages),
+        "usages": usages,
+    }, tep_ids, sorted(customer_ids)
+
+
+# Async variants of the read-heavy endpoints (served under /api/async/).
+from .api_async import router as async_router  # noqa: E402
+
+api.add_router("/async", async_router)
@@ -0,0 +1,173 @@
+"""
+Async variants of the read-heavy endpoints, mounted under /api/async/.
+
+They return the same JSON as their synchronous counterparts in api.py but
+use Django's async ORM (async iteration, afirst, aexists), so under ASGI
+(my_project/asgi.py) a single worker can keep serving other requests while
+a slow client is still being fed. Where a view does more than shape rows,
+the rows are fetched here and handed to the pure-Python helper the sync
+view uses, so the logic is not copied.
+"""
+from collections import defaultdict
+
+from django.http import Http404
+from django.shortcuts import aget_object_or_404
+from ninja import Router
+
+from .api import MATERIAL_OUT_FIELDS, _forecast_rows, _month_range, jresponse
+from .models import Customer, Forecast, Material, TEPCode
+from .schemas import MaterialOut, TEPCodeOut
+
+
+router = Router()
+
+
+async def _tree(customer_qs, material_order=("id",)):
+    """Customer -> parts -> TEP codes -> materials, in three .values() queries."""
+    customers = [row async for row in customer_qs.values_list("id", "customer_name", "parts")]
+    id_subquery = customer_qs.values("id")
+
+    teps_by_customer = defaultdict(list)
+    async for t in TEPCode.objects.filter(customer_id__in=id_subquery).order_by("id").values("id", "customer_id", "part_code", "tep_code"):
+        teps_by_customer[t["customer_id"]].append(t)
+
+    mats_by_tep = defaultdict(list)
+    mats = Material.objects.filter(tep_code__customer_id__in=id_subquery).order_by(*material_order)
+    async for m in mats.values("tep_code_id", *MATERIAL_OUT_FIELDS):
+        mats_by_tep[m.pop("tep_code_id")].append(m)
+
+    out = []
+    for cid, name, parts in customers:
+        customer_parts = []
+        for p in (parts or []):
+            if not isinstance(p, dict):
+                continue
+            partcode = str(p.get("Partcode") or "").strip()
+            partname = str(p.get("Partname") or "").strip()
+            if not partcode:
+                continue
+
+            customer_parts.append({
+                "Partcode": partcode,
+                "Partname": partname,
+                "TEP Codes": [
+                    {"TEP Code": t["tep_code"], "Materials": mats_by_tep.get(t["id"], [])}
+                    for t in teps_by_customer.get(cid, [])
+                    if t["part_code"] == partcode
+                ],
+            })
+
+        out.append({"customer_name": name, "Customer Part": customer_parts})
+    return out
+
+
+async def _matching_customer_ids(q):
+    """
+    Ids of customers matching `q` on the same six fields and with the same
+    str.lower() containment as ReadSnapshot.search() behind the sync view.
+    SQL icontains would differ: SQLite's LIKE folds ASCII letters only.
+    """
+    needle = q.lower()
+    ids = set()
+    async for cid, name in Customer.objects.values_list("id", "customer_name"):
+        if needle in name.lower():
+            ids.add(cid)
+    async for cid, tep_code, part_code in TEPCode.objects.values_list("customer_id", "tep_code", "part_code"):
+        if cid not in ids and (needle in tep_code.lower() or needle in part_code.lower()):
+            ids.add(cid)
+    mats = Material.objects.values_list("tep_code__customer_id", "mat_partcode", "mat_partname", "mat_maker")
+    async for cid, *fields in mats:
+        if cid not in ids and any(needle in f.lower() for f in fields):
+            ids.add(cid)
+    return ids
+
+
+@router.get("/customers", tags=["ASYNC"])
+async def customers_tree_async(request, q: str = ""):
+    """Async twin of GET /api/customers."""
+    qs = Customer.objects.order_by("customer_name", "id")
+    if q:
+        qs = qs.filter(id__in=await _matching_customer_ids(q))
+
+    return jresponse(await _tree(qs), status=200)
+
+
+@router.get("/output-format", tags=["ASYNC"])
+async def output_format_async(request):
+    """Async twin of GET /api/output-format."""
+    out = await _tree(
+        Customer.objects.order_by("customer_name"),
+        material_order=("mat_partname", "id"),
+    )
+    return jresponse(out)
+
+
+@router.get("/customers/{customer_id}/tep-codes", response=list[TEPCodeOut], tags=["ASYNC"])
+async def list_tep_codes_async(request, customer_id: int, part_code: str = ""):
+    """Async twin of GET /api/customers/{customer_id}/tep-codes."""
+    if not await Customer.objects.filter(id=customer_id).aexists():
+        raise Http404("No Customer matches the given query.")
+
+    teps = TEPCode.objects.filter(customer_id=customer_id)
+    mats = Material.objects.filter(tep_code__customer_id=customer_id)
+    if part_code:
+        teps = teps.filter(part_code=part_code)
+        mats = mats.filter(tep_code__part_code=part_code)
+
+    mats_by_tep = defaultdict(list)
+    async for row in mats.order_by("id").values("tep_code_id", *MATERIAL_OUT_FIELDS):
+        mats_by_tep[row.pop("tep_code_id")].append(row)
+
+    return jresponse([
+        {
+            "part_code": t["part_code"],
+            "tep_code": t["tep_code"],
+            "materials": mats_by_tep.get(t["id"], []),
+        }
+        async for t in teps.order_by("tep_code").values("id", "part_code", "tep_code")
+    ])
+
+
+@router.get("/tep-codes/{tep_code}/materials", response=list[MaterialOut], tags=["ASYNC"])
+async def list_materials_by_tep_code_async(request, tep_code: str):
+    """Async twin of GET /api/tep-codes/{tep_code}/materials."""
+    tep_code = (tep_code or "").strip()
+
+    if not tep_code:
+        return jresponse({"error": "tep_code is required"}, status=400)
+
+    tep = await aget_object_or_404(TEPCode.objects.only("id"), tep_code=tep_code)
+
+    return jresponse([
+        row async for row in (
+            Material.objects
+            .filter(tep_code_id=tep.id)
+            .order_by("mat_partname")
+            .values(*MATERIAL_OUT_FIELDS)
+        )
+    ])
+
+
+@router.get("/forecasts/by-customer/{customer_name}", tags=["ASYNC"])
+async def get_forecasts_by_customer_async(
+    request,
+    customer_name: str,
+    from_month: str = "",
+    to_month: str = "",
+):
+    """Async twin of GET /api/forecasts/by-customer/{customer_name}."""
+    customer_name = (customer_name or "").strip()
+    if not customer_name:
+        return jresponse({"error": "customer_name is required"}, status=400)
+
+    customer = await Customer.objects.filter(name_key=Customer.normalize_name(customer_name)).afirst()
+    if not customer:
+        return jresponse({"error": f"Customer '{customer_name}' not found"}, status=404)
+
+    try:
+        from_idx, to_idx = _month_range(from_month, to_month)
+    except ValueError as e:
+        return jresponse({"error": str(e)}, status=400)
+
+    forecasts = [f async for f in Forecast.objects.filter(customer=customer).order_by("part_number")]
+    return jresponse(_forecast_rows(forecasts, from_idx, to_idx), status=200)
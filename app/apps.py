@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class AppConfig(AppConfig):
     name = "app"
+
+    def ready(self):
+        from . import changes  # noqa: F401  (connects the change-log signals)
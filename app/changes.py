@@ -0,0 +1,186 @@
+"""
+Append-only change log (ChangeEvent) written by every mutation path.
+
+Model saves and deletes are captured through signals, so the API endpoints,
+dashboard actions, Django admin and CSV importers all feed the log without
+extra code. Paths that bypass signals (bulk_create, bulk_update, queryset
+update) must call record_changes() themselves.
+"""
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .models import ChangeEvent, Customer, Forecast, Material, MaterialList, TEPCode
+
+
+def _customer_data(c):
+    return {"id": c.id, "customer_name": c.customer_name}
+
+
+def _tep_data(t):
+    return {
+        "id": t.id,
+        "customer_id": t.customer_id,
+        "part_code": t.part_code,
+        "tep_code": t.tep_code,
+    }
+
+
+def _material_data(m):
+    return {
+        "id": m.id,
+        "tep_id": m.tep_code_id,
+        "mat_partcode": m.mat_partcode,
+        "mat_partname": m.mat_partname,
+        "mat_maker": m.mat_maker,
+        "unit": m.unit,
+        "dim_qty": m.dim_qty,
+        "loss_percent": m.loss_percent,
+        "total": m.total,
+    }
+
+
+def _master_data(m):
+    return {
+        "id": m.id,
+        "mat_partcode": m.mat_partcode,
+        "mat_partname": m.mat_partname,
+        "mat_maker": m.mat_maker,
+        "unit": m.unit,
+    }
+
+
+def _forecast_data(f):
+    return {
+        "id": f.id,
+        "customer_id": f.customer_id,
+        "part_number": f.part_number,
+        "part_name": f.part_name,
+        "monthly_forecasts": f.monthly_forecasts or [],
+    }
+
+
+SNAPSHOTS = {
+    Customer: ("customer", _customer_data),
+    TEPCode: ("tep", _tep_data),
+    Material: ("material", _material_data),
+    MaterialList: ("master_material", _master_data),
+    Forecast: ("forecast", _forecast_data),
+}
+
+
+def _parts_map(parts):
+    """Partcode -> Partname for a Customer.parts list."""
+    out = {}
+    for p in parts or []:
+        if isinstance(p, dict):
+            code = str(p.get("Partcode", "")).strip()
+            if code:
+                out[code] = str(p.get("Partname", "")).strip()
+    return out
+
+
+def part_data(customer_id, part_code, part_name):
+    return {"customer_id": customer_id, "Partcode": part_code, "Partname": part_name}
+
+
+def part_key(customer_id, part_code):
+    return f"{customer_id}:{part_code}"
+
+
+def event_for(instance, action):
+    """Build an unsaved ChangeEvent describing `instance`."""
+    entity, snap = SNAPSHOTS[type(instance)]
+    return ChangeEvent(entity=entity, action=action, object_key=str(instance.pk), data=snap(instance))
+
+
+def part_events(customer, old_map, new_map):
+    """Create/update/delete events for the difference between two parts maps."""
+    events = []
+    for code, name in new_map.items():
+        if code not in old_map:
+            action = "create"
+        elif old_map[code] != name:
+            action = "update"
+        else:
+            continue
+        events.append(ChangeEvent(
+            entity="part",
+            action=action,
+            object_key=part_key(customer.id, code),
+            data=part_data(customer.id, code, name),
+        ))
+    for code, name in old_map.items():
+        if code not in new_map:
+            events.append(ChangeEvent(
+                entity="part",
+                action="delete",
+                object_key=part_key(customer.id, code),
+                data=part_data(customer.id, code, name),
+            ))
+    return events
+
+
+def customer_events(customer, action):
+    """
+    Events for a Customer written without signals (bulk_create/bulk_update):
+    the row itself plus the diff of its parts against the last logged state.
+    """
+    new_map = _parts_map(customer.parts)
+    old_map = {} if action == "create" else getattr(customer, "_changes_parts", {})
+    customer._changes_parts = new_map
+    return [event_for(customer, action)] + part_events(customer, old_map, new_map)
+
+
+def record_changes(events):
+    """Append already-built ChangeEvent objects in one INSERT."""
+    events = list(events)
+    if events:
+        ChangeEvent.objects.bulk_create(events)
+    return events
+
+
+def record_instances(instances, action):
+    """Log `action` for model instances written through bulk_create/bulk_update."""
+    return record_changes(event_for(obj, action) for obj in instances)
+
+
+def serialize_event(e):
+    return {
+        "cursor": e["id"],
+        "entity": e["entity"],
+        "action": e["action"],
+        "key": e["object_key"],
+        "data": e["data"],
+        "at": e["created_at"].isoformat() if e["created_at"] else None,
+    }
+
+
+@receiver(post_init, sender=Customer)
+def _remember_customer_parts(sender, instance, **kwargs):
+    # Skip deferred loads (.only()/.defer()) so we never trigger a query here.
+    if "parts" in instance.__dict__:
+        instance._changes_parts = _parts_map(instance.parts)
+
+
+@receiver(post_save)
+def _log_save(sender, instance, created, raw=False, **kwargs):
+    if raw or sender not in SNAPSHOTS:
+        return
+
+    events = [event_for(instance, "create" if created else "update")]
+
+    if sender is Customer:
+        if created or hasattr(instance, "_changes_parts"):
+            new_map = _parts_map(instance.parts)
+            old_map = {} if created else instance._changes_parts
+            events.extend(part_events(instance, old_map, new_map))
+            instance._changes_parts = new_map
+
+    record_changes(events)
+
+
+@receiver(post_delete)
+def _log_delete(sender, instance, **kwargs):
+    if sender not in SNAPSHOTS:
+        return
+    record_changes([event_for(instance, "delete")])
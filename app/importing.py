@@ -0,0 +1,817 @@
+"""
+Import pipeline shared by the CSV / .xlsx upload endpoints.
+
+Rows are cut into chunks and turned into compact, validated tuples by a
+parse function (whitespace normalisation, unit validation, float coercion).
+Large files are parsed by a process pool so that this CPU-bound cleansing
+uses every core. The calling thread stays the single writer: it receives
+parsed chunks in input order and applies them in batches inside its own
+transaction, so SQLite only ever sees one writer.
+
+Small files skip the pool entirely; forking workers costs more than it saves.
+
+Every stored import (CustomerCSV) keeps the sha256 of the raw file and the
+hashes of its rows. An upload identical to the previous one of the same kind
+is a no-op, and rows that already appeared in it never reach the writer.
+"""
+import csv
+import hashlib
+import io
+import itertools
+import os
+import re
+import shutil
+import tempfile
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+from .changes import customer_events, event_for, record_changes, record_instances
+from .models import Customer, CustomerCSV, Forecast, Material, MaterialList, TEPCode
+from .propagation import propagate_masters
+from .storage import open_binary, open_text
+from .xlsx import is_xlsx, xlsx_rows
+
+
+ALLOWED_UNITS = {"pc", "pcs", "m", "g", "kg"}
+FORECAST_LOOKUP_CHUNK = 500
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# ── row helpers (pure functions, safe to run in worker processes) ──────────
+
+def fnum(x, default=0.0):
+    try:
+        if x is None:
+            return float(default)
+        s = str(x).strip()
+        if s == "":
+            return float(default)
+        return float(s)
+    except Exception:
+        return float(default)
+
+
+def sget(row, *keys, default=""):
+    for k in keys:
+        v = row.get(k)
+        if v is not None and str(v).strip() != "":
+            return str(v).strip()
+    return default
+
+
+def clean_unit(raw):
+    unit = (raw or "pc").lower()
+    return unit if unit in ALLOWED_UNITS else "pc"
+
+
+def decode_upload(raw: bytes):
+    """Decode an uploaded file, trying the encodings Excel commonly produces."""
+    for enc in ("utf-8-sig", "utf-16", "cp1252", "latin-1"):
+        try:
+            return raw.decode(enc)
+        except UnicodeDecodeError:
+            continue
+    return None
+
+
+def csv_rows(content):
+    """
+    (header, row iterator) for CSV text or a text stream; header cells are
+    stripped of spaces and BOM.
+    """
+    reader = csv.reader(io.StringIO(content) if isinstance(content, str) else content)
+    header = next(reader, [])
+    return [h.strip().lstrip("\ufeff") for h in header], reader
+
+
+def _row_hasher(header):
+    seed = hashlib.blake2b("\x1f".join(header).encode("utf-8"), digest_size=8)
+
+    def row_hash(cells):
+        h = seed.copy()
+        h.update("\x1e".join(c.strip() for c in cells).encode("utf-8"))
+        return h.hexdigest()
+
+    return row_hash
+
+
+def group_hash(row_hashes):
+    """One hash for an ordered group of row hashes (used where rows are only meaningful together)."""
+    return hashlib.blake2b("".join(row_hashes).encode("ascii"), digest_size=8).hexdigest()
+
+
+def upload_rows(upload, decode=decode_upload):
+    """
+    (header, row iterator) for an uploaded .xlsx or CSV file, or None when a
+    CSV cannot be decoded. Workbooks are streamed straight from the upload.
+    """
+    upload.seek(0)
+    head = upload.read(4)
+    upload.seek(0)
+    if is_xlsx(head):
+        return xlsx_rows(upload)
+
+    content = decode(upload.read())
+    if content is None:
+        return None
+    return csv_rows(content)
+
+
+def stored_rows(field_file):
+    """
+    (header, row iterator) for a stored upload, streamed from the compressed
+    store. Workbooks are unpacked to a temporary file first, since zipfile
+    needs to seek. Close the returned stream once the rows are consumed.
+    """
+    stream = open_binary(field_file)
+    head = stream.read(4)
+    stream.seek(0)
+    if not is_xlsx(head):
+        stream.close()
+        text = open_text(field_file)
+        return text, csv_rows(text)
+
+    spooled = tempfile.TemporaryFile()
+    with stream:
+        shutil.copyfileobj(stream, spooled)
+    spooled.seek(0)
+    return spooled, xlsx_rows(spooled)
+
+
+def _dict_rows(header, rows):
+    """(row_hash, row dict) pairs; the hash covers the header and the stripped cells."""
+    row_hash = _row_hasher(header)
+    for r in rows:
+        yield row_hash(r), dict(zip(header, r))
+
+
+# ── parse functions: (header, list of raw rows) -> list of tuples ───────────
+
+def parse_master_rows(header, rows):
+    """-> (mat_partcode, mat_partname, mat_maker, unit, row_hash); rows without a code are dropped."""
+    out = []
+    for row_hash, row in _dict_rows(header, rows):
+        mat_partcode = sget(row, "mat_partcode", "material_part_code")
+        if not mat_partcode:
+            continue
+        out.append((
+            mat_partcode,
+            sget(row, "mat_partname", "material_name"),
+            sget(row, "mat_maker", "maker"),
+            clean_unit(sget(row, "unit", default="pc")),
+            row_hash,
+        ))
+    return out
+
+
+def parse_bom_rows(header, rows):
+    """
+    -> (mat_partcode, mat_partname, mat_maker, unit,
+        customer_name, partcode, partname, tep_code,
+        dim_qty, loss_percent, total_or_None, row_hash)
+
+    total is None when the CSV leaves it blank, so the writer can recompute
+    it from the stored dim_qty / loss_percent of an existing material.
+    """
+    out = []
+    for row_hash, row in _dict_rows(header, rows):
+        mat_partcode = sget(row, "mat_partcode", "material_part_code")
+        if not mat_partcode:
+            continue
+
+        dim_qty = fnum(row.get("dim_qty"), 0.0)
+        loss_percent = fnum(row.get("loss_percent"), 10.0)
+        total_csv = row.get("total")
+        if total_csv is None or str(total_csv).strip() == "":
+            total = None
+        else:
+            total = round(fnum(total_csv, 0.0), 4)
+
+        out.append((
+            mat_partcode,
+            sget(row, "mat_partname", "material_name"),
+            sget(row, "mat_maker", "maker"),
+            clean_unit(sget(row, "unit", default="pc")),
+            sget(row, "customer_name"),
+            sget(row, "Partcode", "part_code"),
+            sget(row, "Partname", "part_name"),
+            sget(row, "tep_code"),
+            dim_qty,
+            loss_percent,
+            total,
+            row_hash,
+        ))
+    return out
+
+
+# "Jan-2026 qty", "January 2026_price", "01/2026 - unit_price", ...
+_WIDE_FORECAST_COLUMN = re.compile(
+    r"^\s*(?P<date>[A-Za-z]{3,9}[-/ ]\d{4}|\d{1,2}[-/]\d{4})\s*[-_ ]?\s*"
+    r"(?P<field>qty|quantity|price|unit_price|unitprice|unit price)\s*$",
+    re.IGNORECASE,
+)
+
+
+def month_index_from_string(val: str) -> int | None:
+    """
+    Convert various month representations (Jan-2026, JAN, January, 1, 01/2026) to 1-12.
+    Returns None if it cannot be parsed.
+    """
+    if not val:
+        return None
+    s = str(val).strip()
+    if not s:
+        return None
+
+    months = [
+        "january", "february", "march", "april", "may", "june",
+        "july", "august", "september", "october", "november", "december",
+    ]
+    abbr = ["jan", "feb", "mar", "apr", "may", "jun",
+            "jul", "aug", "sep", "oct", "nov", "dec"]
+
+    lower = s.lower()
+    for i, a in enumerate(abbr):
+        if lower.startswith(a) or lower == a:
+            return i + 1
+
+    # Try full month names
+    for i, name in enumerate(months):
+        if lower.startswith(name) or lower == name:
+            return i + 1
+
+    # Try numeric forms (1, 01, 1-2026, 01/2026, etc.)
+    try:
+        head = s.split("-")[0] if "-" in s else s.split("/")[0] if "/" in s else s
+        n = int(head)
+        if 1 <= n <= 12:
+            return n
+    except (ValueError, IndexError):
+        return None
+
+    return None
+
+
+def wide_forecast_columns(header):
+    """
+    Months laid out as columns, in header order: [(date, qty_column, price_column)].
+    Empty for the long (one row per month) format.
+    """
+    months = {}
+    for col in header:
+        m = _WIDE_FORECAST_COLUMN.match(col or "")
+        if not m:
+            continue
+        # "March 2026" -> "March-2026", the Month-Year form the long format produces
+        slot = months.setdefault(m.group("date").strip().replace(" ", "-"), {})
+        field = "quantity" if m.group("field").lower() in ("qty", "quantity") else "unit_price"
+        slot[field] = col
+    return [(date, cols.get("quantity"), cols.get("unit_price")) for date, cols in months.items()]
+
+
+def parse_forecast_rows(header, rows, default_year=None):
+    """
+    -> (customer_name, part_number, part_name, monthly_entries, row_hash)
+
+    Long format: one row per (customer, part, month) with date (or month +
+    year), unit_price and quantity columns; each row yields one entry.
+    Wide format: one row per part with "<Mon-YYYY> qty" / "<Mon-YYYY> price"
+    columns; each row yields all of its months at once. A month without its
+    own price column falls back to the row's unit_price.
+    """
+    wide = wide_forecast_columns(header)
+    out = []
+    for row_hash, row in _dict_rows(header, rows):
+        customer_name = sget(row, "customer_name", "Customer", "CUSTOMER")
+        part_number = sget(row, "part_number", "Partcode", "PART_NUMBER", "part_code")
+        part_name = sget(row, "part_name", "Partname", "PART_NAME")
+        row_price = row.get("unit_price") or row.get("UnitPrice") or row.get("price")
+
+        if wide:
+            entries = []
+            for date_str, qty_col, price_col in wide:
+                qty = row.get(qty_col) if qty_col else None
+                price = row.get(price_col) if price_col else None
+                if not str(qty or "").strip() and not str(price or "").strip():
+                    continue
+                entries.append({
+                    "date": date_str,
+                    "unit_price": fnum(price if price_col else row_price, 0.0),
+                    "quantity": fnum(qty, 0.0),
+                })
+            if customer_name and part_number and part_name and entries:
+                out.append((customer_name, part_number, part_name, entries, row_hash))
+            continue
+
+        date_str = sget(row, "date", "month_year", "MonthYear")
+        month = sget(row, "month", "Month")
+        year = sget(row, "year", "Year")
+
+        if not date_str:
+            if month and year:
+                date_str = f"{month}-{year}"
+            elif month and default_year:
+                # Fallback: assume current year if only month is given
+                date_str = f"{month}-{default_year}"
+
+        if not (customer_name and part_number and part_name and date_str):
+            continue
+
+        out.append((
+            customer_name,
+            part_number,
+            part_name,
+            [{
+                "date": date_str,
+                "unit_price": fnum(row_price, 0.0),
+                "quantity": fnum(row.get("quantity") or row.get("qty") or row.get("Quantity"), 0.0),
+            }],
+            row_hash,
+        ))
+    return out
+
+
+# ── pipeline ────────────────────────────────────────────────────────────────
+
+def _chunked(rows, size):
+    it = iter(rows)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_parsed(header, rows, parse_fn, **parse_kwargs):
+    """
+    Yield parse_fn(header, chunk, **parse_kwargs) for each chunk of rows, in
+    input order. Only a bounded window of chunks is in flight at a time, so
+    memory stays flat even for streamed sources.
+    """
+    chunk_rows = _setting("TELS_IMPORT_CHUNK_ROWS", 2000)
+    min_rows = _setting("TELS_IMPORT_PARALLEL_MIN_ROWS", 10000)
+    workers = _setting("TELS_IMPORT_WORKERS", None) or os.cpu_count() or 1
+
+    chunks = _chunked(rows, chunk_rows)
+    head = list(itertools.islice(chunks, max(1, min_rows // chunk_rows)))
+
+    if workers < 2 or len(head) * chunk_rows < min_rows:
+        for chunk in itertools.chain(head, chunks):
+            yield parse_fn(header, chunk, **parse_kwargs)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in itertools.chain(head, chunks):
+            pending.append(pool.submit(parse_fn, header, chunk, **parse_kwargs))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def run_import(header, rows, parse_fn, apply_batch, skip_hashes=(), **parse_kwargs):
+    """
+    Parse with iter_parsed() and hand every parsed batch to apply_batch() on
+    this thread. Rows whose hash is in `skip_hashes` (the previous import of
+    the same kind) are dropped before they reach the writer.
+    Returns (row_hashes, skipped) for the whole file.
+    """
+    row_hashes = []
+    skipped = 0
+    for batch in iter_parsed(header, rows, parse_fn, **parse_kwargs):
+        row_hashes.extend(t[-1] for t in batch)
+        if skip_hashes:
+            fresh = [t for t in batch if t[-1] not in skip_hashes]
+            skipped += len(batch) - len(fresh)
+            batch = fresh
+        if batch:
+            apply_batch(batch)
+    return row_hashes, skipped
+
+
+def previous_import(kind):
+    """Latest stored import of `kind`, or None."""
+    return (
+        CustomerCSV.objects
+        .filter(kind=kind)
+        .order_by("-id")
+        .only("id", "content_hash", "row_hashes")
+        .first()
+    )
+
+
+def record_import(kind, upload, digest, row_hashes):
+    """Store the uploaded file together with the hashes the next import compares against."""
+    return CustomerCSV.objects.create(
+        kind=kind,
+        csv_file=upload,
+        content_hash=digest,
+        row_hashes=row_hashes,
+    )
+
+
+# ── shared writer step ──────────────────────────────────────────────────────
+
+def upsert_masters(batch):
+    """
+    Create/update MaterialList rows for a batch of
+    (mat_partcode, mat_partname, mat_maker, unit, ...) tuples.
+
+    Existing rows are read with one IN query and written back with one
+    bulk_create and one bulk_update. Rows repeated inside the batch are
+    applied in order, as the old row-at-a-time loop did, and `states` holds
+    the (mat_partname, mat_maker, unit) each row saw right after its own
+    update. Returns (states, inserted, updated).
+    """
+    codes = {t[0] for t in batch}
+    masters = {m.mat_partcode: m for m in MaterialList.objects.filter(mat_partcode__in=codes)}
+
+    created = {}
+    dirty = {}
+    states = []
+    inserted = 0
+    updated = 0
+
+    for mat_partcode, mat_partname, mat_maker, unit, *_ in batch:
+        master = masters.get(mat_partcode)
+        if master is None:
+            master = MaterialList(
+                mat_partcode=mat_partcode,
+                mat_partname=mat_partname or mat_partcode,
+                mat_maker=mat_maker or "Unknown",
+                unit=unit,
+            )
+            masters[mat_partcode] = created[mat_partcode] = master
+            inserted += 1
+            states.append((master.mat_partname, master.mat_maker, master.unit))
+            continue
+
+        changed = False
+        if mat_partname and master.mat_partname != mat_partname:
+            master.mat_partname = mat_partname
+            changed = True
+        if mat_maker and master.mat_maker != mat_maker:
+            master.mat_maker = mat_maker
+            changed = True
+        if unit and master.unit != unit:
+            master.unit = unit
+            changed = True
+        if changed:
+            updated += 1
+            if master.pk:
+                dirty[mat_partcode] = master
+        states.append((master.mat_partname, master.mat_maker, master.unit))
+
+    if created:
+        MaterialList.objects.bulk_create(created.values())
+        record_instances(created.values(), "create")
+    if dirty:
+        MaterialList.objects.bulk_update(dirty.values(), ["mat_partname", "mat_maker", "unit"])
+        record_instances(dirty.values(), "update")
+    propagate_masters({code: m.pk for code, m in (*created.items(), *dirty.items())})
+
+    return states, inserted, updated
+
+
+# ── writers: one per upload kind, run on the calling thread ────────────────
+
+def allocate_material_name_in_memory(mats, base_name: str, exclude_partcode: str = ""):
+    """
+    Same numbering rules as api._allocate_material_name, but evaluated against an
+    in-memory list of one TEP's materials (oldest first) instead of the DB.
+    Returns (final_name, material_renamed_to_base_1 or None).
+    """
+    base = (base_name or "").strip() or "UNKNOWN"
+    exclude_partcode = (exclude_partcode or "").strip()
+    pattern = re.compile(rf"^{re.escape(base)}(?: (\d+))?$", flags=re.IGNORECASE)
+
+    matches = [
+        m for m in mats
+        if pattern.match(m.mat_partname or "")
+        and not (exclude_partcode and m.mat_partcode == exclude_partcode)
+    ]
+    if not matches:
+        return base, None
+
+    numbers = []
+    for m in matches:
+        hit = pattern.match((m.mat_partname or "").strip())
+        if hit and hit.group(1):
+            numbers.append(int(hit.group(1)))
+
+    if numbers:
+        return f"{base} {max(numbers) + 1}", None
+
+    first = matches[0]
+    first.mat_partname = f"{base} 1"
+    return f"{base} 2", first
+
+
+def import_masters(header, rows, skip_hashes=()):
+    """Material master upload. Returns counts plus the file's row hashes."""
+    counts = {"master_inserted": 0, "master_updated": 0}
+
+    def apply_batch(batch):
+        _, inserted, updated = upsert_masters(batch)
+        counts["master_inserted"] += inserted
+        counts["master_updated"] += updated
+
+    row_hashes, skipped = run_import(header, rows, parse_master_rows, apply_batch, skip_hashes=skip_hashes)
+    return {**counts, "skipped": skipped, "row_hashes": row_hashes}
+
+
+def import_bom(header, rows, skip_hashes=()):
+    """
+    BOM upload: master upsert, then customer part, TEP code and material per
+    row, written set-based per batch. Customers, TEP codes and the materials
+    of each TEP are read with one IN query per batch (only for ones this file
+    has not met yet) and cached for the whole file; material names are
+    numbered in memory. Rows are applied in order with the same rules as the
+    old row-at-a-time loop, so a later row for the same TEP + mat_partcode
+    updates the material an earlier one created.
+    """
+    counts = {"master_inserted": 0, "master_updated": 0, "inserted": 0, "updated": 0}
+    customers = {}      # customer_name -> Customer
+    part_codes = {}     # customer_name -> Partcodes in customer.parts
+    teps = {}           # (customer_name, partcode, tep_code) -> TEPCode
+    materials = {}      # TEP pk -> its Materials, oldest first
+    by_code = {}        # TEP pk -> {mat_partcode: oldest Material}
+
+    def apply_batch(batch):
+        states, master_inserted, master_updated = upsert_masters(batch)
+        counts["master_inserted"] += master_inserted
+        counts["master_updated"] += master_updated
+
+        work = [
+            (row, state) for row, state in zip(batch, states)
+            if row[4] and row[5] and row[6] and row[7]
+        ]
+        if not work:
+            return
+
+        # Customers, and the parts each row needs in customer.parts.
+        names = {row[4] for row, _ in work} - customers.keys()
+        for c in Customer.objects.filter(customer_name__in=names).order_by("id"):
+            customers.setdefault(c.customer_name, c)
+        new_customers = {}
+        parts_changed = {}
+        for row, _ in work:
+            customer_name, partcode, partname = row[4], row[5], row[6]
+            customer = customers.get(customer_name)
+            if customer is None:
+                customer = Customer(
+                    customer_name=customer_name,
+                    name_key=Customer.normalize_name(customer_name),
+                    parts=[],
+                )
+                customers[customer_name] = new_customers[customer_name] = customer
+            codes = part_codes.get(customer_name)
+            if codes is None:
+                codes = part_codes[customer_name] = {
+                    str(p.get("Partcode", "")).strip()
+                    for p in (customer.parts or []) if isinstance(p, dict)
+                }
+            if partcode not in codes:
+                codes.add(partcode)
+                if not isinstance(customer.parts, list):
+                    customer.parts = []
+                customer.parts.append({"Partcode": partcode, "Partname": partname})
+                if customer.pk:
+                    parts_changed[customer.pk] = customer
+
+        Customer.objects.bulk_create(new_customers.values())
+        Customer.objects.bulk_update(parts_changed.values(), ["parts"])
+        events = []
+        for c in new_customers.values():
+            events.extend(customer_events(c, "create"))
+        for c in parts_changed.values():
+            events.extend(customer_events(c, "update"))
+
+        # TEP codes.
+        wanted = {(row[4], row[5], row[7]) for row, _ in work} - teps.keys()
+        if wanted:
+            names_by_id = {customers[name].pk: name for name, _, _ in wanted}
+            existing = TEPCode.objects.filter(
+                customer_id__in=list(names_by_id),
+                tep_code__in={tep_code for _, _, tep_code in wanted},
+            )
+            for t in existing:
+                key = (names_by_id[t.customer_id], t.part_code, t.tep_code)
+                if key in wanted:
+                    teps[key] = t
+            new_teps = [
+                TEPCode(customer=customers[name], part_code=partcode, tep_code=tep_code)
+                for name, partcode, tep_code in sorted(wanted - teps.keys())
+            ]
+            TEPCode.objects.bulk_create(new_teps)
+            for t in new_teps:
+                teps[(t.customer.customer_name, t.part_code, t.tep_code)] = t
+            events.extend(event_for(t, "create") for t in new_teps)
+
+            unseen = [t.pk for t in teps.values() if t.pk not in materials]
+            for t_pk in unseen:
+                materials[t_pk], by_code[t_pk] = [], {}
+            if len(unseen) > len(new_teps):
+                for m in Material.objects.filter(tep_code_id__in=unseen).order_by("id"):
+                    materials[m.tep_code_id].append(m)
+                    by_code[m.tep_code_id].setdefault(m.mat_partcode, m)
+
+        # Materials, row by row in memory.
+        to_create = []
+        to_update = {}
+        for row, state in work:
+            (mat_partcode, _, _, _, customer_name, partcode, _, tep_code,
+             dim_qty, loss_percent, total, _) = row
+            master_partname, master_maker, master_unit = state
+            tep = teps[(customer_name, partcode, tep_code)]
+            mats = materials[tep.pk]
+
+            existing_mat = by_code[tep.pk].get(mat_partcode)
+            if existing_mat:
+                if dim_qty != 0:
+                    existing_mat.dim_qty = dim_qty
+                if loss_percent != 0:
+                    existing_mat.loss_percent = loss_percent
+
+                if total is None:
+                    existing_mat.total = round(
+                        float(existing_mat.dim_qty) * (1 + (float(existing_mat.loss_percent) / 100.0)),
+                        4
+                    )
+                else:
+                    existing_mat.total = total
+
+                existing_mat.mat_maker = master_maker
+                existing_mat.unit = master_unit
+                if existing_mat.pk:
+                    to_update[existing_mat.pk] = existing_mat
+                counts["updated"] += 1
+                continue
+
+            final_name, renamed = allocate_material_name_in_memory(
+                mats, master_partname, exclude_partcode=mat_partcode
+            )
+            if renamed is not None and renamed.pk:
+                to_update[renamed.pk] = renamed
+
+            if total is None:
+                total = round(float(dim_qty) * (1 + (float(loss_percent) / 100.0)), 4)
+
+            m = Material(
+                tep_code=tep,
+                mat_partcode=mat_partcode,
+                mat_partname=final_name,
+                mat_maker=master_maker,
+                unit=master_unit,
+                dim_qty=dim_qty,
+                loss_percent=loss_percent,
+                total=total,
+            )
+            mats.append(m)
+            by_code[tep.pk][mat_partcode] = m
+            to_create.append(m)
+            counts["inserted"] += 1
+
+        Material.objects.bulk_create(to_create)
+        Material.objects.bulk_update(
+            to_update.values(),
+            ["mat_partname", "mat_maker", "unit", "dim_qty", "loss_percent", "total"],
+        )
+        events.extend(event_for(m, "create") for m in to_create)
+        events.extend(event_for(m, "update") for m in to_update.values())
+        record_changes(events)
+
+    row_hashes, skipped = run_import(header, rows, parse_bom_rows, apply_batch, skip_hashes=skip_hashes)
+    return {**counts, "skipped": skipped, "row_hashes": row_hashes}
+
+
+def import_forecasts(header, rows, seen_groups=(), default_year=None):
+    """
+    Forecast upload, long or wide format. Rows are grouped by (customer,
+    part_number, part_name) and each group replaces that forecast's monthly
+    list, so unchanged-ness is decided per group: groups whose hash is in
+    `seen_groups` are skipped.
+    """
+    # Group monthly entries by (customer, part_number, part_name)
+    grouped = defaultdict(list)
+    grouped_hashes = defaultdict(list)
+
+    def collect(batch):
+        for customer_name, part_number, part_name, entries, row_hash in batch:
+            key = (customer_name, part_number, part_name)
+            grouped[key].extend(entries)
+            grouped_hashes[key].append(row_hash)
+
+    run_import(header, rows, parse_forecast_rows, collect, default_year=default_year)
+
+    group_hashes = {key: group_hash(hashes) for key, hashes in grouped_hashes.items()}
+    unchanged = [key for key, h in group_hashes.items() if h in seen_groups]
+    for key in unchanged:
+        del grouped[key]
+
+    created_count, updated_count = upsert_forecasts(grouped)
+
+    return {
+        "created": created_count,
+        "updated": updated_count,
+        "unchanged": len(unchanged),
+        "groups": len(group_hashes),
+        "row_hashes": list(group_hashes.values()),
+    }
+
+
+def upsert_forecasts(grouped):
+    """
+    Write {(customer_name, part_number, part_name): monthly} groups set-based:
+    one IN query for customers, one per FORECAST_LOOKUP_CHUNK of the file's
+    part numbers for their forecasts, bulk_create / bulk_update for both,
+    and at most one parts write per customer.
+    Groups are applied in order with the same rules as the old per-group
+    loop, so a later group for the same (customer, part_number) updates the
+    forecast an earlier one created. Returns (created, updated).
+    """
+    names = {cust_name for cust_name, _, _ in grouped}
+    customers = {c.customer_name: c for c in Customer.objects.filter(customer_name__in=names)}
+
+    # Oldest forecast per (customer, part_number), as .first() picked before.
+    # Only the file's part numbers are read, not each customer's whole history.
+    names_by_id = {c.id: name for name, c in customers.items()}
+    part_numbers = sorted({part_no for _, part_no, _ in grouped})
+    forecasts = {}
+    for i in range(0, len(part_numbers), FORECAST_LOOKUP_CHUNK):
+        existing = (
+            Forecast.objects
+            .filter(customer_id__in=list(names_by_id), part_number__in=part_numbers[i:i + FORECAST_LOOKUP_CHUNK])
+            .order_by("id")
+        )
+        for f in existing:
+            forecasts.setdefault((names_by_id[f.customer_id], f.part_number), f)
+
+    new_customers = {}
+    part_codes = {}
+    parts_changed = {}
+    to_create = []
+    to_update = {}
+    created_count = 0
+    updated_count = 0
+
+    for (cust_name, part_no, part_nm), monthly in grouped.items():
+        customer = customers.get(cust_name)
+        if customer is None:
+            customer = Customer(customer_name=cust_name, name_key=Customer.normalize_name(cust_name), parts=[])
+            customers[cust_name] = new_customers[cust_name] = customer
+
+        forecast = forecasts.get((cust_name, part_no))
+        if forecast:
+            forecast.part_name = part_nm or forecast.part_name
+            forecast.monthly_forecasts = monthly
+            if forecast.pk:
+                to_update[forecast.pk] = forecast
+            updated_count += 1
+        else:
+            forecast = Forecast(
+                customer=customer,
+                part_number=part_no,
+                part_name=part_nm,
+                monthly_forecasts=monthly,
+            )
+            forecasts[(cust_name, part_no)] = forecast
+            to_create.append(forecast)
+            created_count += 1
+
+        # Ensure the part exists in customer.parts
+        codes = part_codes.get(cust_name)
+        if codes is None:
+            codes = part_codes[cust_name] = {
+                str(p.get("Partcode", "")).strip()
+                for p in (customer.parts or []) if isinstance(p, dict)
+            }
+        if part_no not in codes:
+            codes.add(part_no)
+            if not isinstance(customer.parts, list):
+                customer.parts = []
+            customer.parts.append({"Partcode": part_no, "Partname": part_nm})
+            if customer.pk:
+                parts_changed[customer.pk] = customer
+
+    Customer.objects.bulk_create(new_customers.values())
+    Customer.objects.bulk_update(parts_changed.values(), ["parts"])
+    Forecast.objects.bulk_create(to_create)
+    Forecast.objects.bulk_update(to_update.values(), ["part_name", "monthly_forecasts"])
+
+    events = []
+    for c in new_customers.values():
+        events.extend(customer_events(c, "create"))
+    for c in parts_changed.values():
+        events.extend(customer_events(c, "update"))
+    events.extend(event_for(f, "create") for f in to_create)
+    events.extend(event_for(f, "update") for f in to_update.values())
+    record_changes(events)
+
+    return created_count, updated_count
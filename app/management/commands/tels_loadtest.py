@@ -0,0 +1,365 @@
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import math
+import random
+import time
+
+import httpx
+from django.core.management.base import BaseCommand, CommandError
+
+from app.importing import import_bom
+from app.models import Customer, CustomerCSV, Material, MaterialList
+
+
+DEFAULT_MIX = "tree=60,search=40"
+WRITE_MIX = "tree=45,search=25,edit=15,forecast=10,upload=5"
+SCENARIOS = ("tree", "search", "edit", "forecast", "upload")
+WRITE_SCENARIOS = ("edit", "forecast", "upload")
+SAMPLE_SIZE = 500
+# Shape of the BOM seeded under the write customer: TEPs x materials per TEP.
+SEED_TEPS = 10
+SEED_MATERIALS = 10
+BOM_HEADER = [
+    "customer_name", "Partcode", "Partname", "tep_code",
+    "mat_partcode", "mat_partname", "mat_maker", "unit", "dim_qty", "loss_percent",
+]
+
+
+def _parse_mix(raw):
+    weights = {}
+    for item in raw.split(","):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise CommandError(f"Unknown scenario '{name}' (choose from {', '.join(SCENARIOS)}).")
+        try:
+            weights[name] = float(weight)
+        except ValueError:
+            raise CommandError(f"Weight for '{name}' must be a number.")
+    weights = {k: v for k, v in weights.items() if v > 0}
+    if not weights:
+        raise CommandError("The mix needs at least one scenario with a positive weight.")
+    return weights
+
+
+def _percentile(ordered, p):
+    """Nearest-rank percentile of an ascending list."""
+    if not ordered:
+        return None
+    rank = max(math.ceil(p / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def seed_write_customer(name):
+    """
+    Give the write customer a BOM built from existing master materials, with
+    their own names, maker and unit so the master upsert changes nothing.
+    Returns True if the customer was created here (and may be deleted after).
+    """
+    created = not Customer.objects.filter(customer_name=name).exists()
+    if Material.objects.filter(tep_code__customer__customer_name=name).exists():
+        return created
+    masters = list(
+        MaterialList.objects.order_by("?").values_list("mat_partcode", "mat_partname", "mat_maker", "unit")[:SEED_MATERIALS]
+    )
+    rows = [
+        [name, f"LT-P{t % 3}", f"Load test part {t % 3}", f"LT-T{t:03d}", code, partname, maker, unit, "1", "5"]
+        for t in range(SEED_TEPS)
+        for code, partname, maker, unit in masters
+    ]
+    if rows:
+        import_bom(BOM_HEADER, rows)
+    return created
+
+
+class Targets:
+    """
+    Rows the scenarios use, sampled once before the run: reads go to the whole
+    dataset, edits and uploads only to the write customer's BOM.
+    """
+
+    def __init__(self, write_customer):
+        self.write_customer = write_customer
+        self.customer_names = list(
+            Customer.objects.order_by("?").values_list("customer_name", flat=True)[:SAMPLE_SIZE]
+        )
+        self.master_codes = list(
+            MaterialList.objects.order_by("?").values_list("mat_partcode", "mat_partname")[:SAMPLE_SIZE]
+        )
+        self.materials = []
+        partnames = {}
+        rows = (
+            Material.objects
+            .filter(tep_code__customer__customer_name=write_customer)
+            .select_related("tep_code__customer")
+            .order_by("?")[:SAMPLE_SIZE]
+        )
+        for m in rows:
+            tep = m.tep_code
+            customer = tep.customer
+            if customer.id not in partnames:
+                partnames[customer.id] = {
+                    str(p.get("Partcode", "")).strip(): str(p.get("Partname", "")).strip()
+                    for p in (customer.parts or []) if isinstance(p, dict)
+                }
+            self.materials.append({
+                "customer_name": customer.customer_name,
+                "Partcode": tep.part_code,
+                "Partname": partnames[customer.id].get(tep.part_code, tep.part_code),
+                "tep_code": tep.tep_code,
+                "mat_partcode": m.mat_partcode,
+                "mat_partname": m.mat_partname,
+                "mat_maker": m.mat_maker,
+                "unit": m.unit,
+                "dim_qty": m.dim_qty,
+                "loss_percent": m.loss_percent,
+            })
+
+    def missing_for(self, scenario):
+        if scenario == "tree" and not self.customer_names:
+            return "customers"
+        if scenario == "search" and not self.master_codes:
+            return "master materials"
+        if scenario in ("edit", "upload") and not self.materials:
+            return f"materials under {self.write_customer} (the master list is empty)"
+        return None
+
+
+class Planner:
+    """One simulated user: picks a scenario by weight, runs it, repeats."""
+
+    def __init__(self, client, targets, weights, rng, record, uploaded):
+        self.client = client
+        self.targets = targets
+        self.names = list(weights)
+        self.weights = list(weights.values())
+        self.rng = rng
+        self.record = record
+        self.uploaded = uploaded
+
+    async def run(self, deadline, think):
+        while time.monotonic() < deadline:
+            scenario = self.rng.choices(self.names, self.weights)[0]
+            started = time.perf_counter()
+            error = None
+            try:
+                response = await getattr(self, scenario)()
+                if response.status_code >= 400:
+                    error = f"HTTP {response.status_code}"
+            except httpx.HTTPError as e:
+                error = type(e).__name__
+            self.record(scenario, time.perf_counter() - started, error)
+            if think:
+                await asyncio.sleep(self.rng.uniform(0, 2 * think))
+
+    async def tree(self):
+        name = self.rng.choice(self.targets.customer_names)
+        return await self.client.get("/api/customers", params={"q": name[:12]})
+
+    async def search(self):
+        code, name = self.rng.choice(self.targets.master_codes)
+        text = self.rng.choice([code, name]) or code
+        start = self.rng.randrange(max(len(text) - 6, 1))
+        return await self.client.get("/api/master/materials/search", params={"q": text[start:start + 8]})
+
+    async def edit(self):
+        ops = []
+        for m in self.rng.sample(self.targets.materials, min(self.rng.randint(1, 5), len(self.targets.materials))):
+            ops.append({
+                "op": "update_material",
+                "tep_code": m["tep_code"],
+                "part_code": m["Partcode"],
+                "customer_name": m["customer_name"],
+                "mat_partcode": m["mat_partcode"],
+                "dim_qty": round(m["dim_qty"] * self.rng.uniform(0.95, 1.05), 4) or 1.0,
+            })
+        return await self.client.post("/api/batch", json={"ops": ops})
+
+    async def forecast(self):
+        months = ["January", "February", "March", "April", "May", "June"]
+        parts = [
+            {
+                "part_number": f"LT-{self.rng.randrange(100):03d}",
+                "part_name": "Load test part",
+                "monthly_forecasts": [
+                    {"date": month, "unit_price": round(self.rng.uniform(0.1, 20), 2), "quantity": self.rng.randrange(1, 5000)}
+                    for month in self.rng.sample(months, 3)
+                ],
+            }
+            for _ in range(self.rng.randint(1, 3))
+        ]
+        return await self.client.post(
+            "/api/forecasts", json={"customer_name": self.targets.write_customer, "parts": parts}
+        )
+
+    async def upload(self):
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=BOM_HEADER)
+        writer.writeheader()
+        for m in self.rng.sample(self.targets.materials, min(20, len(self.targets.materials))):
+            writer.writerow({**m, "dim_qty": round(m["dim_qty"] * self.rng.uniform(0.95, 1.05), 4)})
+        body = buf.getvalue().encode("utf-8")
+        self.uploaded.add(hashlib.sha256(body).hexdigest())
+        files = {"file": ("loadtest.csv", body, "text/csv")}
+        return await self.client.post("/api/upload-csv", files=files)
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive a running server with concurrent simulated planners (tree reads, searches, "
+        "batch material edits, forecast posts, CSV uploads) and print throughput plus "
+        "p50/p95/p99 latency and error rate per scenario as JSON. The server must use this "
+        "project's database. The default mix is read-only. Edits, forecasts and uploads need "
+        f"--allow-writes (e.g. --allow-writes --mix {WRITE_MIX}); they only touch the --customer "
+        "customer, which is seeded with a BOM from the master list and deleted afterwards "
+        "unless it existed before the run or --keep-data is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of the running server.")
+        parser.add_argument("--planners", type=int, default=20, help="Concurrent simulated users.")
+        parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run after warm-up.")
+        parser.add_argument("--warmup", type=float, default=3.0, help="Seconds of load before measuring starts.")
+        parser.add_argument("--think", type=float, default=0.0,
+                            help="Mean pause between a planner's requests, in seconds (0 = closed loop).")
+        parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Scenario weights (default {DEFAULT_MIX}).")
+        parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds.")
+        parser.add_argument("--allow-writes", action="store_true",
+                            help="Allow the edit, forecast and upload scenarios.")
+        parser.add_argument("--customer", default="LOADTEST",
+                            help="Customer the write scenarios edit, upload and post forecasts under.")
+        parser.add_argument("--keep-data", action="store_true",
+                            help="Keep the write customer and stored uploads after the run.")
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--output", default=None, help="Also write the JSON report to this file.")
+
+    def handle(self, *args, url, planners, duration, warmup, think, mix, timeout,
+               allow_writes, customer, keep_data, seed, output, **options):
+        if planners < 1:
+            raise CommandError("--planners must be at least 1.")
+        weights = _parse_mix(mix)
+        writes = [name for name in weights if name in WRITE_SCENARIOS]
+        if writes and not allow_writes:
+            raise CommandError(
+                f"Scenarios {', '.join(writes)} write to the server's database; pass --allow-writes to run them."
+            )
+        customer = customer.strip()
+        if writes and not customer:
+            raise CommandError("--customer must not be empty.")
+
+        created = seed_write_customer(customer) if writes else False
+        uploads_before = CustomerCSV.objects.order_by("-id").values_list("id", flat=True).first() or 0
+        uploaded = set()
+        try:
+            report = self._measure(url, planners, duration, warmup, think, weights, timeout,
+                                   customer, seed, uploaded)
+        finally:
+            if writes and not keep_data:
+                self._clean_up(customer if created else None, uploads_before, uploaded)
+
+        text = json.dumps(report, indent=2)
+        if output:
+            with open(output, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+        self.stdout.write(text)
+
+    def _measure(self, url, planners, duration, warmup, think, weights, timeout, customer, seed, uploaded):
+        targets = Targets(customer)
+        for scenario in list(weights):
+            missing = targets.missing_for(scenario)
+            if missing:
+                self.stderr.write(f"Skipping '{scenario}': no {missing} in the database.")
+                del weights[scenario]
+        if not weights:
+            raise CommandError("Nothing to run: the database has no rows for the chosen scenarios.")
+
+        return asyncio.run(self._run(url, planners, duration, warmup, think, weights, timeout, targets, seed, uploaded))
+
+    def _clean_up(self, customer, uploads_before, uploaded):
+        """Delete what the write scenarios left: the customer (if created here) and stored uploads."""
+        if customer:
+            # Cascades to its TEP codes, materials and forecasts, all through the change log.
+            Customer.objects.filter(customer_name=customer).delete()
+        if uploaded:
+            CustomerCSV.objects.filter(id__gt=uploads_before, content_hash__in=uploaded).delete()
+        self.stderr.write(
+            f"Removed load-test data: customer {customer or '(kept, existed before)'}, {len(uploaded)} upload(s)."
+        )
+
+    async def _run(self, url, planners, duration, warmup, think, weights, timeout, targets, seed, uploaded):
+        samples = {name: [] for name in weights}
+        errors = {name: {} for name in weights}
+        measuring = False
+
+        def record(scenario, elapsed, error):
+            if not measuring:
+                return
+            samples[scenario].append(elapsed)
+            if error:
+                errors[scenario][error] = errors[scenario].get(error, 0) + 1
+
+        limits = httpx.Limits(max_connections=planners, max_keepalive_connections=planners)
+        async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+            try:
+                await client.get("/api/master/materials/search", params={"q": "loadtest"})
+            except httpx.HTTPError as e:
+                raise CommandError(f"Cannot reach {url}: {e}")
+
+            rng = random.Random(seed)
+            users = [
+                Planner(client, targets, weights, random.Random(rng.random()), record, uploaded)
+                for _ in range(planners)
+            ]
+            started = time.monotonic()
+            deadline = started + warmup + duration
+            tasks = [asyncio.create_task(u.run(deadline, think)) for u in users]
+
+            await asyncio.sleep(warmup)
+            measuring = True
+            measure_started = time.monotonic()
+            await asyncio.gather(*tasks)
+            # Requests in flight at the deadline finish late; count the real window.
+            elapsed = max(time.monotonic() - measure_started, 1e-9)
+
+        scenarios = {}
+        for name in weights:
+            ordered = sorted(samples[name])
+            count = len(ordered)
+            failed = sum(errors[name].values())
+            scenarios[name] = {
+                "requests": count,
+                "throughput_rps": round(count / elapsed, 2),
+                "errors": failed,
+                "error_rate": round(failed / count, 4) if count else 0.0,
+                "error_kinds": errors[name],
+                "mean_ms": round(sum(ordered) / count * 1000, 2) if count else None,
+                **{
+                    f"p{p}_ms": round(_percentile(ordered, p) * 1000, 2) if count else None
+                    for p in (50, 95, 99)
+                },
+                "max_ms": round(ordered[-1] * 1000, 2) if count else None,
+            }
+
+        total = sum(s["requests"] for s in scenarios.values())
+        failed = sum(s["errors"] for s in scenarios.values())
+        all_samples = sorted(x for name in weights for x in samples[name])
+        return {
+            "url": url,
+            "planners": planners,
+            "duration_s": round(elapsed, 2),
+            "mix": weights,
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 2),
+            "errors": failed,
+            "error_rate": round(failed / total, 4) if total else 0.0,
+            **{
+                f"p{p}_ms": round(_percentile(all_samples, p) * 1000, 2) if all_samples else None
+                for p in (50, 95, 99)
+            },
+            "scenarios": scenarios,
+        }
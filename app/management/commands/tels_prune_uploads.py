@@ -0,0 +1,117 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.models import CustomerCSV
+from app.storage import UPLOAD_DIR, csv_storage, is_blob
+
+
+def _stored_files(storage, include_legacy):
+    """
+    (name, path) of the content-addressed blobs under customer_csvs/<aa>/ and,
+    with include_legacy, of the flat files written before that layout.
+    """
+    root = storage.path(UPLOAD_DIR)
+    if not os.path.isdir(root):
+        return
+    for entry in os.scandir(root):
+        if entry.is_dir() and len(entry.name) == 2:
+            for blob in os.scandir(entry.path):
+                name = f"{UPLOAD_DIR}/{entry.name}/{blob.name}"
+                if blob.is_file() and is_blob(name):
+                    yield name, blob.path
+        elif include_legacy and entry.is_file():
+            yield f"{UPLOAD_DIR}/{entry.name}", entry.path
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply retention to stored CSV uploads: keep the newest N imports per kind, "
+        "optionally cap the store's size, and remove content-addressed files no import "
+        "refers to. Legacy flat files in customer_csvs/ are only swept with --include-legacy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keep", type=int, default=getattr(settings, "TELS_UPLOAD_KEEP_PER_KIND", 20),
+            help="Imports to keep per kind (bom/master/forecast). The newest one is always kept.",
+        )
+        parser.add_argument(
+            "--max-bytes", type=int, default=getattr(settings, "TELS_UPLOAD_MAX_BYTES", None),
+            help="Evict the oldest imports until the referenced files fit in this many bytes.",
+        )
+        parser.add_argument(
+            "--orphan-age", type=int, default=3600,
+            help="Only delete unreferenced files older than this many seconds (protects in-flight uploads).",
+        )
+        parser.add_argument(
+            "--include-legacy", action="store_true",
+            help="Also delete unreferenced files stored before the content-addressed layout.",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, keep, max_bytes, orphan_age, include_legacy, dry_run, **options):
+        storage = csv_storage()
+        rows = list(CustomerCSV.objects.order_by("-id").values_list("id", "kind", "csv_file"))
+
+        doomed = set()
+        newest = set()
+        seen_per_kind = {}
+        for pk, kind, name in rows:
+            n = seen_per_kind.get(kind, 0)
+            seen_per_kind[kind] = n + 1
+            if n == 0:
+                newest.add(pk)
+            elif n >= max(keep, 1):
+                doomed.add(pk)
+
+        if max_bytes is not None:
+            sizes = {}
+            for _, _, name in rows:
+                if name and name not in sizes:
+                    sizes[name] = storage.size(name) if storage.exists(name) else 0
+
+            refs = {}
+            for pk, _, name in rows:
+                if pk not in doomed:
+                    refs[name] = refs.get(name, 0) + 1
+            total = sum(sizes[name] for name in refs if name)
+
+            for pk, _, name in reversed(rows):
+                if total <= max_bytes:
+                    break
+                if pk in doomed or pk in newest:
+                    continue
+                doomed.add(pk)
+                refs[name] -= 1
+                if refs[name] == 0 and name:
+                    total -= sizes[name]
+
+        self.stdout.write(f"Imports: {len(rows)} stored, {len(doomed)} to delete.")
+
+        if doomed and not dry_run:
+            with transaction.atomic():
+                # post_delete releases each file once its last reference is gone.
+                CustomerCSV.objects.filter(id__in=doomed).delete()
+
+        if dry_run:
+            referenced = {name for pk, _, name in rows if pk not in doomed}
+        else:
+            referenced = set(CustomerCSV.objects.values_list("csv_file", flat=True))
+
+        cutoff = time.time() - orphan_age
+        orphans = 0
+        freed = 0
+        for name, path in _stored_files(storage, include_legacy):
+            if name in referenced or os.path.getmtime(path) > cutoff:
+                continue
+            orphans += 1
+            freed += os.path.getsize(path)
+            if not dry_run:
+                os.remove(path)
+
+        verb = "Would remove" if dry_run else "Removed"
+        self.stdout.write(f"{verb} {orphans} unreferenced file(s), {freed} bytes.")
@@ -0,0 +1,34 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from app.importing import import_bom, import_forecasts, import_masters, stored_rows
+from app.models import CustomerCSV
+
+
+class Command(BaseCommand):
+    help = "Re-run a stored CSV/.xlsx import, streaming it from the compressed upload store."
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_id", type=int, help="CustomerCSV id")
+
+    def handle(self, *args, csv_id, **options):
+        stored = CustomerCSV.objects.filter(pk=csv_id).first()
+        if stored is None:
+            raise CommandError(f"CustomerCSV {csv_id} does not exist.")
+        if not stored.csv_file or not stored.csv_file.storage.exists(stored.csv_file.name):
+            raise CommandError(f"CustomerCSV {csv_id} has no stored file.")
+
+        stream, (header, rows) = stored_rows(stored.csv_file)
+        with stream, transaction.atomic():
+            if stored.kind == "master":
+                result = import_masters(header, rows)
+            elif stored.kind == "forecast":
+                result = import_forecasts(header, rows, default_year=date.today().year)
+            else:
+                result = import_bom(header, rows)
+
+        result.pop("row_hashes", None)
+        summary = ", ".join(f"{k}={v}" for k, v in result.items())
+        self.stdout.write(self.style.SUCCESS(f"Re-imported {stored.kind} CSV {csv_id} | {summary}"))
@@ -0,0 +1,192 @@
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+
+from app.models import ChangeEvent, Customer, Forecast, Material, MaterialList, TEPCode
+from app.readmodel import FULL_RELOAD_AFTER, current_version
+
+
+SNAPSHOT_FORMAT = 1
+META_TABLE = "tels_snapshot_meta"
+# Parents before children: restore inserts in this order and deletes in reverse.
+DATASET_MODELS = [MaterialList, Customer, TEPCode, Material, Forecast, ChangeEvent]
+KEEP_TABLES = {m._meta.db_table for m in DATASET_MODELS} | {"django_migrations", "sqlite_sequence"}
+
+
+def _q(name):
+    return connection.ops.quote_name(name)
+
+
+def _columns(cursor, schema, table):
+    cursor.execute(f"PRAGMA {schema}.table_info({_q(table)})")
+    return [(row[1], row[2].upper(), bool(row[3]), bool(row[5])) for row in cursor.fetchall()]
+
+
+def _app_migrations(cursor, schema="main"):
+    cursor.execute(f"SELECT name FROM {schema}.django_migrations WHERE app = 'app' ORDER BY name")
+    return [row[0] for row in cursor.fetchall()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Save the customer / TEP / material / master list / forecast dataset (with its change "
+        "log) to a standalone SQLite file using the online backup API, or restore it in one "
+        "transaction. A path ending in .gz is gzip-compressed. Users, sessions and stored "
+        "uploads are not included. Restore refuses snapshots from a different schema and "
+        "moves the change-log version forward, so running servers reload their read model. "
+        "/api/changes consumers must resync from /api/output-format afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["save", "restore"])
+        parser.add_argument("path", help="Snapshot file (.sqlite3, or .gz for compressed).")
+
+    def handle(self, *args, action, path, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("tels_snapshot works on SQLite databases only.")
+        started = time.perf_counter()
+        if action == "save":
+            counts = self.save(path)
+            verb = "Saved"
+        else:
+            counts = self.restore(path)
+            verb = "Restored"
+        summary = ", ".join(f"{table}={n}" for table, n in counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} snapshot {path} in {time.perf_counter() - started:.2f}s | {summary}"
+        ))
+
+    # ── save ────────────────────────────────────────────────────────────────
+
+    def save(self, path):
+        compress = path.endswith(".gz")
+        fd, tmp = tempfile.mkstemp(suffix=".sqlite3", dir=os.path.dirname(os.path.abspath(path)))
+        os.close(fd)
+        try:
+            connection.ensure_connection()
+            dest = sqlite3.connect(tmp)
+            try:
+                # Consistent page-level copy, even while the server keeps writing.
+                connection.connection.backup(dest)
+                counts = self._strip_to_dataset(dest)
+            finally:
+                dest.close()
+
+            if compress:
+                with open(tmp, "rb") as src, gzip.open(path, "wb", compresslevel=6) as out:
+                    shutil.copyfileobj(src, out, 1024 * 1024)
+            else:
+                os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return counts
+
+    def _strip_to_dataset(self, db):
+        cur = db.cursor()
+        cur.execute("SELECT type, name FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'")
+        for kind, name in cur.fetchall():
+            if name not in KEEP_TABLES:
+                cur.execute(f"DROP {kind.upper()} IF EXISTS {_q(name)}")
+
+        counts = {}
+        for model in DATASET_MODELS:
+            table = model._meta.db_table
+            counts[table] = cur.execute(f"SELECT COUNT(*) FROM {_q(table)}").fetchone()[0]
+
+        meta = {
+            "format": SNAPSHOT_FORMAT,
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "version": cur.execute(f"SELECT COALESCE(MAX(id), 0) FROM {_q(ChangeEvent._meta.db_table)}").fetchone()[0],
+            "counts": counts,
+        }
+        cur.execute(f"CREATE TABLE {META_TABLE} (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        cur.executemany(
+            f"INSERT INTO {META_TABLE} (key, value) VALUES (?, ?)",
+            [(k, json.dumps(v)) for k, v in meta.items()],
+        )
+        db.commit()
+        db.execute("VACUUM")
+        return counts
+
+    # ── restore ─────────────────────────────────────────────────────────────
+
+    def restore(self, path):
+        if not os.path.exists(path):
+            raise CommandError(f"Snapshot {path} does not exist.")
+
+        tmp = None
+        if path.endswith(".gz"):
+            fd, tmp = tempfile.mkstemp(suffix=".sqlite3")
+            with os.fdopen(fd, "wb") as out, gzip.open(path, "rb") as src:
+                shutil.copyfileobj(src, out, 1024 * 1024)
+            path = tmp
+
+        try:
+            with connection.cursor() as cursor:
+                # ATTACH is not allowed inside a transaction.
+                cursor.execute("ATTACH DATABASE %s AS snap", [path])
+                try:
+                    self._check_compatible(cursor)
+                    with transaction.atomic():
+                        return self._copy_dataset(cursor)
+                finally:
+                    cursor.execute("DETACH DATABASE snap")
+        finally:
+            if tmp:
+                os.remove(tmp)
+
+    def _check_compatible(self, cursor):
+        try:
+            cursor.execute(f"SELECT key, value FROM snap.{META_TABLE}")
+            meta = {k: json.loads(v) for k, v in cursor.fetchall()}
+        except DatabaseError:
+            raise CommandError("Not a tels_snapshot file (no snapshot metadata).")
+        if meta.get("format") != SNAPSHOT_FORMAT:
+            raise CommandError(f"Snapshot format {meta.get('format')} is not supported (expected {SNAPSHOT_FORMAT}).")
+
+        theirs, ours = _app_migrations(cursor, "snap"), _app_migrations(cursor)
+        if theirs != ours:
+            missing = sorted(set(ours) - set(theirs))
+            extra = sorted(set(theirs) - set(ours))
+            raise CommandError(
+                "Snapshot schema does not match this database. "
+                f"Missing migrations: {', '.join(missing) or '-'}; unknown migrations: {', '.join(extra) or '-'}."
+            )
+        for model in DATASET_MODELS:
+            table = model._meta.db_table
+            if _columns(cursor, "snap", table) != _columns(cursor, "main", table):
+                raise CommandError(f"Snapshot table {table} has different columns from this database.")
+
+    def _copy_dataset(self, cursor):
+        before = current_version()
+
+        for model in reversed(DATASET_MODELS):
+            cursor.execute(f"DELETE FROM main.{_q(model._meta.db_table)}")
+
+        counts = {}
+        for model in DATASET_MODELS:
+            table = _q(model._meta.db_table)
+            cols = ", ".join(_q(name) for name, *_ in _columns(cursor, "main", model._meta.db_table))
+            cursor.execute(f"INSERT INTO main.{table} ({cols}) SELECT {cols} FROM snap.{table}")
+            counts[model._meta.db_table] = cursor.rowcount
+
+        # One event past every version the read model, trigram index and caches
+        # may hold (old or restored) by more than FULL_RELOAD_AFTER, so each
+        # reloads from scratch instead of replaying unrelated events.
+        ChangeEvent.objects.create(
+            id=max(before, current_version()) + FULL_RELOAD_AFTER + 1,
+            entity="customer",
+            action="update",
+            object_key="*",
+            data={"restored_snapshot": True},
+        )
+        return counts
@@ -0,0 +1,41 @@
+# Generated by Django 6.0.1 on 2026-10-19 02:59
+
+import re
+
+from django.db import migrations, models
+
+
+def fill_name_key(apps, schema_editor):
+    Customer = apps.get_model("app", "Customer")
+    rows = list(Customer.objects.only("id", "customer_name"))
+    for c in rows:
+        c.name_key = re.sub(r"\s+", " ", (c.customer_name or "").strip()).lower()
+    Customer.objects.bulk_update(rows, ["name_key"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_forecast_changeevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='name_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=120),
+        ),
+        migrations.RunPython(fill_name_key, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='forecast',
+            index=models.Index(fields=['customer', 'part_number'], name='app_fc_customer_part_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(fields=['tep_code', 'mat_partcode'], name='app_mat_tep_partcode_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tepcode',
+            index=models.Index(fields=['tep_code'], name='app_tep_code_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 6.0.1 on 2026-10-19 03:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_lookup_indexes_customer_name_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customercsv',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='customercsv',
+            name='kind',
+            field=models.CharField(choices=[('bom', 'BOM'), ('master', 'Material master'), ('forecast', 'Forecast')], default='bom', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='customercsv',
+            name='row_hashes',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
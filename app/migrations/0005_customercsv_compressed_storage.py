@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-19 03:40
+
+import app.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_customercsv_hashes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customercsv',
+            name='csv_file',
+            field=models.FileField(max_length=200, storage=app.storage.csv_storage, upload_to=app.storage.csv_upload_to),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-19 04:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_customercsv_compressed_storage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='material',
+            index=models.Index(fields=['mat_partcode', 'tep_code'], name='app_mat_partcode_tep_idx'),
+        ),
+    ]
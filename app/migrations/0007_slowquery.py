@@ -0,0 +1,29 @@
+# Generated by Django 6.0.1 on 2026-10-19 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_material_partcode_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sql', models.TextField()),
+                ('params', models.TextField(blank=True, default='')),
+                ('duration_ms', models.FloatField()),
+                ('endpoint', models.CharField(blank=True, default='', max_length=200)),
+                ('call_site', models.CharField(blank=True, default='', max_length=300)),
+                ('plan', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+    ]
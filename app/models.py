@@ -4,19 +4,39 @@
 # Create your models here.
 
    
+import re
+
 from django.db import models
 from django.core.exceptions import ValidationError
 from django.conf import settings
 from django.contrib.auth.models import User
 
+from .storage import csv_storage, csv_upload_to
+
+
 class Customer(models.Model):
     customer_name = models.CharField(max_length=120, unique=True)
 
+    # Lowercased, whitespace-collapsed copy of customer_name so case-insensitive
+    # lookups can use an index instead of customer_name__iexact.
+    name_key = models.CharField(max_length=120, db_index=True, editable=False, default="")
+
     parts = models.JSONField(default=list, blank=True)
 
     def __str__(self):
         return self.customer_name
 
+    @staticmethod
+    def normalize_name(name):
+        return re.sub(r"\s+", " ", str(name or "").strip()).lower()
+
+    def save(self, *args, **kwargs):
+        self.name_key = self.normalize_name(self.customer_name)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "customer_name" in update_fields:
+            kwargs["update_fields"] = set(update_fields) | {"name_key"}
+        super().save(*args, **kwargs)
+
     def clean(self):
         """
         Optional validation to keep parts JSON clean.
@@ -54,6 +74,9 @@ class TEPCode(models.Model):
 
     class Meta:
         unique_together = ("customer", "part_code", "tep_code")
+        indexes = [
+            models.Index(fields=["tep_code"], name="app_tep_code_idx"),
+        ]
 
     def __str__(self):
         return f"{self.customer.customer_name} | {self.part_code} | {self.tep_code}"
@@ -83,6 +106,12 @@ class Material(models.Model):
     loss_percent = models.FloatField(default=10.0)
     total = models.FloatField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["tep_code", "mat_partcode"], name="app_mat_tep_partcode_idx"),
+            models.Index(fields=["mat_partcode", "tep_code"], name="app_mat_partcode_tep_idx"),
+        ]
+
     def __str__(self):
         return f"{self.mat_partname} ({self.mat_partcode})"
 
@@ -105,8 +134,19 @@ class MaterialList(models.Model):
 
 
 class CustomerCSV(models.Model):
-    csv_file = models.FileField(upload_to="customer_csvs/")
+    KIND_CHOICES = [
+        ("bom", "BOM"),
+        ("master", "Material master"),
+        ("forecast", "Forecast"),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default="bom")
+    csv_file = models.FileField(upload_to=csv_upload_to, storage=csv_storage, max_length=200)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # sha256 of the raw upload and the per-row hashes of this import; the next
+    # upload of the same kind is compared against them (app/importing.py).
+    content_hash = models.CharField(max_length=64, blank=True, default="", db_index=True)
+    row_hashes = models.JSONField(default=list, blank=True)
 
     def __str__(self):
         return f"CustomerCSV {self.id}"
@@ -144,6 +184,9 @@ class Forecast(models.Model):
 
     class Meta:
         ordering = ["part_number"]
+        indexes = [
+            models.Index(fields=["customer", "part_number"], name="app_fc_customer_part_idx"),
+        ]
 
     def __str__(self):
         return f"{self.part_number} - {self.part_name}"
@@ -233,3 +276,55 @@ class Forecast(models.Model):
                 except (TypeError, ValueError):
                     continue
         return total
+
+
+class ChangeEvent(models.Model):
+    """
+    Append-only change log read by /api/changes.
+    The auto-increment id doubles as the sync cursor for downstream consumers.
+    """
+    ENTITY_CHOICES = [
+        ("customer", "customer"),
+        ("part", "part"),
+        ("tep", "tep"),
+        ("material", "material"),
+        ("master_material", "master_material"),
+        ("forecast", "forecast"),
+    ]
+    ACTION_CHOICES = [
+        ("create", "create"),
+        ("update", "update"),
+        ("delete", "delete"),
+    ]
+
+    entity = models.CharField(max_length=20, choices=ENTITY_CHOICES)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    object_key = models.CharField(max_length=200)
+    data = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"#{self.id} {self.action} {self.entity} {self.object_key}"
+
+
+class SlowQuery(models.Model):
+    """
+    Ring buffer of statements slower than TELS_SLOW_QUERY_MS (app/slowlog.py),
+    with the SQLite query plan captured when they were logged.
+    """
+    sql = models.TextField()
+    params = models.TextField(blank=True, default="")
+    duration_ms = models.FloatField()
+    endpoint = models.CharField(max_length=200, blank=True, default="")
+    call_site = models.CharField(max_length=300, blank=True, default="")
+    plan = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-id"]
+
+    def __str__(self):
+        return f"#{self.id} {self.duration_ms:.1f} ms {self.endpoint or self.call_site}"
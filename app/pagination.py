@@ -0,0 +1,165 @@
+"""
+Keyset (seek) pagination for querysets and for the read model's sorted lists.
+
+A page is found from the sort key of the row next to it, carried in an
+opaque cursor token ("n" = rows after it, "p" = rows before it). Page N
+therefore costs the same index seek as page 1 and never an OFFSET scan.
+Totals are not tied to the page: approx_count() caches them per query and
+change-log version.
+"""
+import base64
+import hashlib
+import json
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+
+def encode_cursor(direction, values):
+    raw = json.dumps([direction, list(values)], separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    """(direction, values) from a cursor token; (None, None) if missing or malformed."""
+    if not token:
+        return None, None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        direction, values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None, None
+    if direction not in ("n", "p") or not isinstance(values, list):
+        return None, None
+    return direction, values
+
+
+class KeysetPage:
+    """One page of rows plus the cursors of its neighbours."""
+
+    def __init__(self, items, next_cursor="", prev_cursor="", count=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.count = count
+
+    @property
+    def has_next(self):
+        return bool(self.next_cursor)
+
+    @property
+    def has_previous(self):
+        return bool(self.prev_cursor)
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def with_items(self, items):
+        return KeysetPage(items, self.next_cursor, self.prev_cursor, self.count)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def _page(rows, key, forward, had_cursor, more):
+    """Cursors for a fetched window; `rows` are already in display order."""
+    has_next = more if forward else had_cursor
+    has_prev = had_cursor if forward else more
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor("n", key(rows[-1])) if rows and has_next else "",
+        prev_cursor=encode_cursor("p", key(rows[0])) if rows and has_prev else "",
+    )
+
+
+def _seek_filter(fields, values, forward):
+    """
+    Rows strictly after (forward) or before `values` in the ordering
+    `fields` = [(name, descending)], as an OR of equal-prefix comparisons.
+    """
+    q = Q()
+    for i, (name, desc) in enumerate(fields):
+        op = "gt" if forward != desc else "lt"
+        term = Q(**{f"{name}__{op}": values[i]})
+        for j in range(i):
+            term &= Q(**{fields[j][0]: values[j]})
+        q |= term
+    return q
+
+
+def paginate_queryset(qs, order, cursor=None, per_page=20):
+    """
+    Keyset page of `qs` ordered by `order` (e.g. ("mat_partcode", "id")).
+    The last field must be unique so every row has a distinct key.
+    """
+    fields = [(f.lstrip("-"), f.startswith("-")) for f in order]
+    direction, values = decode_cursor(cursor)
+    if values is not None and len(values) != len(fields):
+        direction, values = None, None
+    forward = direction != "p"
+
+    if values is not None:
+        qs = qs.filter(_seek_filter(fields, values, forward))
+    ordering = order if forward else [f[1:] if f.startswith("-") else f"-{f}" for f in order]
+    rows = list(qs.order_by(*ordering)[:per_page + 1])
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    def key(row):
+        return [getattr(row, name) for name, _ in fields]
+
+    return _page(rows, key, forward, values is not None, more)
+
+
+def paginate_sequence(items, key, cursor=None, per_page=20, descending=False):
+    """
+    Keyset page of `items`, a list already sorted ascending by `key`
+    (a function returning a tuple). descending=True pages from the end.
+    The count is exact and free here.
+    """
+    direction, values = decode_cursor(cursor)
+    forward = direction != "p"
+    toward_end = forward != descending
+
+    if values is None:
+        start, end = (0, per_page) if not descending else (len(items) - per_page, len(items))
+    elif toward_end:
+        start = bisect_right(items, tuple(values), key=key)
+        end = start + per_page
+    else:
+        end = bisect_left(items, tuple(values), key=key)
+        start = end - per_page
+    start, end = max(start, 0), min(end, len(items))
+
+    rows = items[start:end]
+    if descending:
+        rows = rows[::-1]
+    more = (end < len(items)) if toward_end else (start > 0)
+
+    page = _page(rows, lambda r: list(key(r)), forward, values is not None, more)
+    page.count = len(items)
+    return page
+
+
+def approx_count(qs, version=None):
+    """
+    COUNT(*) of `qs`, cached per query. With a change-log `version` the
+    entry is exact for that version; without one it may lag writes by up
+    to TELS_APPROX_COUNT_SECONDS.
+    """
+    digest = hashlib.sha1(str(qs.query).encode("utf-8")).hexdigest()
+    key = f"approx-count:{digest}:{version}"
+    timeout = getattr(settings, "TELS_APPROX_COUNT_SECONDS", 60)
+    return cache.get_or_set(key, qs.count, timeout)
@@ -0,0 +1,213 @@
+"""
+Opt-in CPU profiling of single requests, for superusers.
+
+A request carrying ?_profile=1 or an "X-Profile: 1" header from a logged-in
+superuser runs under cProfile. The capture is written to TELS_PROFILE_DIR as
+three files sharing one id:
+
+  <id>.prof    pstats dump (python -m pstats, snakeviz, ...)
+  <id>.folded  collapsed stacks ("a;b;c <microseconds>") for flamegraph.pl
+               or speedscope
+  <id>.json    endpoint, status, duration, query count, user, time
+
+Only the newest TELS_PROFILE_KEEP captures are kept. The response carries
+the id in X-Profile-Id, and /panel/profiles/ lists the captures.
+
+cProfile follows one thread, so captures are taken on the sync (WSGI) path.
+Under ASGI the middleware stays async and passes every request straight
+through; profile with runserver or another WSGI server.
+"""
+import cProfile
+import json
+import os
+import pstats
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+
+
+CAPTURE_KINDS = {"prof", "folded", "json"}
+MAX_STACK_DEPTH = 128
+_CAPTURE_ID = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9]{6}-[0-9a-f]{4}$")
+
+
+def profile_dir():
+    return str(getattr(settings, "TELS_PROFILE_DIR", os.path.join(settings.BASE_DIR, "profiles")))
+
+
+def is_capture_id(capture_id):
+    return bool(_CAPTURE_ID.match(capture_id or ""))
+
+
+def capture_path(capture_id, kind):
+    return os.path.join(profile_dir(), f"{capture_id}.{kind}")
+
+
+def _wants_profile(request):
+    if request.GET.get("_profile") != "1" and request.headers.get("X-Profile") != "1":
+        return False
+    user = getattr(request, "user", None)
+    return bool(user and user.is_authenticated and user.is_superuser)
+
+
+def _frame_name(func):
+    filename, line, name = func
+    if filename == "~":
+        return name    # built-ins: "<built-in method ...>"
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+def collapsed_stacks(stats, entry=None):
+    """
+    Collapsed stacks rebuilt from cProfile's caller graph. cProfile keeps only
+    caller -> callee edges, so a function's time is split across its callers
+    in proportion to the cumulative time each edge accounts for. Paths worth
+    less than a microsecond are not expanded.
+
+    Stacks start at functions nobody called and at `entry` (a pstats key),
+    which matters for the middleware chain: it recurses through the same
+    handler functions, so its outermost call still has callers.
+    """
+    raw = stats.stats
+    callees = {}
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller in callers:
+            callees.setdefault(caller, []).append(func)
+
+    lines = {}
+
+    def walk(func, path, share, on_path):
+        _, _, tt, ct, _ = raw[func]
+        path = path + (_frame_name(func),)
+        own = tt * share
+        if own > 0:
+            key = ";".join(path)
+            lines[key] = lines.get(key, 0.0) + own
+        if len(path) >= MAX_STACK_DEPTH:
+            return
+        for callee in callees.get(func, ()):
+            if callee in on_path:
+                continue
+            callee_ct = raw[callee][3]
+            edge_ct = raw[callee][4][func][3]
+            if callee_ct <= 0 or edge_ct * share < 1e-6:
+                continue
+            walk(callee, path, share * min(edge_ct / callee_ct, 1.0), on_path | {callee})
+
+    for func, (_, _, _, _, callers) in raw.items():
+        if not callers or func == entry:
+            walk(func, (), 1.0, frozenset([func]))
+
+    return "".join(
+        f"{stack} {int(seconds * 1_000_000)}\n"
+        for stack, seconds in sorted(lines.items())
+        if seconds * 1_000_000 >= 1
+    )
+
+
+def _prune(keep):
+    directory = profile_dir()
+    ids = sorted(
+        name[:-5] for name in os.listdir(directory)
+        if name.endswith(".json") and is_capture_id(name[:-5])
+    )
+    for capture_id in ids[:-keep] if keep else ids:
+        for kind in CAPTURE_KINDS:
+            try:
+                os.remove(capture_path(capture_id, kind))
+            except FileNotFoundError:
+                pass
+
+
+def save_capture(profiler, meta, entry=None):
+    os.makedirs(profile_dir(), exist_ok=True)
+    # Sortable by time, so pruning and the listing can go by name.
+    capture_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{uuid.uuid4().hex[:4]}"
+
+    stats = pstats.Stats(profiler)
+    stats.dump_stats(capture_path(capture_id, "prof"))
+    with open(capture_path(capture_id, "folded"), "w", encoding="utf-8") as f:
+        f.write(collapsed_stacks(stats, entry))
+    with open(capture_path(capture_id, "json"), "w", encoding="utf-8") as f:
+        json.dump({"id": capture_id, **meta}, f, indent=2)
+
+    _prune(getattr(settings, "TELS_PROFILE_KEEP", 50))
+    return capture_id
+
+
+def list_captures():
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    out = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not (name.endswith(".json") and is_capture_id(name[:-5])):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                out.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return out
+
+
+class ProfilingMiddleware:
+    """Must come after AuthenticationMiddleware (it checks request.user)."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def _entry(self):
+        code = getattr(self.get_response, "__code__", None)
+        return cProfile.label(code) if code else None
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not _wants_profile(request):
+            return self.get_response(request)
+
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with connection.execute_wrapper(count):
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        capture_id = save_capture(profiler, {
+            "method": request.method,
+            "path": request.get_full_path(),
+            "view": match.view_name if match else "",
+            "status": response.status_code,
+            "duration_ms": round(duration * 1000, 2),
+            "queries": queries,
+            "user": request.user.get_username(),
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        }, entry=self._entry())
+        response["X-Profile-Id"] = capture_id
+        return response
@@ -0,0 +1,142 @@
+"""
+Propagation of material master edits to the Material rows that copy them.
+
+Material rows copy mat_partcode, mat_maker and unit from MaterialList when
+they are inserted (the name is only a starting point; it gets per-TEP
+suffixes, so it is left alone). When a master row changes, every dependent
+Material row is brought in line with one UPDATE per changed master, not
+row-by-row saves. Because that UPDATE bypasses signals, the rows it touches
+are logged to the change log explicitly. A rename skips rows whose TEP
+already has a Material with the new code, so no TEP ends up with two.
+
+TELS_MASTER_PROPAGATION picks when that happens:
+  "inline"     in the caller's transaction, before it returns;
+  "on_commit"  right after the caller's transaction commits (default);
+  "thread"     after commit, on a single background worker thread.
+Jobs re-read the master rows when they run, so a late or repeated job
+always applies the current values.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Exists, OuterRef
+
+from .changes import event_for, record_changes
+from .models import Material, MaterialList
+
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_CHUNK = 500
+
+_executor = None
+
+
+def _background():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tels-propagate")
+    return _executor
+
+
+def _stale_codes(codes):
+    """
+    The subset of `codes` carried by some Material row that no master row
+    matches on code, maker and unit, in one query per chunk. Codes whose
+    dependents are already current cost nothing further.
+    """
+    in_line = MaterialList.objects.filter(
+        mat_partcode=OuterRef("mat_partcode"),
+        mat_maker=OuterRef("mat_maker"),
+        unit=OuterRef("unit"),
+    )
+    codes = list(codes)
+    found = set()
+    for i in range(0, len(codes), LOOKUP_CHUNK):
+        found.update(
+            Material.objects
+            .filter(mat_partcode__in=codes[i:i + LOOKUP_CHUNK])
+            .exclude(Exists(in_line))
+            .values_list("mat_partcode", flat=True)
+            .distinct()
+        )
+    return found
+
+
+def apply_master_changes(changes):
+    """
+    Align Material rows with their masters now. `changes` maps the code the
+    Material rows may still carry (the old code for a rename) to a
+    MaterialList id. Returns the number of Material rows updated.
+    """
+    updated = 0
+
+    with transaction.atomic():
+        stale_codes = _stale_codes(changes)
+        masters = MaterialList.objects.in_bulk({changes[code] for code in stale_codes})
+        for old_code in stale_codes:
+            master = masters.get(changes[old_code])
+            if master is None:
+                continue
+
+            stale = (
+                Material.objects
+                .filter(mat_partcode=old_code)
+                .exclude(mat_partcode=master.mat_partcode, mat_maker=master.mat_maker, unit=master.unit)
+            )
+            if old_code != master.mat_partcode:
+                # Material has no unique (tep_code, mat_partcode), so a rename
+                # must not give a TEP two rows with the new code. Rows whose TEP
+                # already has one keep the old code for a person to merge.
+                taken = Material.objects.filter(tep_code=OuterRef("tep_code"), mat_partcode=master.mat_partcode)
+                clashing = stale.filter(Exists(taken)).count()
+                if clashing:
+                    logger.warning(
+                        "Rename %s -> %s left %d Material rows unchanged: their TEP already has %s",
+                        old_code, master.mat_partcode, clashing, master.mat_partcode,
+                    )
+                stale = stale.exclude(Exists(taken))
+            rows = list(stale)
+            if not rows:
+                continue
+
+            Material.objects.filter(id__in=[m.id for m in rows]).update(
+                mat_partcode=master.mat_partcode, mat_maker=master.mat_maker, unit=master.unit,
+            )
+            for m in rows:
+                m.mat_partcode = master.mat_partcode
+                m.mat_maker = master.mat_maker
+                m.unit = master.unit
+            record_changes(event_for(m, "update") for m in rows)
+            updated += len(rows)
+
+    return updated
+
+
+def _run_in_background(changes):
+    try:
+        apply_master_changes(changes)
+    except Exception:
+        logger.exception("Material propagation failed for %d master rows", len(changes))
+    finally:
+        close_old_connections()
+
+
+def propagate_masters(changes):
+    """
+    Schedule apply_master_changes() for `changes` ({old_code: master_id})
+    according to TELS_MASTER_PROPAGATION.
+    """
+    changes = {code: mid for code, mid in changes.items() if code and mid}
+    if not changes:
+        return
+
+    mode = getattr(settings, "TELS_MASTER_PROPAGATION", "on_commit")
+    if mode == "inline":
+        apply_master_changes(changes)
+    elif mode == "thread":
+        transaction.on_commit(lambda: _background().submit(_run_in_background, changes))
+    else:
+        transaction.on_commit(lambda: apply_master_changes(changes))
@@ -0,0 +1,336 @@
+"""
+Process-wide, read-only model of the BOM (customers, parts, TEP codes,
+materials) and of the material master list.
+
+A worker loads it once with four .values_list() queries and keeps it current
+by replaying the ChangeEvent log: the newest ChangeEvent id is the shared
+version counter. When nothing has moved a request pays for one indexed
+MAX(id) lookup. When something has, only the rows named by the new events
+are re-read, and a full reload is done only after a large gap.
+
+Snapshots are never mutated after they are published. A refresh builds a new
+snapshot and swaps it in, so readers on other threads always see a
+consistent view.
+"""
+import threading
+from collections import defaultdict
+from functools import cached_property
+
+from django.db import connection
+
+from .models import ChangeEvent, Customer, Material, MaterialList, TEPCode
+
+
+FULL_RELOAD_AFTER = 2000
+
+
+class CustomerRec:
+    __slots__ = ("id", "customer_name", "parts")
+
+    def __init__(self, id, customer_name, parts):
+        self.id = id
+        self.customer_name = customer_name
+        self.parts = parts        # tuple of (Partcode, Partname), in JSON order
+
+
+class TepRec:
+    __slots__ = ("id", "customer_id", "part_code", "tep_code")
+
+    def __init__(self, id, customer_id, part_code, tep_code):
+        self.id = id
+        self.customer_id = customer_id
+        self.part_code = part_code
+        self.tep_code = tep_code
+
+
+class MaterialRec:
+    __slots__ = (
+        "id", "tep_id", "mat_partcode", "mat_partname", "mat_maker",
+        "unit", "dim_qty", "loss_percent", "total",
+    )
+
+    def __init__(self, id, tep_id, mat_partcode, mat_partname, mat_maker, unit, dim_qty, loss_percent, total):
+        self.id = id
+        self.tep_id = tep_id
+        self.mat_partcode = mat_partcode
+        self.mat_partname = mat_partname
+        self.mat_maker = mat_maker
+        self.unit = unit
+        self.dim_qty = dim_qty
+        self.loss_percent = loss_percent
+        self.total = total
+
+    def as_dict(self):
+        return {
+            "mat_partcode": self.mat_partcode,
+            "mat_partname": self.mat_partname,
+            "mat_maker": self.mat_maker,
+            "unit": self.unit,
+            "dim_qty": self.dim_qty,
+            "loss_percent": self.loss_percent,
+            "total": self.total,
+        }
+
+
+class MasterRec:
+    """Attribute-compatible stand-in for a MaterialList row."""
+    __slots__ = ("id", "mat_partcode", "mat_partname", "mat_maker", "unit")
+
+    def __init__(self, id, mat_partcode, mat_partname, mat_maker, unit):
+        self.id = id
+        self.mat_partcode = mat_partcode
+        self.mat_partname = mat_partname
+        self.mat_maker = mat_maker
+        self.unit = unit
+
+
+def _parts_tuple(parts):
+    out = []
+    for p in parts or []:
+        if not isinstance(p, dict):
+            continue
+        code = str(p.get("Partcode") or "").strip()
+        if code:
+            out.append((code, str(p.get("Partname") or "").strip()))
+    return tuple(out)
+
+
+def _load_customers(qs):
+    return {
+        cid: CustomerRec(cid, name, _parts_tuple(parts))
+        for cid, name, parts in qs.values_list("id", "customer_name", "parts")
+    }
+
+
+def _load_teps(qs):
+    return {
+        row[0]: TepRec(*row)
+        for row in qs.values_list("id", "customer_id", "part_code", "tep_code")
+    }
+
+
+def _load_materials(qs):
+    return {
+        row[0]: MaterialRec(*row)
+        for row in qs.values_list(
+            "id", "tep_code_id", "mat_partcode", "mat_partname", "mat_maker",
+            "unit", "dim_qty", "loss_percent", "total",
+        )
+    }
+
+
+def _load_masters(qs):
+    return {
+        row[0]: MasterRec(*row)
+        for row in qs.values_list("id", "mat_partcode", "mat_partname", "mat_maker", "unit")
+    }
+
+
+# entity name in ChangeEvent -> (snapshot attribute, model, loader)
+_SOURCES = {
+    "customer": ("customers", Customer, _load_customers),
+    "tep": ("teps", TEPCode, _load_teps),
+    "material": ("materials", Material, _load_materials),
+    "master_material": ("masters", MaterialList, _load_masters),
+}
+
+
+class BomSnapshot:
+    def __init__(self, version, customers, teps, materials, masters, base_version=None, tep_versions=None):
+        self.version = version
+        self.customers = customers    # id -> CustomerRec
+        self.teps = teps              # id -> TepRec
+        self.materials = materials    # id -> MaterialRec
+        self.masters = masters        # id -> MasterRec
+        # Version at which each TEP (its row, materials or customer) last
+        # changed; TEPs not listed are unchanged since base_version.
+        self.base_version = version if base_version is None else base_version
+        self.tep_versions = tep_versions or {}
+
+    # ── derived indexes, built lazily once per snapshot ─────────────────────
+    @cached_property
+    def customers_by_name(self):
+        return sorted(self.customers.values(), key=lambda c: (c.customer_name, c.id))
+
+    @cached_property
+    def _teps_by_customer(self):
+        out = defaultdict(list)
+        for tid in sorted(self.teps):
+            t = self.teps[tid]
+            out[t.customer_id].append(t)
+        return out
+
+    @cached_property
+    def _teps_by_code(self):
+        out = defaultdict(list)
+        for tid in sorted(self.teps):
+            t = self.teps[tid]
+            out[t.tep_code].append(t)
+        return out
+
+    @cached_property
+    def _materials_by_tep(self):
+        out = defaultdict(list)
+        for mid in sorted(self.materials):
+            m = self.materials[mid]
+            out[m.tep_id].append(m)
+        return out
+
+    @cached_property
+    def _masters_by_code(self):
+        return {m.mat_partcode: m for m in self.masters.values()}
+
+    @cached_property
+    def _part_owner(self):
+        out = {}
+        for cid in sorted(self.customers):
+            c = self.customers[cid]
+            for code, _ in c.parts:
+                out.setdefault(code, c)
+        return out
+
+    # ── lookups ──────────────────────────────────────────────────────────────
+    def teps_of(self, customer_id):
+        return self._teps_by_customer.get(customer_id, [])
+
+    def teps_by_code(self, tep_code):
+        return self._teps_by_code.get(tep_code, [])
+
+    def materials_of(self, tep_id):
+        return self._materials_by_tep.get(tep_id, [])
+
+    def tep_version(self, tep_id):
+        """Token that changes whenever anything shown for this TEP does."""
+        return self.tep_versions.get(tep_id, self.base_version)
+
+    def master(self, mat_partcode):
+        return self._masters_by_code.get(mat_partcode)
+
+    def master_map(self):
+        return self._masters_by_code
+
+    def part_owner(self, part_code):
+        """First customer (by id) whose parts JSON lists part_code."""
+        return self._part_owner.get(part_code)
+
+    def search(self, q=""):
+        """
+        Customers ordered by name, optionally filtered with the same six-way
+        case-insensitive match the ORM search used: customer name, TEP code,
+        TEP part code, material code, material name or maker.
+        """
+        if not q:
+            return list(self.customers_by_name)
+
+        needle = q.lower()
+        out = []
+        for c in self.customers_by_name:
+            if needle in c.customer_name.lower() or self._customer_matches(c, needle):
+                out.append(c)
+        return out
+
+    def _customer_matches(self, c, needle):
+        for t in self.teps_of(c.id):
+            if needle in t.tep_code.lower() or needle in t.part_code.lower():
+                return True
+            for m in self.materials_of(t.id):
+                if (
+                    needle in m.mat_partcode.lower()
+                    or needle in m.mat_partname.lower()
+                    or needle in m.mat_maker.lower()
+                ):
+                    return True
+        return False
+
+
+def current_version():
+    return ChangeEvent.objects.order_by("-id").values_list("id", flat=True).first() or 0
+
+
+def _full_load(version):
+    return BomSnapshot(
+        version,
+        customers=_load_customers(Customer.objects.all()),
+        teps=_load_teps(TEPCode.objects.all()),
+        materials=_load_materials(Material.objects.all()),
+        masters=_load_masters(MaterialList.objects.all()),
+    )
+
+
+def _apply_changes(snap, version):
+    """New snapshot = `snap` plus re-reads of every row touched since it."""
+    touched = defaultdict(set)
+    events = (
+        ChangeEvent.objects
+        .filter(id__gt=snap.version, id__lte=version)
+        .values_list("entity", "object_key")
+    )
+    for entity, key in events:
+        if entity == "part":
+            entity, key = "customer", key.split(":", 1)[0]
+        if entity not in _SOURCES:
+            continue
+        try:
+            touched[entity].add(int(key))
+        except (TypeError, ValueError):
+            return _full_load(version)
+
+    tables = {
+        "customers": snap.customers,
+        "teps": snap.teps,
+        "materials": snap.materials,
+        "masters": snap.masters,
+    }
+    for entity, ids in touched.items():
+        attr, model, loader = _SOURCES[entity]
+        fresh = loader(model.objects.filter(id__in=ids))
+        table = dict(tables[attr])
+        for pk in ids:
+            table.pop(pk, None)
+        table.update(fresh)
+        tables[attr] = table
+
+    fresh = BomSnapshot(version, **tables, base_version=snap.base_version, tep_versions=dict(snap.tep_versions))
+
+    stale_teps = set(touched.get("tep", ()))
+    for mid in touched.get("material", ()):
+        for m in (snap.materials.get(mid), fresh.materials.get(mid)):
+            if m is not None:
+                stale_teps.add(m.tep_id)
+    for cid in touched.get("customer", ()):
+        stale_teps.update(t.id for t in snap.teps_of(cid))
+        stale_teps.update(t.id for t in fresh.teps_of(cid))
+    for tid in stale_teps:
+        fresh.tep_versions[tid] = version
+
+    return fresh
+
+
+_lock = threading.Lock()
+_current = None
+
+
+def get_snapshot():
+    """
+    Current snapshot for this worker.
+
+    Snapshots built inside a transaction may contain uncommitted rows, so
+    they are returned to the caller but never published to other requests.
+    """
+    global _current
+
+    version = current_version()
+    snap = _current
+    if snap is not None and snap.version == version:
+        return snap
+
+    with _lock:
+        snap = _current
+        if snap is None or snap.version != version:
+            if snap is None or snap.version > version or version - snap.version > FULL_RELOAD_AFTER:
+                snap = _full_load(version)
+            else:
+                snap = _apply_changes(snap, version)
+            if not connection.in_atomic_block:
+                _current = snap
+    return snap
@@ -0,0 +1,245 @@
+"""
+What-if forecast scenarios, evaluated in memory without touching Forecast rows.
+
+The forecast data is held as a cube: one row per Forecast, one column per
+month bucket ("Jan-2026", or "January" for dates without a year), with
+quantity and unit price in flat array('d') grids. Baseline monthly totals
+are computed once per cube. A scenario's rules (by customer, part, month
+range and year; percent or absolute quantity change) rewrite only the cells
+they select, and the monthly totals are corrected by those cells' deltas.
+So a scenario costs what it touches, not the size of the history.
+
+The cube follows the change log like the read model in readmodel.py: it is
+rebuilt only when forecast or customer events were logged since its version,
+so BOM edits do not cost a rebuild.
+"""
+import re
+import threading
+from array import array
+from collections import defaultdict
+
+from django.db import connection
+
+from .importing import month_index_from_string
+from .models import ChangeEvent, Customer, Forecast
+from .readmodel import current_version
+
+
+MAX_SCENARIOS = 100
+MAX_RULES = 100
+
+_YEAR = re.compile(r"\b(\d{4})\b")
+_MONTH_NAMES = [
+    "January", "February", "March", "April", "May", "June",
+    "July", "August", "September", "October", "November", "December",
+]
+
+
+class ScenarioError(ValueError):
+    pass
+
+
+def _bucket(date):
+    """(sort key, label, month, year) of a monthly_forecasts date string."""
+    raw = str(date or "").strip()
+    month = month_index_from_string(raw)
+    if month is None:
+        return (1, 0, 0, raw), raw, None, None
+    hit = _YEAR.search(raw)
+    year = int(hit.group(1)) if hit else None
+    label = f"{_MONTH_NAMES[month - 1][:3]}-{year}" if year else _MONTH_NAMES[month - 1]
+    return (0, year or 0, month, ""), label, month, year
+
+
+def _num(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class ForecastCube:
+    def __init__(self, version, forecasts):
+        self.version = version
+        cells = {}        # (row, column key) -> [quantity, amount]
+        buckets = {}      # column key -> (label, month, year)
+        self.rows_by_customer = defaultdict(list)
+        self.rows_by_part = defaultdict(list)
+        self.rows_by_customer_part = defaultdict(list)
+
+        n_rows = 0
+        for name_key, part_number, monthly in forecasts:
+            r = n_rows
+            n_rows += 1
+            part_number = (part_number or "").strip()
+            self.rows_by_customer[name_key].append(r)
+            self.rows_by_part[part_number].append(r)
+            self.rows_by_customer_part[(name_key, part_number)].append(r)
+            for m in monthly or []:
+                if not isinstance(m, dict):
+                    continue
+                key, label, month, year = _bucket(m.get("date"))
+                buckets.setdefault(key, (label, month, year))
+                qty = _num(m.get("quantity"))
+                cell = cells.setdefault((r, key), [0.0, 0.0])
+                cell[0] += qty
+                cell[1] += qty * _num(m.get("unit_price"))
+
+        keys = sorted(buckets)
+        col_of = {key: c for c, key in enumerate(keys)}
+        self.labels = [buckets[k][0] for k in keys]
+        self.months = [buckets[k][1] for k in keys]
+        self.years = [buckets[k][2] for k in keys]
+        self.n_rows = n_rows
+        self.n_cols = n_cols = len(keys)
+
+        size = n_rows * n_cols
+        self.qty = array("d", bytes(8 * size))
+        self.price = array("d", bytes(8 * size))
+        self.present = bytearray(size)
+        self.base_qty = [0.0] * n_cols
+        self.base_amount = [0.0] * n_cols
+        for (r, key), (qty, amount) in cells.items():
+            c = col_of[key]
+            i = r * n_cols + c
+            self.qty[i] = qty
+            # Amount-weighted price, so duplicate entries for a month keep their total.
+            self.price[i] = amount / qty if qty else 0.0
+            self.present[i] = 1
+            self.base_qty[c] += qty
+            self.base_amount[c] += amount
+
+    def _rows(self, customer_key, part_number):
+        if customer_key and part_number:
+            return self.rows_by_customer_part.get((customer_key, part_number), [])
+        if customer_key:
+            return self.rows_by_customer.get(customer_key, [])
+        if part_number:
+            return self.rows_by_part.get(part_number, [])
+        return range(self.n_rows)
+
+    def _columns(self, from_month, to_month, year):
+        if from_month is None and to_month is None and year is None:
+            return range(self.n_cols)
+        lo, hi = from_month or 1, to_month or 12
+        if lo > hi:
+            lo, hi = hi, lo
+        return [
+            c for c in range(self.n_cols)
+            if self.months[c] is not None
+            and lo <= self.months[c] <= hi
+            and (year is None or self.years[c] == year)
+        ]
+
+    def evaluate(self, rules):
+        """
+        Monthly totals with `rules` applied in order (each sees the previous
+        rules' result), plus the number of cells each rule matched.
+        """
+        qty, price, present, n_cols = self.qty, self.price, self.present, self.n_cols
+        changed = {}
+        matched = []
+
+        for rule in rules:
+            rows = self._rows(rule["customer_key"], rule["part_number"])
+            cols = self._columns(rule["from_month"], rule["to_month"], rule["year"])
+            factor, delta = rule["factor"], rule["delta"]
+            hits = 0
+            for r in rows:
+                base = r * n_cols
+                for c in cols:
+                    i = base + c
+                    if not present[i]:
+                        continue
+                    q = changed.get(i, qty[i]) * factor + delta
+                    changed[i] = q if q > 0 else 0.0
+                    hits += 1
+            matched.append(hits)
+
+        month_qty = list(self.base_qty)
+        month_amount = list(self.base_amount)
+        for i, q in changed.items():
+            c = i % n_cols
+            d = q - qty[i]
+            month_qty[c] += d
+            month_amount[c] += d * price[i]
+
+        return {
+            "months": [
+                {
+                    "date": self.labels[c],
+                    "quantity": round(month_qty[c], 4),
+                    "amount": round(month_amount[c], 4),
+                    "base_quantity": round(self.base_qty[c], 4),
+                    "base_amount": round(self.base_amount[c], 4),
+                }
+                for c in range(n_cols)
+            ],
+            "total_quantity": round(sum(month_qty), 4),
+            "total_amount": round(sum(month_amount), 4),
+            "delta_amount": round(sum(month_amount) - sum(self.base_amount), 4),
+            "matched_cells": matched,
+        }
+
+
+def compile_rule(rule):
+    """Validated, normalized form of a ScenarioRuleIn; raises ScenarioError."""
+    if (rule.percent is None) == (rule.absolute is None):
+        raise ScenarioError("each rule needs exactly one of percent or absolute")
+
+    months = []
+    for field in ("from_month", "to_month"):
+        raw = (getattr(rule, field) or "").strip()
+        month = month_index_from_string(raw) if raw else None
+        if raw and month is None:
+            raise ScenarioError(f"{field} must be a month name or number (e.g. April, Apr, 4)")
+        months.append(month)
+
+    customer_name = (rule.customer_name or "").strip()
+    return {
+        "customer_key": Customer.normalize_name(customer_name) if customer_name else "",
+        "part_number": (rule.part_number or "").strip(),
+        "from_month": months[0],
+        "to_month": months[1],
+        "year": rule.year,
+        "factor": 1 + rule.percent / 100 if rule.percent is not None else 1.0,
+        "delta": rule.absolute if rule.absolute is not None else 0.0,
+    }
+
+
+def _forecasts_changed(since, until):
+    return (
+        ChangeEvent.objects
+        .filter(id__gt=since, id__lte=until, entity__in=("forecast", "customer"))
+        .exists()
+    )
+
+
+_lock = threading.Lock()
+_current = None
+
+
+def get_cube():
+    """
+    Cube at the current change-log version. Inside a transaction a private
+    cube is built, so uncommitted forecasts never reach other requests.
+    """
+    global _current
+
+    version = current_version()
+    cube = _current
+    if cube is not None and cube.version == version:
+        return cube
+
+    with _lock:
+        cube = _current
+        if cube is None or cube.version != version:
+            if cube is not None and cube.version < version and not _forecasts_changed(cube.version, version):
+                if not connection.in_atomic_block:
+                    cube.version = version
+                return cube
+            forecasts = Forecast.objects.values_list("customer__name_key", "part_number", "monthly_forecasts")
+            cube = ForecastCube(version, forecasts.order_by("id").iterator(chunk_size=2000))
+            if not connection.in_atomic_block:
+                _current = cube
+    return cube
@@ -29,6 +29,18 @@ class TEPCodeOut(Schema):
     tep_code: str
     materials: List[MaterialOut] = []
 
+class BatchOpIn(Schema):
+    op: str                  # create_tep | delete_tep | create_material | update_material | delete_material
+    tep_code: str
+    part_code: Optional[str] = None
+    customer_name: Optional[str] = None
+    mat_partcode: Optional[str] = None
+    dim_qty: Optional[float] = None
+    loss_percent: Optional[float] = None
+
+class BatchIn(Schema):
+    ops: List[BatchOpIn]
+
 class CustomerIn(Schema):
     customer_name: str
     parts: Optional[List[CustomerPart]] = None
@@ -110,3 +122,21 @@ class ForecastOut(Schema):
     monthly_forecasts: List[dict] 
 
 
+
+
+# What-if forecast scenarios (app/scenarios.py)
+class ScenarioRuleIn(Schema):
+    customer_name: Optional[str] = None   # omit for every customer
+    part_number: Optional[str] = None     # omit for every part
+    from_month: Optional[str] = None      # e.g. "Apr", "4"; omit for every month
+    to_month: Optional[str] = None
+    year: Optional[int] = None
+    percent: Optional[float] = None       # +15 -> quantity x 1.15
+    absolute: Optional[float] = None      # added to each matching month's quantity
+
+class ScenarioIn(Schema):
+    name: str
+    rules: List[ScenarioRuleIn]
+
+class ScenarioBatchIn(Schema):
+    scenarios: List[ScenarioIn]
@@ -0,0 +1,177 @@
+"""
+Slow-query log.
+
+SlowQueryMiddleware times every statement a request runs through a
+connection.execute_wrapper. A fast statement costs two clock reads and a
+comparison. A statement slower than TELS_SLOW_QUERY_MS is buffered with its
+parameters and the app frame that issued it. Once the response is built,
+each buffered statement gets an EXPLAIN QUERY PLAN (SQLite) and is saved
+as a SlowQuery row. Only the newest TELS_SLOW_QUERY_KEEP rows are kept.
+The log is read in the Django admin.
+
+TELS_SLOW_QUERY_MS = None turns the wrapper off.
+
+Under ASGI the middleware stays async. Sync views and async-ORM calls both
+run on the request's thread-sensitive thread, with that thread's
+connection, so the wrapper is installed on (and removed from) that
+connection through sync_to_async rather than on the event loop's. The
+coroutine that issued an async-ORM statement is not on that thread's
+stack, so such rows have a blank call site; the endpoint still names the
+view.
+"""
+import logging
+import os
+import sys
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, connection
+
+from .models import SlowQuery
+
+
+logger = logging.getLogger(__name__)
+
+MAX_SQL_CHARS = 20000
+MAX_PARAMS_CHARS = 2000
+_EXPLAINABLE = ("select", "with", "insert", "update", "delete")
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+_THIS_FILE = os.path.abspath(__file__)
+
+
+def _call_site():
+    """Innermost frame of this app's code (outside this module) on the stack."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(_APP_DIR) and filename != _THIS_FILE:
+            return f"{filename[len(_APP_DIR):]}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return ""
+
+
+def _format_plan(rows):
+    """EXPLAIN QUERY PLAN rows (id, parent, notused, detail) as an indented tree."""
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return "\n".join(lines)
+
+
+def explain(sql, params):
+    if connection.vendor != "sqlite" or not sql.lstrip().lower().startswith(_EXPLAINABLE):
+        return ""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return _format_plan(cursor.fetchall())
+    except DatabaseError as e:
+        return f"(EXPLAIN failed: {e})"
+
+
+class SlowQueryRecorder:
+    def __init__(self, threshold_ms):
+        self.threshold = threshold_ms / 1000
+        self.slow = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            if elapsed >= self.threshold:
+                self.slow.append((sql, params, many, elapsed, _call_site()))
+
+    def flush(self, endpoint=""):
+        """Explain and store the buffered statements; returns how many."""
+        if not self.slow:
+            return 0
+        rows = []
+        for sql, params, many, elapsed, site in self.slow:
+            # executemany: explain and show the first parameter set only.
+            if many:
+                params = next(iter(params), None)
+            rows.append(SlowQuery(
+                sql=sql[:MAX_SQL_CHARS],
+                params=repr(params)[:MAX_PARAMS_CHARS] if params is not None else "",
+                duration_ms=round(elapsed * 1000, 3),
+                endpoint=endpoint[:200],
+                call_site=site[:300],
+                plan=explain(sql, params),
+            ))
+        self.slow = []
+        SlowQuery.objects.bulk_create(rows)
+        trim(getattr(settings, "TELS_SLOW_QUERY_KEEP", 500))
+        return len(rows)
+
+
+def trim(keep):
+    cutoff = list(SlowQuery.objects.order_by("-id").values_list("id", flat=True)[keep:keep + 1])
+    if cutoff:
+        SlowQuery.objects.filter(id__lte=cutoff[0]).delete()
+
+
+def _install(recorder):
+    connection.execute_wrappers.append(recorder)
+
+
+def _uninstall(recorder):
+    connection.execute_wrappers.remove(recorder)
+
+
+def _store(recorder, request):
+    pending = len(recorder.slow)
+    if not pending:
+        return
+    match = request.resolver_match
+    endpoint = f"{request.method} {match.view_name if match else request.path}"
+    try:
+        recorder.flush(endpoint)
+    except DatabaseError:
+        logger.exception("Could not store %d slow queries", pending)
+
+
+class SlowQueryMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        threshold = getattr(settings, "TELS_SLOW_QUERY_MS", None)
+        if threshold is None:
+            return self.get_response(request)
+
+        recorder = SlowQueryRecorder(threshold)
+        try:
+            with connection.execute_wrapper(recorder):
+                response = self.get_response(request)
+        finally:
+            _store(recorder, request)
+        return response
+
+    async def __acall__(self, request):
+        threshold = getattr(settings, "TELS_SLOW_QUERY_MS", None)
+        if threshold is None:
+            return await self.get_response(request)
+
+        recorder = SlowQueryRecorder(threshold)
+        await sync_to_async(_install)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_uninstall)(recorder)
+            await sync_to_async(_store)(recorder, request)
+        return response
@@ -0,0 +1,143 @@
+"""
+Content-addressed, gzip-compressed storage for uploaded CSV files.
+
+An upload is stored once as customer_csvs/<aa>/<sha256>.csv.gz (.xlsx.gz for
+workbooks), however many CustomerCSV rows point at it. The CustomerCSV rows
+are the reference count: a blob is deleted when the last row referring to it
+is deleted (after commit). Files written before this storage existed
+(customer_csvs/*.csv) stay readable through open_text().
+
+gzip is used rather than zstd because it ships with the standard library.
+"""
+import codecs
+import gzip
+import hashlib
+import io
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils.deconstruct import deconstructible
+
+
+UPLOAD_DIR = "customer_csvs"
+BLOB_SUFFIX = ".gz"
+SNIFF_BYTES = 64 * 1024
+
+
+def blob_name(digest, ext=".csv"):
+    return f"{UPLOAD_DIR}/{digest[:2]}/{digest}{ext}{BLOB_SUFFIX}"
+
+
+def is_blob(name):
+    return (name or "").endswith(BLOB_SUFFIX)
+
+
+def hash_file(f):
+    """sha256 of a Django File, read in chunks; leaves it rewound."""
+    h = hashlib.sha256()
+    for chunk in f.chunks():
+        h.update(chunk)
+    f.seek(0)
+    return h.hexdigest()
+
+
+def csv_upload_to(instance, filename):
+    if not instance.content_hash:
+        instance.content_hash = hash_file(instance.csv_file.file)
+    ext = ".xlsx" if (filename or "").lower().endswith(".xlsx") else ".csv"
+    return blob_name(instance.content_hash, ext)
+
+
+@deconstructible
+class CompressedCSVStorage(FileSystemStorage):
+    """
+    FileSystemStorage that gzips content-addressed names on the way in and
+    never duplicates them: saving a blob that already exists is a no-op.
+    Other names are stored unchanged.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        if is_blob(name):
+            return name
+        return super().get_available_name(name, max_length=max_length)
+
+    def _save(self, name, content):
+        if not is_blob(name):
+            return super()._save(name, content)
+        if self.exists(name):
+            return name
+
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+
+        # Compress next to the target and rename, so readers never see a partial blob.
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out, gzip.GzipFile(fileobj=out, mode="wb", mtime=0) as gz:
+                for chunk in content.chunks():
+                    gz.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return name
+
+
+_storage = CompressedCSVStorage()
+
+
+def csv_storage():
+    return _storage
+
+
+def open_binary(field_file):
+    """Decompressed byte stream of a stored upload."""
+    raw = field_file.storage.open(field_file.name, "rb")
+    if is_blob(field_file.name):
+        return gzip.GzipFile(fileobj=raw, mode="rb")
+    return raw
+
+
+def _sniff_encoding(head):
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1252"
+
+
+def open_text(field_file):
+    """
+    Text stream over a stored upload, decoded on the fly. The encoding is
+    picked from the first 64 KiB (BOM, else UTF-8 if it decodes, else cp1252)
+    so the file is never held in memory as a whole.
+    """
+    stream = open_binary(field_file)
+    head = stream.read(SNIFF_BYTES)
+    stream.seek(0)
+    return io.TextIOWrapper(stream, encoding=_sniff_encoding(head), errors="replace", newline="")
+
+
+@receiver(post_delete, sender="app.CustomerCSV")
+def _release_blob(sender, instance, **kwargs):
+    name = instance.csv_file.name
+    if not name:
+        return
+    storage = instance.csv_file.storage
+
+    def release():
+        if not sender.objects.filter(csv_file=name).exists():
+            storage.delete(name)
+
+    transaction.on_commit(release)
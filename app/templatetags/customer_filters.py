@@ -0,0 +1,11 @@
+from django import template
+
+register = template.Library()
+
+
+@register.filter
+def get_item(mapping, key):
+    """mapping[key] in templates; None when the key or mapping is missing."""
+    if not hasattr(mapping, "get"):
+        return None
+    return mapping.get(key)
@@ -1,3 +1,1086 @@
-from django.test import TestCase
+"""
+Scaling regression tests, plus behaviour tests for the pieces they rely on.
 
-# Create your tests here.
+Each endpoint is exercised against the same schema seeded at growing sizes;
+its query count must not change with the amount of data (an N+1 shows up as
+a count that grows). CSV import is held to a per-row query and time budget.
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import zipfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from .changes import record_instances
+from .importing import import_bom, upsert_forecasts
+from .models import ChangeEvent, Customer, CustomerCSV, Forecast, Material, MaterialList, SlowQuery, TEPCode
+from .pagination import decode_cursor, paginate_queryset, paginate_sequence
+from .propagation import apply_master_changes, propagate_masters
+from .readmodel import FULL_RELOAD_AFTER
+from .scenarios import MAX_RULES, MAX_SCENARIOS
+from .storage import blob_name, open_text
+from .trigram import search_masters
+from .views import build_customer_table
+from .xlsx import xlsx_rows
+
+
+# (customers, parts per customer, TEPs per part, materials per TEP); each
+# step adds to what the previous ones seeded.
+SIZES = [(1, 1, 1, 1), (2, 2, 2, 3), (4, 3, 2, 5)]
+
+# Budgets for BOM import on SQLite; the writer works per batch, so even one
+# query per row means a per-row lookup crept back in.
+IMPORT_QUERIES_PER_ROW = 1
+IMPORT_MS_PER_ROW = 15.0
+
+
+_seq = 0
+
+
+def seed(customers, parts, teps, materials):
+    """Add one dataset of the given shape; returns the customers created."""
+    global _seq
+    _seq += 1
+    tag = f"S{_seq}"
+
+    masters = MaterialList.objects.bulk_create([
+        MaterialList(mat_partcode=f"{tag}-M{i}", mat_partname=f"Wire {tag} {i}", mat_maker="Yazaki", unit="m")
+        for i in range(materials)
+    ])
+    record_instances(masters, "create")
+
+    custs = Customer.objects.bulk_create([
+        Customer(
+            customer_name=f"Customer {tag}-{c}",
+            parts=[{"Partcode": f"{tag}-{c}-P{p}", "Partname": f"Harness {p}"} for p in range(parts)],
+        )
+        for c in range(customers)
+    ])
+    record_instances(custs, "create")
+
+    tep_rows = TEPCode.objects.bulk_create([
+        TEPCode(customer=cust, part_code=f"{tag}-{c}-P{p}", tep_code=f"{tag}-{c}-P{p}-T{t}")
+        for c, cust in enumerate(custs)
+        for p in range(parts)
+        for t in range(teps)
+    ])
+    record_instances(tep_rows, "create")
+
+    mat_rows = Material.objects.bulk_create([
+        Material(
+            tep_code=tep, mat_partcode=m.mat_partcode, mat_partname=m.mat_partname,
+            mat_maker=m.mat_maker, unit=m.unit, dim_qty=1.5, loss_percent=10.0, total=1.65,
+        )
+        for tep in tep_rows
+        for m in masters
+    ])
+    record_instances(mat_rows, "create")
+
+    fc_rows = Forecast.objects.bulk_create([
+        Forecast(
+            customer=cust, part_number=f"{tag}-{c}-P{p}", part_name=f"Harness {p}",
+            monthly_forecasts=[{"date": "Jan-2026", "unit_price": 1.0, "quantity": 100}],
+        )
+        for c, cust in enumerate(custs)
+        for p in range(parts)
+    ])
+    record_instances(fc_rows, "create")
+    return custs
+
+
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser("budget-admin", password="x")
+        self.client.force_login(self.admin)
+
+    def assertConstantQueries(self, run):
+        """Seed each size in turn and run `run(largest_customer)`; the counts must match."""
+        counts = []
+        for size in SIZES:
+            custs = seed(*size)
+            cache.clear()
+            with CaptureQueriesContext(connection) as ctx:
+                run(custs[-1])
+            counts.append(len(ctx))
+        self.assertEqual(
+            len(set(counts)), 1,
+            f"query count grows with data size: {dict(zip(SIZES, counts))}",
+        )
+        return counts[0]
+
+    def get_ok(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response
+
+    def test_customers_tree(self):
+        self.assertConstantQueries(lambda cust: self.get_ok("/api/customers"))
+
+    def test_customers_tree_search(self):
+        self.assertConstantQueries(lambda cust: self.get_ok("/api/customers?q=wire"))
+
+    def test_tree(self):
+        self.assertConstantQueries(
+            lambda cust: self.get_ok(f"/api/tree?customer_ids={cust.id}&fields=mat_partcode,total")
+        )
+
+    def test_forecast_scenarios(self):
+        body = {"scenarios": [{"name": "q1", "rules": [{"from_month": "Jan", "to_month": "Mar", "percent": 15}]}]}
+        self.assertConstantQueries(
+            lambda cust: self.assertEqual(
+                self.client.post("/api/forecasts/scenarios", body, content_type="application/json").status_code, 200
+            )
+        )
+
+    def test_output_format(self):
+        self.assertConstantQueries(lambda cust: self.get_ok("/api/output-format"))
+
+    def test_list_tep_codes(self):
+        self.assertConstantQueries(lambda cust: self.get_ok(f"/api/customers/{cust.id}/tep-codes"))
+
+    def test_build_customer_table(self):
+        def run(cust):
+            page = build_customer_table("")
+            self.assertTrue(len(list(page)))
+        self.assertConstantQueries(run)
+
+    def test_build_customer_table_search(self):
+        self.assertConstantQueries(lambda cust: list(build_customer_table("customer")))
+
+    def test_admin_changelists(self):
+        for model in ("customer", "tepcode", "material", "materiallist", "forecast", "changeevent"):
+            with self.subTest(model=model):
+                self.assertConstantQueries(lambda cust: self.get_ok(f"/admin/app/{model}/"))
+
+
+@override_settings(TELS_IMPORT_PARALLEL_MIN_ROWS=10 ** 9)
+class ImportBudgetTests(TestCase):
+    HEADER = [
+        "customer_name", "Partcode", "Partname", "tep_code",
+        "mat_partcode", "mat_partname", "mat_maker", "unit", "dim_qty", "loss_percent",
+    ]
+
+    def rows(self, n, tag):
+        return [
+            [
+                f"Import {tag} {i % 5}", f"{tag}-P{i % 10}", f"Harness {i % 10}", f"{tag}-T{i % 20}",
+                f"{tag}-M{i}", f"Wire {tag} {i}", "Sumitomo", "m", "2.5", "10",
+            ]
+            for i in range(n)
+        ]
+
+    def test_bom_import_per_row_budget(self):
+        for n in (100, 400):
+            with self.subTest(rows=n):
+                with CaptureQueriesContext(connection) as ctx:
+                    started = time.perf_counter()
+                    result = import_bom(self.HEADER, self.rows(n, f"R{n}"))
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+
+                self.assertEqual(result["inserted"], n)
+                self.assertLessEqual(len(ctx) / n, IMPORT_QUERIES_PER_ROW)
+                self.assertLessEqual(elapsed_ms / n, IMPORT_MS_PER_ROW)
+
+    def test_bom_reimport_skips_rows_cheaply(self):
+        rows = self.rows(200, "again")
+        first = import_bom(self.HEADER, rows)
+        with CaptureQueriesContext(connection) as ctx:
+            second = import_bom(self.HEADER, rows, skip_hashes=set(first["row_hashes"]))
+        self.assertEqual(second["skipped"], 200)
+        self.assertLessEqual(len(ctx), 5)
+
+
+@override_settings(TELS_IMPORT_PARALLEL_MIN_ROWS=10 ** 9, TELS_IMPORT_CHUNK_ROWS=2)
+class BomImportTests(TestCase):
+    """import_bom writes per batch; chunks of two rows make every rule cross a batch boundary."""
+
+    HEADER = ImportBudgetTests.HEADER
+
+    def row(self, code, name="TAPE", tep="T1", dim="2", loss="10", customer="Acme", part="P1"):
+        return [customer, part, "Harness", tep, code, name, "Yazaki", "m", dim, loss]
+
+    def names(self, tep="T1"):
+        return dict(Material.objects.filter(tep_code__tep_code=tep).values_list("mat_partcode", "mat_partname"))
+
+    def test_material_names_are_numbered_per_tep(self):
+        import_bom(self.HEADER, [self.row("M1"), self.row("M2"), self.row("M3"), self.row("M4", tep="T2")])
+        self.assertEqual(self.names(), {"M1": "TAPE 1", "M2": "TAPE 2", "M3": "TAPE 3"})
+        self.assertEqual(self.names("T2"), {"M4": "TAPE"})
+
+        import_bom(self.HEADER, [self.row("M5")])
+        self.assertEqual(self.names()["M5"], "TAPE 4")
+
+    def test_repeated_rows_update_the_same_material(self):
+        first = import_bom(self.HEADER, [self.row("M1", dim="2"), self.row("M1", dim="3", loss="0")])
+        self.assertEqual((first["inserted"], first["updated"]), (1, 1))
+        m = Material.objects.get()
+        self.assertEqual((m.dim_qty, m.loss_percent, m.total), (3.0, 10.0, 3.3))
+
+        second = import_bom(self.HEADER, [self.row("M1", dim="0", loss="50")])
+        self.assertEqual((second["inserted"], second["updated"]), (0, 1))
+        m.refresh_from_db()
+        self.assertEqual((m.dim_qty, m.loss_percent, m.total), (3.0, 50.0, 4.5))
+        self.assertEqual(m.mat_partname, "TAPE")
+
+    def test_customers_parts_and_teps_are_created_once(self):
+        Customer.objects.create(customer_name="Acme", parts=[{"Partcode": "P0", "Partname": "Old"}])
+        import_bom(self.HEADER, [
+            self.row("M1"), self.row("M2", part="P2", tep="T2"), self.row("M3", part="P2", tep="T2"),
+            self.row("M4", customer="Beta"), self.row("M5", part="P2", tep="T2"),
+        ])
+        acme = Customer.objects.get(customer_name="Acme")
+        self.assertEqual([p["Partcode"] for p in acme.parts], ["P0", "P1", "P2"])
+        self.assertEqual(Customer.objects.get(customer_name="Beta").name_key, Customer.normalize_name("Beta"))
+        self.assertEqual(
+            sorted(TEPCode.objects.values_list("customer__customer_name", "part_code", "tep_code")),
+            [("Acme", "P1", "T1"), ("Acme", "P2", "T2"), ("Beta", "P1", "T1")],
+        )
+        self.assertEqual(Material.objects.filter(tep_code__tep_code="T2").count(), 3)
+
+    def test_upload_rolls_back_when_the_import_cannot_be_recorded(self):
+        self.client.force_login(User.objects.create_superuser("upload-admin", password="x"))
+        body = ",".join(self.HEADER) + "\n" + ",".join(self.row("M1")) + "\n"
+        with mock.patch("app.api.record_import", side_effect=OSError("disk full")):
+            response = self.client.post(
+                "/api/upload-csv", {"file": SimpleUploadedFile("bom.csv", body.encode("utf-8"))}
+            )
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(Material.objects.exists())
+
+
+class ForecastUpsertTests(TestCase):
+    def setUp(self):
+        self.acme = Customer.objects.create(customer_name="Acme", parts=[])
+        for n in range(20):
+            Forecast.objects.create(customer=self.acme, part_number=f"P{n}", part_name="Old", monthly_forecasts=[])
+        self.newer_p1 = Forecast.objects.create(customer=self.acme, part_number="P1", part_name="Dup", monthly_forecasts=[])
+
+    def test_reads_only_the_files_part_numbers(self):
+        monthly = [{"date": "Jan-2026", "unit_price": 1.0, "quantity": 2.0}]
+        grouped = {("Acme", "P1", "Harness"): monthly, ("Acme", "P7", ""): monthly, ("Acme", "NEW", "Loom"): monthly}
+        with mock.patch("app.importing.FORECAST_LOOKUP_CHUNK", 2), CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(upsert_forecasts(grouped), (1, 2))
+
+        reads = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith('SELECT') and '"app_forecast"' in q["sql"]]
+        self.assertEqual(len(reads), 2)
+        self.assertTrue(all('"part_number" IN' in sql for sql in reads))
+
+        rows = {
+            f.id: (f.part_number, f.part_name, f.monthly_forecasts)
+            for f in Forecast.objects.filter(part_number__in=["P1", "P7", "NEW", "P2"])
+        }
+        self.assertEqual(rows[Forecast.objects.filter(part_number="P1").order_by("id")[0].id], ("P1", "Harness", monthly))
+        self.assertEqual(rows[self.newer_p1.id], ("P1", "Dup", []))
+        self.assertIn(("P7", "Old", monthly), rows.values())
+        self.assertIn(("NEW", "Loom", monthly), rows.values())
+        self.assertIn(("P2", "Old", []), rows.values())
+
+
+class UploadDedupTests(TestCase):
+    """/api/upload-csv skips a re-sent file outright and rows the previous import already had."""
+
+    HEADER = ImportBudgetTests.HEADER
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client.force_login(User.objects.create_superuser("dedup-admin", password="x"))
+
+    def upload(self, *codes, dim="2"):
+        lines = [",".join(self.HEADER)] + [
+            ",".join(["Acme", "P1", "Harness", "T1", code, "TAPE", "Yazaki", "m", dim, "10"]) for code in codes
+        ]
+        body = ("\n".join(lines) + "\n").encode("utf-8")
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/upload-csv", {"file": SimpleUploadedFile("bom.csv", body)})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_identical_upload_imports_nothing(self):
+        first = self.upload("M1", "M2")
+        self.assertEqual(first["inserted_materials"], 2)
+        events = ChangeEvent.objects.count()
+
+        again = self.upload("M1", "M2")
+        self.assertTrue(again["duplicate"])
+        self.assertEqual((again["inserted_materials"], again["skipped_rows"]), (0, 2))
+        self.assertEqual(CustomerCSV.objects.count(), 1)
+        self.assertEqual(ChangeEvent.objects.count(), events)
+
+    def test_rows_seen_in_the_previous_import_are_skipped(self):
+        self.upload("M1", "M2")
+        Material.objects.filter(mat_partcode="M1").update(dim_qty=7)
+
+        result = self.upload("M1", "M2", "M3")
+        self.assertNotIn("duplicate", result)
+        self.assertEqual((result["inserted_materials"], result["updated_materials"], result["skipped_rows"]), (1, 0, 2))
+        # The unchanged row was not re-applied over the manual edit.
+        self.assertEqual(Material.objects.get(mat_partcode="M1").dim_qty, 7.0)
+
+        changed = self.upload("M1", "M2", "M3", dim="5")
+        self.assertEqual((changed["updated_materials"], changed["skipped_rows"]), (3, 0))
+        self.assertEqual(CustomerCSV.objects.count(), 3)
+
+
+def _xlsx(rows_xml, shared=(), sheet="worksheets/data.xml"):
+    """Minimal workbook: one sheet at `sheet`, a shared-string table and a date style (cellXfs index 1)."""
+    ns = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+    rel_ns = 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr("xl/workbook.xml", f'<workbook {ns} {rel_ns}><sheets><sheet name="BOM" sheetId="1" r:id="rId7"/></sheets></workbook>')
+        zf.writestr(
+            "xl/_rels/workbook.xml.rels",
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'<Relationship Id="rId7" Target="{sheet}"/></Relationships>',
+        )
+        zf.writestr("xl/sharedStrings.xml", f"<sst {ns}>" + "".join(f"<si>{si}</si>" for si in shared) + "</sst>")
+        zf.writestr("xl/styles.xml", f'<styleSheet {ns}><cellXfs><xf numFmtId="0"/><xf numFmtId="17"/></cellXfs></styleSheet>')
+        zf.writestr(f"xl/{sheet}", f"<worksheet {ns}><sheetData>{rows_xml}</sheetData></worksheet>")
+    buf.seek(0)
+    return buf
+
+
+class XlsxTests(TestCase):
+    def test_cell_types_and_gaps(self):
+        book = _xlsx(
+            '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="s"><v>1</v></c><c r="C1" t="inlineStr"><is><t>Qty</t></is></c></row>'
+            '<row r="2"><c r="A2" t="s"><v>2</v></c><c r="C2"><v>2.5</v></c><c r="D2" t="b"><v>1</v></c></row>'
+            '<row r="3"><c r="B3" s="1"><v>46023</v></c></row>',
+            shared=["<t>\ufeffPart </t>", "<r><t>Mon</t></r><r><t>th</t></r><rPh><t>x</t></rPh>", "<t>P1</t>"],
+        )
+        header, rows = xlsx_rows(book)
+        self.assertEqual(header, ["Part", "Month", "Qty"])
+        self.assertEqual(list(rows), [["P1", "", "2.5", "TRUE"], ["", "Jan-2026"]])
+
+    def test_xlsx_upload_imports_like_csv(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        self.client.force_login(User.objects.create_superuser("xlsx-admin", password="x"))
+        cells = [ImportBudgetTests.HEADER, ["Acme", "P1", "Harness", "T1", "M1", "TAPE", "Yazaki", "m", "2", "10"]]
+        rows_xml = "".join(
+            "<row>" + "".join(f'<c t="inlineStr"><is><t>{v}</t></is></c>' for v in row) + "</row>" for row in cells
+        )
+        upload = SimpleUploadedFile("bom.xlsx", _xlsx(rows_xml).getvalue())
+        with override_settings(MEDIA_ROOT=media), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/upload-csv", {"file": upload})
+        self.assertEqual(response.status_code, 200, response.content)
+        m = Material.objects.get()
+        self.assertEqual((m.tep_code.tep_code, m.mat_partcode, m.dim_qty, m.total), ("T1", "M1", 2.0, 2.2))
+
+
+class PropagationTests(TestCase):
+    """Master edits reach the Material rows copied from them."""
+
+    def setUp(self):
+        self.master = MaterialList.objects.create(mat_partcode="M1", mat_partname="TAPE", mat_maker="Yazaki", unit="m")
+        cust = Customer.objects.create(customer_name="Acme", parts=[{"Partcode": "P1", "Partname": "Harness"}])
+        for tep_code in ("T1", "T2"):
+            tep = TEPCode.objects.create(customer=cust, part_code="P1", tep_code=tep_code)
+            Material.objects.create(
+                tep_code=tep, mat_partcode="M1", mat_partname="TAPE 1", mat_maker="Yazaki", unit="m",
+                dim_qty=1, loss_percent=0, total=1,
+            )
+
+    def materials(self):
+        return sorted(Material.objects.values_list("mat_partcode", "mat_partname", "mat_maker", "unit"))
+
+    def test_changes_and_renames_are_applied(self):
+        MaterialList.objects.filter(id=self.master.id).update(mat_partcode="M1X", mat_maker="Sumitomo", unit="pc")
+        events = ChangeEvent.objects.count()
+        self.assertEqual(apply_master_changes({"M1": self.master.id}), 2)
+        self.assertEqual(self.materials(), [("M1X", "TAPE 1", "Sumitomo", "pc")] * 2)
+        self.assertEqual(ChangeEvent.objects.count() - events, 2)
+
+        # Already current: nothing written, nothing logged.
+        self.assertEqual(apply_master_changes({"M1X": self.master.id}), 0)
+        self.assertEqual(ChangeEvent.objects.count() - events, 2)
+
+    def test_rename_does_not_duplicate_a_code_within_a_tep(self):
+        t1 = TEPCode.objects.get(tep_code="T1")
+        Material.objects.create(tep_code=t1, mat_partcode="M1X", mat_partname="TAPE 2", dim_qty=5, loss_percent=0, total=5)
+        MaterialList.objects.filter(id=self.master.id).update(mat_partcode="M1X")
+
+        with self.assertLogs("app.propagation", "WARNING"):
+            self.assertEqual(apply_master_changes({"M1": self.master.id}), 1)
+        self.assertEqual(
+            sorted(Material.objects.values_list("tep_code__tep_code", "mat_partcode", "dim_qty")),
+            [("T1", "M1", 1.0), ("T1", "M1X", 5.0), ("T2", "M1X", 1.0)],
+        )
+
+    def test_default_mode_waits_for_commit(self):
+        MaterialList.objects.filter(id=self.master.id).update(mat_maker="Sumitomo")
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            propagate_masters({"M1": self.master.id, "": self.master.id})
+            self.assertEqual({row[2] for row in self.materials()}, {"Yazaki"})
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual({row[2] for row in self.materials()}, {"Sumitomo"})
+
+    @override_settings(TELS_MASTER_PROPAGATION="inline")
+    def test_bom_import_propagates_master_edits(self):
+        import_bom(ImportBudgetTests.HEADER, [["Beta", "P9", "Loom", "T9", "M1", "TAPE", "Furukawa", "pc", "1", "0"]])
+        self.assertEqual(
+            sorted(Material.objects.values_list("tep_code__tep_code", "mat_maker", "unit")),
+            [("T1", "Furukawa", "pc"), ("T2", "Furukawa", "pc"), ("T9", "Furukawa", "pc")],
+        )
+
+
+class WhereUsedTests(TransactionTestCase):
+    """
+    The where-used cache is per code and survives edits that do not concern
+    it. A TransactionTestCase: nothing is cached inside a transaction.
+    """
+
+    def setUp(self):
+        cache.clear()
+        MaterialList.objects.create(mat_partcode="M1", mat_partname="TAPE", mat_maker="Yazaki", unit="m")
+        self.acme = Customer.objects.create(customer_name="Acme", parts=[{"Partcode": "P1", "Partname": "Harness"}])
+        self.t1 = TEPCode.objects.create(customer=self.acme, part_code="P1", tep_code="T1")
+        self.t2 = TEPCode.objects.create(customer=self.acme, part_code="P1", tep_code="T2")
+        self.m1 = Material.objects.create(tep_code=self.t1, mat_partcode="M1", mat_partname="TAPE", dim_qty=2, loss_percent=0, total=2)
+        self.other = Material.objects.create(tep_code=self.t2, mat_partcode="M9", mat_partname="WIRE", dim_qty=1, loss_percent=0, total=1)
+
+    def get(self, code="M1"):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f"/api/master/materials/{code}/where-used")
+        rebuilt = any("SUM(" in q["sql"].upper() for q in ctx.captured_queries)
+        return response, rebuilt
+
+    def test_unrelated_edits_keep_the_cached_answer(self):
+        first, rebuilt = self.get()
+        self.assertTrue(rebuilt)
+        self.assertEqual(first.json()["usages"][0]["tep_code"], "T1")
+
+        self.other.dim_qty = 5
+        self.other.save()
+        MaterialList.objects.create(mat_partcode="M9", mat_partname="WIRE", mat_maker="Yazaki", unit="m")
+        Customer.objects.create(customer_name="Beta")
+        again, rebuilt = self.get()
+        self.assertFalse(rebuilt)
+        self.assertEqual(again.json(), first.json())
+
+    def test_edits_that_concern_the_code_rebuild_it(self):
+        self.get()
+        self.m1.total = 7
+        self.m1.save()
+        response, rebuilt = self.get()
+        self.assertTrue(rebuilt)
+        self.assertEqual(response.json()["total_quantity"], 7)
+
+        self.acme.customer_name = "Acme Corp"
+        self.acme.save()
+        self.assertEqual(self.get()[0].json()["usages"][0]["customer_name"], "Acme Corp")
+
+        self.other.mat_partcode = "M1"
+        self.other.save()
+        self.assertEqual(self.get()[0].json()["tep_codes"], 2)
+
+        Material.objects.filter(tep_code=self.t1).delete()
+        self.assertEqual([u["tep_code"] for u in self.get()[0].json()["usages"]], ["T2"])
+
+    def test_unknown_code_turns_up_once_it_exists(self):
+        self.assertEqual(self.get("M5")[0].status_code, 404)
+        MaterialList.objects.create(mat_partcode="M5", mat_partname="CLIP", mat_maker="Yazaki", unit="pc")
+        response, _ = self.get("M5")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["master"]["mat_partname"], "CLIP")
+
+
+class KeysetPaginationTests(TestCase):
+    def walk(self, fetch):
+        """Follow next cursors from the first page, then prev cursors back; returns both walks."""
+        forward, pages = [], []
+        page = fetch(None)
+        while True:
+            pages.append(page)
+            forward.extend(page.items)
+            if not page.has_next:
+                break
+            page = fetch(page.next_cursor)
+        backward = []
+        while page.has_previous:
+            page = fetch(page.prev_cursor)
+            backward[:0] = page.items
+        return forward, backward, pages
+
+    def test_queryset_pages_cover_every_row_once(self):
+        seed(1, 1, 1, 23)
+        expected = list(MaterialList.objects.order_by("mat_partcode", "id").values_list("id", flat=True))
+        forward, backward, pages = self.walk(
+            lambda cur: paginate_queryset(MaterialList.objects.all(), ("mat_partcode", "id"), cur, 5)
+        )
+        self.assertEqual([m.id for m in forward], expected)
+        self.assertEqual([m.id for m in backward], expected[:-3])
+        self.assertEqual([len(p) for p in pages], [5, 5, 5, 5, 3])
+        self.assertFalse(pages[0].has_previous)
+
+    def test_queryset_descending_with_ties(self):
+        MaterialList.objects.bulk_create([MaterialList(mat_partcode=f"T{i}", mat_maker="same") for i in range(7)])
+        expected = list(MaterialList.objects.order_by("-mat_maker", "-id").values_list("id", flat=True))
+        forward, backward, _ = self.walk(
+            lambda cur: paginate_queryset(MaterialList.objects.all(), ("-mat_maker", "-id"), cur, 3)
+        )
+        self.assertEqual([m.id for m in forward], expected)
+        self.assertEqual([m.id for m in backward], expected[:-1])
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        seed(1, 1, 1, 4)
+        first = paginate_queryset(MaterialList.objects.all(), ("mat_partcode", "id"), None, 2)
+        for token in ("garbage", "bnVsbA", first.next_cursor[:-2]):
+            with self.subTest(token=token):
+                page = paginate_queryset(MaterialList.objects.all(), ("mat_partcode", "id"), token, 2)
+                self.assertEqual([m.id for m in page], [m.id for m in first])
+        self.assertEqual(decode_cursor("garbage"), (None, None))
+
+    def test_sequence_pages_both_directions(self):
+        items = [(i // 3, i) for i in range(10)]
+        for descending in (False, True):
+            with self.subTest(descending=descending):
+                forward, backward, pages = self.walk(
+                    lambda cur: paginate_sequence(items, lambda x: x, cur, 4, descending=descending)
+                )
+                expected = items[::-1] if descending else items
+                self.assertEqual(forward, expected)
+                self.assertEqual(backward, expected[:8])
+                self.assertEqual({p.count for p in pages}, {10})
+
+
+class DashboardRenderTests(TestCase):
+    """Every dashboard tab renders, including pages reached through a cursor."""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser("render-admin", password="x"))
+        seed(3, 4, 1, 12)
+
+    def render(self, query):
+        response = self.client.get(f"/panel/dashboard/?{query}")
+        self.assertEqual(response.status_code, 200, query)
+        return response
+
+    def test_tabs_render(self):
+        for tab in ("customers", "materials", "users", "forecast", "forecast_summary"):
+            with self.subTest(tab=tab):
+                self.assertEqual(self.render(f"tab={tab}").context["tab"], tab)
+
+    def test_materials_next_page(self):
+        first = self.render("tab=materials").context["material_list"]
+        self.assertTrue(first.has_next)
+        second = self.render(f"tab=materials&mcur={first.next_cursor}").context["material_list"]
+        self.assertTrue(second.has_previous)
+        self.assertFalse({m.id for m in first} & {m.id for m in second})
+
+    def test_materials_search(self):
+        page = self.render("tab=materials&mq=wire").context["material_list"]
+        self.assertTrue(len(page))
+
+    def test_forecast_next_page(self):
+        first = self.render("tab=forecast").context["forecasts_list"]
+        self.assertTrue(first.has_next)
+        second = self.render(f"tab=forecast&fcur={first.next_cursor}").context["forecasts_list"]
+        self.assertEqual(len(first) + len(second), Forecast.objects.count())
+
+
+class UploadStoreTests(TestCase):
+    """Content-addressed upload storage and tels_prune_uploads, in a scratch MEDIA_ROOT."""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def store(self, body, kind="bom", name="upload.csv"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return CustomerCSV.objects.create(kind=kind, csv_file=SimpleUploadedFile(name, body))
+
+    def put(self, name, body=b"x", age=None):
+        path = os.path.join(self.media, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(body)
+        if age:
+            os.utime(path, (time.time() - age, time.time() - age))
+        return path
+
+    def prune(self, *args):
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("tels_prune_uploads", *args, stdout=out)
+        return out.getvalue()
+
+    def test_identical_uploads_share_one_compressed_blob(self):
+        body = "customer_name,Partcode\nAcme,P1\n".encode("utf-8")
+        first, second = self.store(body), self.store(body)
+        self.assertEqual(first.csv_file.name, second.csv_file.name)
+        self.assertEqual(first.csv_file.name, blob_name(first.content_hash))
+        with open_text(second.csv_file) as f:
+            self.assertEqual(f.read().encode("utf-8"), body)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(os.path.join(self.media, second.csv_file.name)))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(os.path.join(self.media, second.csv_file.name)))
+
+    def test_retention_keeps_newest_per_kind(self):
+        boms = [self.store(f"bom {i}\n".encode()) for i in range(3)]
+        master = self.store(b"master\n", kind="master")
+        self.prune("--keep", "1")
+        self.assertEqual(set(CustomerCSV.objects.values_list("id", flat=True)), {boms[-1].id, master.id})
+        self.assertFalse(os.path.exists(os.path.join(self.media, boms[0].csv_file.name)))
+
+    def test_orphan_sweep_only_touches_old_blobs(self):
+        kept = self.store(b"referenced\n")
+        orphan = self.put(blob_name("ab" + "0" * 62), age=7200)
+        fresh = self.put(blob_name("cd" + "0" * 62))
+        stray = self.put("customer_csvs/ab/notes.txt", age=7200)
+        legacy = self.put("customer_csvs/Book2.csv", age=7200)
+
+        self.prune()
+        self.assertFalse(os.path.exists(orphan))
+        for path in (fresh, stray, legacy, os.path.join(self.media, kept.csv_file.name)):
+            self.assertTrue(os.path.exists(path), path)
+
+        self.assertIn("Would remove 1", self.prune("--include-legacy", "--dry-run"))
+        self.assertTrue(os.path.exists(legacy))
+        self.prune("--include-legacy")
+        self.assertFalse(os.path.exists(legacy))
+
+
+class ForecastScenarioTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        acme = Customer.objects.create(customer_name="Acme Corp")
+        beta = Customer.objects.create(customer_name="Beta")
+        Forecast.objects.create(customer=acme, part_number="A", monthly_forecasts=[
+            {"date": "Jan-2026", "unit_price": 2, "quantity": 100},
+            {"date": "Jan-2026", "unit_price": 4, "quantity": 100},
+            {"date": "Feb-2026", "unit_price": 2, "quantity": 50},
+            {"date": "Apr-2026", "unit_price": 1, "quantity": 10},
+        ])
+        Forecast.objects.create(customer=acme, part_number="B", monthly_forecasts=[
+            {"date": "Mar-2026", "unit_price": 5, "quantity": 40},
+        ])
+        Forecast.objects.create(customer=beta, part_number="A", monthly_forecasts=[
+            {"date": "Jan-2026", "unit_price": 1, "quantity": 10},
+            {"date": "Jan-2025", "unit_price": 1, "quantity": 20},
+        ])
+
+    def post(self, *scenarios):
+        body = {"scenarios": [{"name": f"s{i}", "rules": rules} for i, rules in enumerate(scenarios)]}
+        return self.client.post("/api/forecasts/scenarios", body, content_type="application/json")
+
+    def run_rules(self, *rules):
+        response = self.post(list(rules))
+        self.assertEqual(response.status_code, 200, response.content)
+        result = response.json()["scenarios"][0]
+        result["by_month"] = {m["date"]: (m["quantity"], m["amount"]) for m in result["months"]}
+        return result
+
+    def test_baseline_uses_weighted_unit_price(self):
+        result = self.run_rules()
+        self.assertEqual(result["by_month"], {
+            "Jan-2025": (20, 20), "Jan-2026": (210, 610), "Feb-2026": (50, 100),
+            "Mar-2026": (40, 200), "Apr-2026": (10, 10),
+        })
+        self.assertEqual((result["total_amount"], result["delta_amount"]), (940, 0))
+
+    def test_percent_on_month_range(self):
+        result = self.run_rules({"from_month": "January", "to_month": "2", "percent": 10})
+        self.assertEqual(result["matched_cells"], [4])
+        self.assertEqual(result["by_month"]["Jan-2025"], (22, 22))
+        # Acme's two January entries price at (200 + 400) / 200 = 3 each.
+        self.assertEqual(result["by_month"]["Jan-2026"], (231, 671))
+        self.assertEqual(result["by_month"]["Feb-2026"], (55, 110))
+        self.assertEqual(result["by_month"]["Mar-2026"], (40, 200))
+        self.assertEqual(result["delta_amount"], 73)
+
+    def test_absolute_change_is_clamped_at_zero(self):
+        result = self.run_rules({"part_number": "B", "absolute": -1000})
+        self.assertEqual(result["by_month"]["Mar-2026"], (0, 0))
+        self.assertEqual(result["delta_amount"], -200)
+
+        result = self.run_rules({"part_number": "B", "absolute": 5})
+        self.assertEqual(result["by_month"]["Mar-2026"], (45, 225))
+
+    def test_rules_apply_in_order(self):
+        double = {"customer_name": "Acme Corp", "from_month": "Feb", "to_month": "Feb", "percent": 100}
+        minus = {"customer_name": "Acme Corp", "from_month": "Feb", "to_month": "Feb", "absolute": -50}
+        self.assertEqual(self.run_rules(double, minus)["by_month"]["Feb-2026"], (50, 100))
+        self.assertEqual(self.run_rules(minus, double)["by_month"]["Feb-2026"], (0, 0))
+
+    def test_rules_filter_by_customer_part_and_year(self):
+        result = self.run_rules({"customer_name": "  acme   CORP ", "part_number": "A", "year": 2026, "percent": -100})
+        self.assertEqual(result["matched_cells"], [3])
+        self.assertEqual(result["by_month"]["Jan-2026"], (10, 10))
+        self.assertEqual(result["by_month"]["Mar-2026"], (40, 200))
+
+        result = self.run_rules({"customer_name": "Beta", "year": 2025, "absolute": 1})
+        self.assertEqual(result["matched_cells"], [1])
+        self.assertEqual(result["by_month"]["Jan-2025"], (21, 21))
+        self.assertEqual(result["by_month"]["Jan-2026"], (210, 610))
+
+        self.assertEqual(self.run_rules({"customer_name": "Nobody", "percent": 50})["matched_cells"], [0])
+
+    def test_invalid_requests_are_rejected(self):
+        bad = {
+            "empty": {"scenarios": []},
+            "both": {"scenarios": [{"name": "x", "rules": [{"percent": 1, "absolute": 1}]}]},
+            "neither": {"scenarios": [{"name": "x", "rules": [{"part_number": "A"}]}]},
+            "month": {"scenarios": [{"name": "x", "rules": [{"from_month": "Smarch", "percent": 1}]}]},
+            "scenarios": {"scenarios": [{"name": "x", "rules": []}] * (MAX_SCENARIOS + 1)},
+            "rules": {"scenarios": [{"name": "x", "rules": [{"percent": 1}] * (MAX_RULES + 1)}]},
+        }
+        for case, body in bad.items():
+            with self.subTest(case=case):
+                response = self.client.post("/api/forecasts/scenarios", body, content_type="application/json")
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.json())
+
+    def test_forecasts_are_not_written(self):
+        before = list(Forecast.objects.order_by("id").values_list("monthly_forecasts", flat=True))
+        events = ChangeEvent.objects.count()
+        self.run_rules({"percent": 50}, {"absolute": -5})
+        self.assertEqual(list(Forecast.objects.order_by("id").values_list("monthly_forecasts", flat=True)), before)
+        self.assertEqual(ChangeEvent.objects.count(), events)
+
+    def test_cube_follows_forecast_changes(self):
+        self.assertEqual(self.run_rules()["by_month"]["Mar-2026"], (40, 200))
+        f = Forecast.objects.get(part_number="B")
+        f.monthly_forecasts = [{"date": "Mar-2026", "unit_price": 5, "quantity": 60}]
+        f.save()
+        self.assertEqual(self.run_rules()["by_month"]["Mar-2026"], (60, 300))
+
+
+class FuzzySearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_superuser("fuzzy-admin", password="x"))
+        seed(1, 1, 1, 6)
+        MaterialList.objects.create(mat_partcode="AVSS0.3F-BK", mat_partname="AVSS 0.3f BLACK", mat_maker="Yazaki", unit="m")
+
+    def test_near_misses_rank_below_exact_matches(self):
+        hits = search_masters("avss 0.3f blk", limit=5)
+        self.assertEqual(hits[0].mat_partcode, "AVSS0.3F-BK")
+        self.assertEqual(search_masters("AVSS0.3F", limit=5)[0].score, 1.0)
+        self.assertEqual(search_masters("zzzz", limit=5), [])
+
+    def test_index_follows_master_edits(self):
+        m = MaterialList.objects.get(mat_partcode="AVSS0.3F-BK")
+        m.mat_partname = "CAVS 0.5 RED"
+        m.save()
+        self.assertEqual(search_masters("cavs 0.5 red", limit=1)[0].id, m.id)
+        self.assertNotIn(m.id, [h.id for h in search_masters("avss black", limit=5)])
+
+    def test_dashboard_says_when_results_are_capped(self):
+        with mock.patch("app.views.FUZZY_RESULTS_LIMIT", 10):
+            response = self.client.get("/panel/dashboard/?tab=materials&mq=wire")
+        self.assertFalse(response.context["material_truncated"])
+        self.assertEqual(response.context["material_total"], 6)
+
+        with mock.patch("app.views.FUZZY_RESULTS_LIMIT", 3):
+            response = self.client.get("/panel/dashboard/?tab=materials&mq=wire")
+        self.assertTrue(response.context["material_truncated"])
+        self.assertEqual(response.context["material_total"], 3)
+        self.assertContains(response, "Showing the best 3 matches")
+
+    def test_admin_says_when_results_are_capped(self):
+        with mock.patch("app.admin.ADMIN_FUZZY_LIMIT", 3):
+            response = self.client.get("/admin/app/materiallist/?q=wire")
+        self.assertEqual(response.context["cl"].result_count, 3)
+        self.assertIn("Showing the best 3 matches", [str(m) for m in response.context["messages"]][0])
+
+        response = self.client.get("/admin/app/materiallist/?q=wire")
+        self.assertEqual(response.context["cl"].result_count, 6)
+        self.assertFalse(list(response.context["messages"]))
+
+
+class ForecastByCustomerTests(TestCase):
+    """The sync endpoint and its /api/async twin share one implementation."""
+
+    URLS = ("/api/forecasts/by-customer/{}", "/api/async/forecasts/by-customer/{}")
+
+    def setUp(self):
+        acme = Customer.objects.create(customer_name="Acme Corp")
+        Forecast.objects.create(customer=acme, part_number="B", part_name="Harness B", monthly_forecasts=[
+            {"date": "Mar-2026", "unit_price": 5, "quantity": 40},
+        ])
+        Forecast.objects.create(customer=acme, part_number="A", part_name="Harness A", monthly_forecasts=[
+            {"date": "Jan-2026", "unit_price": 2, "quantity": 100},
+            {"date": "Apr-2026", "unit_price": 1, "quantity": 10},
+        ])
+
+    def get(self, name, **params):
+        responses = [self.client.get(url.format(name), params) for url in self.URLS]
+        self.assertEqual(responses[0].status_code, responses[1].status_code)
+        self.assertEqual(responses[0].json(), responses[1].json())
+        return responses[0]
+
+    def test_month_range_totals(self):
+        response = self.get("acme  corp", from_month="Apr", to_month="1")
+        self.assertEqual(response.status_code, 200)
+        rows = response.json()
+        self.assertEqual([row["id"] for row in rows], list(
+            Forecast.objects.order_by("part_number").values_list("id", flat=True)
+        ))
+        self.assertEqual([row["total_amount_selected_months"] for row in rows], [210.0, 200.0])
+
+    def test_without_range_there_is_no_total(self):
+        rows = self.get("Acme Corp").json()
+        self.assertTrue(all("total_amount_selected_months" not in row for row in rows))
+
+    def test_errors(self):
+        self.assertEqual(self.get("Nobody").status_code, 404)
+        self.assertEqual(self.get("Acme Corp", from_month="Smarch", to_month="Apr").status_code, 400)
+        self.assertEqual(self.get("Acme Corp", from_month="Jan").status_code, 400)
+
+
+class MiddlewareModeTests(TestCase):
+    """The project's own middleware must not push ASGI requests onto a thread."""
+
+    def adapted(self):
+        with override_settings(DEBUG=True), mock.patch("django.core.handlers.base.logger") as log:
+            ASGIHandler().load_middleware(is_async=True)
+        return [c.args[1] for c in log.debug.call_args_list if "adapted" in c.args[0]]
+
+    def test_no_middleware_is_adapted(self):
+        self.assertEqual(self.adapted(), [])
+
+    @override_settings(TELS_PROFILE_DIR="/nonexistent/profiles")
+    async def test_async_requests_pass_through_unprofiled(self):
+        response = await self.async_client.get("/api/async/customers", {"_profile": "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile-Id", response)
+
+    @override_settings(TELS_SLOW_QUERY_MS=0)
+    async def test_slow_queries_are_logged_for_async_orm_calls(self):
+        await TEPCode.objects.acreate(customer=await Customer.objects.acreate(customer_name="Acme"), tep_code="T1")
+        response = await self.async_client.get("/api/async/tep-codes/T1/materials")
+        self.assertEqual(response.status_code, 200)
+        logged = [row async for row in SlowQuery.objects.order_by("id").values_list("endpoint", "sql")]
+        self.assertEqual(len(logged), 2)
+        self.assertTrue(all(endpoint.startswith("GET ") for endpoint, _ in logged))
+        self.assertIn("app_material", logged[1][1])
+        self.assertEqual(connection.execute_wrappers, [])
+
+
+class AsyncCustomerSearchTests(TestCase):
+    """/api/async/customers matches like /api/customers, non-ASCII text included."""
+
+    def setUp(self):
+        eclair = Customer.objects.create(customer_name="Éclair Wiring", parts=[{"Partcode": "P1", "Partname": "Loom"}])
+        tep = TEPCode.objects.create(customer=eclair, part_code="P1", tep_code="T-Ö1")
+        Material.objects.create(tep_code=tep, mat_partcode="M1", mat_partname="Klebeband", mat_maker="Übertech",
+                                dim_qty=1, loss_percent=0, total=1)
+        Customer.objects.create(customer_name="Acme", parts=[{"Partcode": "P2", "Partname": "Harness"}])
+
+    def names(self, q):
+        responses = [self.client.get(url, {"q": q}) for url in ("/api/customers", "/api/async/customers")]
+        self.assertEqual(responses[0].json(), responses[1].json())
+        return [c["customer_name"] for c in responses[0].json()]
+
+    def test_non_ascii_queries_fold_case_like_the_sync_view(self):
+        self.assertEqual(self.names("éCLAIR"), ["Éclair Wiring"])
+        self.assertEqual(self.names("t-ö"), ["Éclair Wiring"])
+        self.assertEqual(self.names("ÜBER"), ["Éclair Wiring"])
+        self.assertEqual(self.names("KLEBE"), ["Éclair Wiring"])
+        self.assertEqual(self.names(""), ["Acme", "Éclair Wiring"])
+        self.assertEqual(self.names("nothing"), [])
+
+
+class ChangeFeedTests(TestCase):
+    def feed(self, since=0, limit=500):
+        response = self.client.get("/api/changes", {"since": since, "limit": limit})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_saves_and_deletes_are_logged_in_order(self):
+        start = self.feed()["latest_cursor"]
+        cust = Customer.objects.create(customer_name="Acme", parts=[{"Partcode": "P1", "Partname": "Harness"}])
+        tep = TEPCode.objects.create(customer=cust, part_code="P1", tep_code="T1")
+        mat = Material.objects.create(tep_code=tep, mat_partcode="M1", dim_qty=1, loss_percent=0, total=1)
+        cust.parts = [{"Partcode": "P1", "Partname": "Harness v2"}, {"Partcode": "P2", "Partname": "New"}]
+        cust.save()
+        mat_id = mat.id
+        mat.delete()
+
+        changes = self.feed(since=start)["changes"]
+        self.assertEqual(
+            [(c["entity"], c["action"], c["key"]) for c in changes],
+            [
+                ("customer", "create", str(cust.id)),
+                ("part", "create", f"{cust.id}:P1"),
+                ("tep", "create", str(tep.id)),
+                ("material", "create", str(mat_id)),
+                ("customer", "update", str(cust.id)),
+                ("part", "update", f"{cust.id}:P1"),
+                ("part", "create", f"{cust.id}:P2"),
+                ("material", "delete", str(mat_id)),
+            ],
+        )
+        self.assertEqual(changes[-1]["data"]["mat_partcode"], "M1")
+        self.assertEqual([c["cursor"] for c in changes], sorted(c["cursor"] for c in changes))
+
+    def test_cursor_pages_through_every_event_once(self):
+        seed(2, 2, 1, 2)
+        everything = self.feed(limit=5000)
+        self.assertFalse(everything["has_more"])
+
+        seen, since = [], 0
+        while True:
+            page = self.feed(since=since, limit=3)
+            self.assertLessEqual(len(page["changes"]), 3)
+            seen.extend(c["cursor"] for c in page["changes"])
+            since = page["next_cursor"]
+            if not page["has_more"]:
+                break
+        self.assertEqual(seen, [c["cursor"] for c in everything["changes"]])
+        self.assertEqual(since, everything["latest_cursor"])
+
+        tail = self.feed(since=since)
+        self.assertEqual((tail["changes"], tail["next_cursor"], tail["has_more"]), ([], since, False))
+
+
+class BatchMutateTests(TestCase):
+    def setUp(self):
+        self.cust = Customer.objects.create(customer_name="Acme", parts=[{"Partcode": "P1", "Partname": "Harness"}])
+        self.tep = TEPCode.objects.create(customer=self.cust, part_code="P1", tep_code="T1")
+        for code in ("M1", "M2", "M3"):
+            MaterialList.objects.create(mat_partcode=code, mat_partname="TAPE", mat_maker="Yazaki", unit="m")
+        self.old = Material.objects.create(
+            tep_code=self.tep, mat_partcode="M0", mat_partname="Wire", dim_qty=1, loss_percent=0, total=1
+        )
+
+    def batch(self, *ops):
+        return self.client.post("/api/batch", {"ops": list(ops)}, content_type="application/json")
+
+    def state(self):
+        return (
+            sorted(TEPCode.objects.values_list("tep_code", flat=True)),
+            sorted(Material.objects.values_list("tep_code__tep_code", "mat_partcode", "mat_partname", "dim_qty", "total")),
+            ChangeEvent.objects.count(),
+        )
+
+    def test_ops_apply_in_order(self):
+        response = self.batch(
+            {"op": "create_tep", "tep_code": "T2", "part_code": "P1"},
+            {"op": "create_material", "tep_code": "T2", "mat_partcode": "M1", "dim_qty": 2},
+            {"op": "create_material", "tep_code": "T2", "mat_partcode": "M2", "dim_qty": 1, "loss_percent": 0},
+            {"op": "update_material", "tep_code": "T1", "mat_partcode": "M0", "dim_qty": 3, "loss_percent": 50},
+            {"op": "create_material", "tep_code": "T1", "mat_partcode": "M3", "dim_qty": 1},
+            {"op": "delete_material", "tep_code": "T1", "mat_partcode": "M3"},
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(response.json()["applied"])
+        tep_codes, materials, _ = self.state()
+        self.assertEqual(tep_codes, ["T1", "T2"])
+        self.assertEqual(materials, [
+            ("T1", "M0", "Wire", 3.0, 4.5),
+            ("T2", "M1", "TAPE 1", 2.0, 2.2),
+            ("T2", "M2", "TAPE 2", 1.0, 1.0),
+        ])
+
+    def test_one_failing_op_rolls_back_the_batch(self):
+        before = self.state()
+        response = self.batch(
+            {"op": "create_tep", "tep_code": "T2", "part_code": "P1"},
+            {"op": "update_material", "tep_code": "T1", "mat_partcode": "M0", "dim_qty": 9},
+            {"op": "create_material", "tep_code": "T1", "mat_partcode": "NOPE", "dim_qty": 1},
+            {"op": "delete_tep", "tep_code": "T1"},
+        )
+        self.assertEqual(response.status_code, 400)
+        body = response.json()
+        self.assertFalse(body["applied"])
+        self.assertEqual([r["status"] for r in body["results"]], ["ok", "ok", "error", "ok"])
+        self.assertIn("NOPE", body["results"][2]["error"])
+        self.assertEqual(self.state(), before)
+
+    def test_created_then_deleted_in_one_batch_writes_nothing(self):
+        before = self.state()
+        response = self.batch(
+            {"op": "create_tep", "tep_code": "T9", "part_code": "P1"},
+            {"op": "create_material", "tep_code": "T9", "mat_partcode": "M1", "dim_qty": 1},
+            {"op": "delete_tep", "tep_code": "T9"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.state(), before)
+
+    def test_empty_batch_is_rejected(self):
+        self.assertEqual(self.batch().status_code, 400)
+
+
+class SnapshotTests(TransactionTestCase):
+    """tels_snapshot round trip; a TransactionTestCase because restore ATTACHes outside any transaction."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        MaterialList.objects.create(mat_partcode="M1", mat_partname="TAPE", mat_maker="Yazaki", unit="m")
+        cust = Customer.objects.create(customer_name="Acme", parts=[{"Partcode": "P1", "Partname": "Harness"}])
+        tep = TEPCode.objects.create(customer=cust, part_code="P1", tep_code="T1")
+        Material.objects.create(tep_code=tep, mat_partcode="M1", mat_partname="TAPE", dim_qty=2, loss_percent=10, total=2.2)
+        Forecast.objects.create(customer=cust, part_number="P1", monthly_forecasts=[{"date": "Jan-2026", "quantity": 5}])
+
+    def snapshot(self, action, name):
+        path = os.path.join(self.dir, name)
+        call_command("tels_snapshot", action, path, stdout=StringIO())
+        return path
+
+    def dataset(self):
+        return (
+            list(MaterialList.objects.values_list("mat_partcode", "mat_partname").order_by("id")),
+            list(Customer.objects.values_list("id", "customer_name", "parts").order_by("id")),
+            list(Material.objects.values_list("id", "tep_code__tep_code", "mat_partcode", "total").order_by("id")),
+            list(Forecast.objects.values_list("id", "part_number", "monthly_forecasts").order_by("id")),
+        )
+
+    def test_restore_brings_back_the_saved_dataset(self):
+        saved = self.dataset()
+        path = self.snapshot("save", "data.sqlite3.gz")
+
+        Customer.objects.all().delete()
+        MaterialList.objects.create(mat_partcode="M2", mat_partname="WIRE", mat_maker="Yazaki", unit="m")
+        version = ChangeEvent.objects.order_by("-id").values_list("id", flat=True).first()
+
+        self.snapshot("restore", path)
+        self.assertEqual(self.dataset(), saved)
+        marker = ChangeEvent.objects.order_by("-id").first()
+        self.assertEqual(marker.data, {"restored_snapshot": True})
+        self.assertGreater(marker.id, version + FULL_RELOAD_AFTER)
+
+    def test_refuses_files_that_are_not_snapshots(self):
+        path = os.path.join(self.dir, "other.sqlite3")
+        sqlite3.connect(path).close()
+        with self.assertRaisesMessage(CommandError, "Not a tels_snapshot file"):
+            self.snapshot("restore", path)
+        self.assertEqual(Customer.objects.count(), 1)
+
+    def test_refuses_snapshots_from_another_schema(self):
+        path = self.snapshot("save", "data.sqlite3")
+        db = sqlite3.connect(path)
+        db.execute("INSERT INTO django_migrations (app, name, applied) VALUES ('app', '9999_future', '2026-01-01')")
+        db.commit()
+        db.close()
+        Customer.objects.all().delete()
+        with self.assertRaisesMessage(CommandError, "unknown migrations: 9999_future"):
+            self.snapshot("restore", path)
+        self.assertFalse(Customer.objects.exists())
@@ -0,0 +1,185 @@
+"""
+In-process trigram index over the material master list, for fuzzy search.
+
+Each master row is indexed by the trigrams of its code, name, maker and unit,
+lowercased with spaces and punctuation dropped, so "AVSS 0.3f BLACK" still
+finds "AVSS0.3F BLK". A query is scored by the share of its trigrams a row
+contains (pg_trgm's word similarity), read off an inverted index
+trigram -> row ids, so a lookup touches only the posting lists of the query.
+
+The index is built from the read model snapshot (readmodel.py) and kept
+current from the ChangeEvent log like the snapshot itself: only master rows
+named by master_material events since the index version are re-indexed.
+"""
+import heapq
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection
+
+from .models import ChangeEvent
+from .readmodel import FULL_RELOAD_AFTER, get_snapshot
+
+
+_NON_ALNUM = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalize(text):
+    return _NON_ALNUM.sub("", str(text or "").lower())
+
+
+def trigrams(text):
+    """Trigrams of the compacted text, padded so short codes still have some."""
+    s = normalize(text)
+    if not s:
+        return set()
+    s = f"  {s} "
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+class MasterHit:
+    __slots__ = ("id", "mat_partcode", "mat_partname", "mat_maker", "unit", "score")
+
+    def __init__(self, rec, score):
+        self.id = rec.id
+        self.mat_partcode = rec.mat_partcode
+        self.mat_partname = rec.mat_partname
+        self.mat_maker = rec.mat_maker
+        self.unit = rec.unit
+        self.score = score
+
+    def as_dict(self):
+        return {
+            "mat_partcode": self.mat_partcode,
+            "mat_partname": self.mat_partname,
+            "mat_maker": self.mat_maker,
+            "unit": self.unit,
+            "score": round(self.score, 4),
+        }
+
+
+class TrigramIndex:
+    def __init__(self, version, masters):
+        self.version = version
+        self.docs = {}                      # id -> (MasterRec, normalized text, trigram set)
+        self.postings = defaultdict(set)    # trigram -> ids
+        for rec in masters.values():
+            self._add(rec)
+
+    def _add(self, rec):
+        fields = (rec.mat_partcode, rec.mat_partname, rec.mat_maker, rec.unit)
+        grams = set().union(*(trigrams(f) for f in fields))
+        self.docs[rec.id] = (rec, " ".join(normalize(f) for f in fields), grams)
+        for g in grams:
+            self.postings[g].add(rec.id)
+
+    def _remove(self, mid):
+        doc = self.docs.pop(mid, None)
+        if doc is None:
+            return
+        for g in doc[2]:
+            ids = self.postings.get(g)
+            if ids is not None:
+                ids.discard(mid)
+                if not ids:
+                    del self.postings[g]
+
+    def apply(self, version, masters, ids):
+        for mid in ids:
+            self._remove(mid)
+            rec = masters.get(mid)
+            if rec is not None:
+                self._add(rec)
+        self.version = version
+
+    def search(self, q, limit=20, threshold=None):
+        """MasterHits best first; an exact substring match scores 1."""
+        if threshold is None:
+            threshold = getattr(settings, "TELS_TRIGRAM_THRESHOLD", 0.5)
+        qgrams = trigrams(q)
+        if not qgrams:
+            return []
+
+        counts = Counter()
+        for g in qgrams:
+            ids = self.postings.get(g)
+            if ids:
+                counts.update(ids)
+
+        needle = normalize(q)
+        total = len(qgrams)
+        # A substring match holds every trigram except the three padded ones,
+        # so rows below both bars are skipped before any string work.
+        substring_min = total - 3
+        min_shared = min(math.ceil(threshold * total), max(substring_min, 1))
+
+        scored = []
+        for mid, n in counts.items():
+            if n < min_shared:
+                continue
+            rec, text, _ = self.docs[mid]
+            if n >= substring_min and needle in text:
+                score = 1.0
+            else:
+                score = n / total
+            if score >= threshold:
+                scored.append((-score, rec.mat_partcode, mid))
+
+        top = sorted(scored) if limit is None else heapq.nsmallest(limit, scored)
+        return [MasterHit(self.docs[mid][0], -neg) for neg, _, mid in top]
+
+
+_lock = threading.Lock()
+_current = None
+
+
+def _changed_master_ids(since, until):
+    keys = (
+        ChangeEvent.objects
+        .filter(entity="master_material", id__gt=since, id__lte=until)
+        .values_list("object_key", flat=True)
+    )
+    ids = set()
+    for key in keys:
+        try:
+            ids.add(int(key))
+        except (TypeError, ValueError):
+            return None
+    return ids
+
+
+def get_index():
+    """
+    Trigram index at the current snapshot version. Inside a transaction the
+    published index is used as is (or a private one is built), so rows that
+    may still roll back never reach other requests.
+    """
+    global _current
+
+    snap = get_snapshot()
+    if connection.in_atomic_block:
+        return _current or TrigramIndex(snap.version, snap.masters)
+
+    with _lock:
+        idx = _current
+        if idx is not None and idx.version == snap.version:
+            return idx
+
+        ids = None
+        if idx is not None and idx.version < snap.version and snap.version - idx.version <= FULL_RELOAD_AFTER:
+            ids = _changed_master_ids(idx.version, snap.version)
+        if ids is None:
+            idx = TrigramIndex(snap.version, snap.masters)
+        else:
+            idx.apply(snap.version, snap.masters, ids)
+        _current = idx
+        return idx
+
+
+def search_masters(q, limit=20):
+    idx = get_index()
+    with _lock:
+        return idx.search(q, limit=limit)
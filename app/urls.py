@@ -9,6 +9,7 @@ urlpatterns = [
     #path('home/', views.home, name='home')
     path("", views.customer_list, name="customer_list"), 
     path("customers/tep/<int:tep_id>/", views.customer_detail, name="customer_detail"),
+    path("customers/<int:customer_id>/part-map/", views.customer_part_map, name="customer_part_map"),
     path("employees/create/", views.create_employee, name="create_employee"),
     path("api/", api.urls),
     path("admin/", admin.site.urls),
@@ -21,6 +22,8 @@ urlpatterns = [
     path("panel/csv-upload/", views.admin_csv_upload, name="admin_csv_upload"),
     path("panel/forecast-csv-upload/", views.admin_forecast_csv_upload, name="admin_forecast_csv_upload"),
     path("panel/users/<int:user_id>/toggle/", views.toggle_user_active, name="toggle_user_active"),
+    path("panel/profiles/", views.admin_profiles, name="admin_profiles"),
+    path("panel/profiles/<str:capture_id>/<str:kind>/", views.admin_profile_download, name="admin_profile_download"),
     #path("panel/customers/<int:tep_id>/panel/", views.admin_customer_detail_partial, name="admin_customer_detail_panel"),
 
     path("tep/materials/add/", views.add_material_to_tep, name="add_material_to_tep"),
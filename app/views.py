@@ -2,15 +2,14 @@
 from django.views.decorators.cache import never_cache
 
 import json
-import csv
-import io
 import re
 from collections import defaultdict
+from datetime import date
 
-from django.core.paginator import Paginator
-from django.db import transaction
-from django.db.models import Q
-from django.http import HttpResponse
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 
 from django.contrib import messages
@@ -23,6 +22,13 @@ from django.utils.http import url_has_allowed_host_and_scheme
 
 from .models import Customer, TEPCode, Material, MaterialList, Forecast
 from .forms import EmployeeCreateForm
+from .pagination import approx_count, paginate_queryset, paginate_sequence
+from .profiling import CAPTURE_KINDS, capture_path, is_capture_id, list_captures
+from .propagation import propagate_masters
+from .readmodel import get_snapshot
+from .trigram import search_masters
+from .importing import import_forecasts, import_masters, previous_import, record_import, upload_rows
+from .storage import hash_file
 
 from django.contrib.auth import logout
 from django.shortcuts import redirect
@@ -153,89 +159,102 @@ def _allocate_material_name(tep, base_name: str, exclude_partcode: str = "") ->
     return f"{base} {max(numbers) + 1}"
 
 
-def build_customer_table(q: str):
-    qs = (
-        Customer.objects
-        .prefetch_related("tep_codes__materials")
-        .order_by("customer_name")
-    )
+CUSTOMERS_PER_PAGE = 25
+FUZZY_RESULTS_LIMIT = 1000
 
-    if q:
-        qs = qs.filter(
-            Q(customer_name__icontains=q)
-            | Q(tep_codes__tep_code__icontains=q)
-            | Q(tep_codes__part_code__icontains=q)
-            | Q(tep_codes__materials__mat_partcode__icontains=q)
-            | Q(tep_codes__materials__mat_partname__icontains=q)
-            | Q(tep_codes__materials__mat_maker__icontains=q)
-        ).distinct()
-
-    grouped = defaultdict(lambda: {
-        "parts_by_code": {},
-        "teps_by_part": defaultdict(list),
-    })
-
-    for cust in qs:
-        name = cust.customer_name
-
-        for p in cust.parts or []:
-            if not isinstance(p, dict):
-                continue
-            pc = (p.get("Partcode") or "").strip()
-            pn = (p.get("Partname") or "").strip()
-            if pc and pc not in grouped[name]["parts_by_code"]:
-                grouped[name]["parts_by_code"][pc] = pn
 
-        for tep in cust.tep_codes.all():
-            grouped[name]["teps_by_part"][tep.part_code].append(tep)
+def _customer_sort_key(cust):
+    return (cust.customer_name, cust.id)
 
+
+def build_customer_table(q: str, cursor: str = "", descending: bool = False, per_page: int = CUSTOMERS_PER_PAGE):
+    """
+    One keyset page of customers (by name, then id), one row per customer
+    with its part codes and the TEP options of the default (first) part
+    only. The other parts' TEPs are fetched on demand from
+    customer_part_map, so the page does not grow with the whole BOM.
+    """
+    snap = get_snapshot()
+    page = paginate_sequence(snap.search(q), _customer_sort_key, cursor, per_page, descending=descending)
     customers = []
 
-    for name, g in grouped.items():
-        parts_by_code = g["parts_by_code"]
-        teps_by_part = g["teps_by_part"]
+    for cust in page:
+        parts_by_code = {}
+        for pc, pn in cust.parts:
+            if pc not in parts_by_code:
+                parts_by_code[pc] = pn
 
         part_code_options = sorted(parts_by_code.keys())
-        part_code_map = {}
-
-        for pc in part_code_options:
-            tep_objs = sorted(teps_by_part.get(pc, []), key=lambda t: t.tep_code)
-
-            teps = [
-                {
-                    "tep_id": t.id,
-                    "tep_code": t.tep_code,
-                    "materials_count": t.materials.count(),
-                }
-                for t in tep_objs
-            ]
-
-            default_tep = teps[0] if teps else None
+        default_pc = part_code_options[0] if part_code_options else ""
 
-            part_code_map[pc] = {
-                "part_name": parts_by_code.get(pc, ""),
-                "teps": teps,
-                "default_tep_id": default_tep["tep_id"] if default_tep else None,
-                "default_tep_code": default_tep["tep_code"] if default_tep else "",
-                "default_materials_count": default_tep["materials_count"] if default_tep else 0,
+        default_teps = [
+            {
+                "tep_id": t.id,
+                "tep_code": t.tep_code,
+                "materials_count": len(snap.materials_of(t.id)),
             }
-
-        default_pc = part_code_options[0] if part_code_options else ""
+            for t in sorted(
+                (t for t in snap.teps_of(cust.id) if t.part_code == default_pc),
+                key=lambda t: t.tep_code,
+            )
+        ]
+        default_tep = default_teps[0] if default_teps else None
 
         customers.append({
-            "customer_name": name,
+            "customer_id": cust.id,
+            "customer_name": cust.customer_name,
             "part_code_options": part_code_options,
             "default_part_code": default_pc,
 
-            "default_tep_options": part_code_map.get(default_pc, {}).get("teps", []),
-            "default_tep_id": part_code_map.get(default_pc, {}).get("default_tep_id"),
-            "default_tep_code": part_code_map.get(default_pc, {}).get("default_tep_code", ""),
-            "default_materials_count": part_code_map.get(default_pc, {}).get("default_materials_count", 0),
+            "default_tep_options": default_teps,
+            "default_tep_id": default_tep["tep_id"] if default_tep else None,
+            "default_tep_code": default_tep["tep_code"] if default_tep else "",
+            "default_materials_count": default_tep["materials_count"] if default_tep else 0,
+        })
+
+    return page.with_items(customers)
 
-            "part_code_map_json": json.dumps(part_code_map, ensure_ascii=False),
+
+def _part_code_map(customer):
+    """
+    Part code -> {part_name, teps, default_tep_*} for one customer, with
+    materials counted by the database.
+    """
+    parts_by_code = {}
+    for p in customer.parts or []:
+        if not isinstance(p, dict):
+            continue
+        pc = str(p.get("Partcode") or "").strip()
+        if pc and pc not in parts_by_code:
+            parts_by_code[pc] = str(p.get("Partname") or "").strip()
+
+    teps_by_part = defaultdict(list)
+    teps = (
+        TEPCode.objects
+        .filter(customer=customer)
+        .annotate(materials_count=Count("materials"))
+        .order_by("tep_code")
+        .values("id", "part_code", "tep_code", "materials_count")
+    )
+    for t in teps:
+        teps_by_part[t["part_code"]].append({
+            "tep_id": t["id"],
+            "tep_code": t["tep_code"],
+            "materials_count": t["materials_count"],
         })
 
-    return customers
+    part_code_map = {}
+    for pc in sorted(parts_by_code):
+        part_teps = teps_by_part.get(pc, [])
+        default_tep = part_teps[0] if part_teps else None
+        part_code_map[pc] = {
+            "part_name": parts_by_code[pc],
+            "teps": part_teps,
+            "default_tep_id": default_tep["tep_id"] if default_tep else None,
+            "default_tep_code": default_tep["tep_code"] if default_tep else "",
+            "default_materials_count": default_tep["materials_count"] if default_tep else 0,
+        }
+    return part_code_map
 
 
 def _build_forecast_summary(fsq: str = "", fsq_customer: str = ""):
@@ -477,7 +496,7 @@ def admin_dashboard(request):
                     messages.error(request, "Loss % must be a number.")
                     return redirect(reverse("app:admin_dashboard") + "?tab=customers")
 
-            master = MaterialList.objects.filter(mat_partcode=mat_partcode).first()
+            master = get_snapshot().master(mat_partcode)
             if not master:
                 messages.error(request, f"mat_partcode not found in master list: {mat_partcode}")
                 return redirect(reverse("app:admin_dashboard") + "?tab=customers")
@@ -553,6 +572,7 @@ def admin_dashboard(request):
                 )
 
                 if created:
+                    propagate_masters({obj.mat_partcode: obj.id})
                     messages.success(request, f"Added material: {mat_partcode}")
                 else:
                     changed = False
@@ -568,6 +588,7 @@ def admin_dashboard(request):
 
                     if changed:
                         obj.save()
+                        propagate_masters({obj.mat_partcode: obj.id})
                         messages.success(request, f"Updated material: {mat_partcode}")
                     else:
                         messages.info(request, f"No changes for: {mat_partcode}")
@@ -604,11 +625,13 @@ def admin_dashboard(request):
                         messages.error(request, f"Part Code already exists: {mat_partcode}")
                         return redirect(reverse("app:admin_dashboard") + "?tab=materials")
 
+                old_code = obj.mat_partcode
                 obj.mat_partcode = mat_partcode
                 obj.mat_partname = mat_partname or mat_partcode
                 obj.mat_maker = mat_maker or "Unknown"
                 obj.unit = unit
                 obj.save()
+                propagate_masters({old_code: obj.id})
 
                 messages.success(request, f"Saved changes: {obj.mat_partcode}")
 
@@ -744,7 +767,7 @@ def admin_dashboard(request):
                 return redirect(reverse("app:admin_dashboard") + "?tab=forecast")
 
             # Find the original customer
-            original_customer_obj = Customer.objects.filter(customer_name__iexact=original_customer).first()
+            original_customer_obj = Customer.objects.filter(name_key=Customer.normalize_name(original_customer)).first()
             if not original_customer_obj:
                 messages.error(request, f"Original customer '{original_customer}' not found.")
                 return redirect(reverse("app:admin_dashboard") + "?tab=forecast")
@@ -862,7 +885,7 @@ def admin_dashboard(request):
                 return redirect(reverse("app:admin_dashboard") + "?tab=forecast")
 
             # Find the customer
-            customer = Customer.objects.filter(customer_name__iexact=customer_name).first()
+            customer = Customer.objects.filter(name_key=Customer.normalize_name(customer_name)).first()
             if not customer:
                 messages.error(request, f"Customer '{customer_name}' not found.")
                 return redirect(reverse("app:admin_dashboard") + "?tab=forecast")
@@ -965,39 +988,47 @@ def admin_dashboard(request):
             return redirect(reverse("app:admin_dashboard") + "?tab=users")
 
     # ── GET: build context ────────────────────────────────────────────────────
+    tep_id = request.GET.get("tep_id")
+    is_ajax = request.headers.get("x-requested-with") == "XMLHttpRequest"
+
+    # The side panel needs none of the tab data below.
+    if tep_id and is_ajax:
+        return render(request, "admin/_customer_detail_panel.html", _tep_panel_context(tep_id))
+
+    snap = get_snapshot()
 
     q = (request.GET.get("q") or "").strip()
-    customers = build_customer_table(q)
+    customers = build_customer_table(q, request.GET.get("ccur", ""))
 
     master_map = {
-        m["mat_partcode"]: {
-            "mat_partname": m["mat_partname"],
-            "mat_maker": m["mat_maker"],
-            "unit": m["unit"],
+        code: {
+            "mat_partname": m.mat_partname,
+            "mat_maker": m.mat_maker,
+            "unit": m.unit,
         }
-        for m in MaterialList.objects.all().values("mat_partcode", "mat_partname", "mat_maker", "unit")
+        for code, m in snap.master_map().items()
     }
 
     mq = (request.GET.get("mq") or "").strip()
-    materials_qs = MaterialList.objects.all().order_by("mat_partcode")
+    material_truncated = False
 
     if mq:
-        materials_qs = materials_qs.filter(
-            Q(mat_partcode__icontains=mq) |
-            Q(mat_partname__icontains=mq) |
-            Q(mat_maker__icontains=mq) |
-            Q(unit__icontains=mq)
+        # Fuzzy, ranked: best trigram score first, capped at FUZZY_RESULTS_LIMIT.
+        hits = search_masters(mq, limit=FUZZY_RESULTS_LIMIT + 1)
+        material_truncated = len(hits) > FUZZY_RESULTS_LIMIT
+        material_list = paginate_sequence(
+            hits[:FUZZY_RESULTS_LIMIT],
+            lambda h: (-h.score, h.mat_partcode, h.id),
+            request.GET.get("mcur"),
+            8,
         )
-
-    paginator = Paginator(materials_qs, 8)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
-
-    material_total = materials_qs.count()
-    material_list = page_obj
+        material_total = material_list.count
+    else:
+        material_list = paginate_queryset(MaterialList.objects.all(), ("mat_partcode", "id"), request.GET.get("mcur"), 8)
+        material_total = len(snap.masters)
 
     uq = (request.GET.get("uq") or "").strip()
-    users_qs = User.objects.all().order_by("-is_superuser", "-is_staff", "username")
+    users_qs = User.objects.all()
 
     if uq:
         users_qs = users_qs.filter(
@@ -1006,15 +1037,17 @@ def admin_dashboard(request):
             Q(employeeprofile__department__icontains=uq)
         )
 
-    users_paginator = Paginator(users_qs, 10)
-    upage = request.GET.get("upage")
-    users_page = users_paginator.get_page(upage)
-    user_total = users_qs.count()
+    users_page = paginate_queryset(
+        users_qs.select_related("employeeprofile"),
+        ("-is_superuser", "-is_staff", "username", "id"),
+        request.GET.get("ucur"),
+        10,
+    )
+    user_total = approx_count(users_qs)
 
     fq = (request.GET.get("fq") or "").strip()
     fcustomer = (request.GET.get("fcustomer") or "").strip()
-    page_number = request.GET.get('page', 1)
-    
+
     forecasts_qs = Forecast.objects.select_related("customer").order_by("-id")
     
     if fq:
@@ -1027,12 +1060,8 @@ def admin_dashboard(request):
     if fcustomer:
         forecasts_qs = forecasts_qs.filter(customer__customer_name=fcustomer)
 
-    # Get total count before pagination
-    forecasts_total = forecasts_qs.count()
-    
-    # Create paginator with 8 items per page
-    paginator = Paginator(forecasts_qs, 8)
-    forecasts_page = paginator.get_page(page_number)
+    forecasts_total = approx_count(forecasts_qs, snap.version)
+    forecasts_page = paginate_queryset(forecasts_qs, ("-id",), request.GET.get("fcur"), 8)
     
     # Process the paginated forecasts
     forecasts_list = []
@@ -1066,30 +1095,6 @@ def admin_dashboard(request):
 
     forecasts_monthly_json = json.dumps(forecasts_monthly_json, default=str)
 
-    tep_id = request.GET.get("tep_id")
-    is_ajax = request.headers.get("x-requested-with") == "XMLHttpRequest"
-
-    if tep_id and is_ajax:
-        tep = get_object_or_404(TEPCode.objects.select_related("customer"), id=tep_id)
-        materials = Material.objects.filter(tep_code=tep).order_by("mat_partname")
-
-        selected_part = (tep.part_code or "").strip()
-        selected_part_name = ""
-
-        for p in (tep.customer.parts or []):
-            if isinstance(p, dict) and str(p.get("Partcode", "")).strip() == selected_part:
-                selected_part_name = str(p.get("Partname", "")).strip()
-                break
-
-        return render(request, "admin/_customer_detail_panel.html", {
-            "customer": tep.customer,
-            "materials": materials,
-            "selected_tep": tep.tep_code,
-            "selected_part": selected_part,
-            "selected_part_name": selected_part_name,
-            "tep_id": tep.id,
-        })
-
     # ── Forecast Summary tab data ─────────────────────────────────────────────
     fsq = (request.GET.get("fsq") or "").strip()
     fsq_customer = (request.GET.get("fsq_customer") or "").strip()
@@ -1101,19 +1106,19 @@ def admin_dashboard(request):
     context = {
         "tab": tab,
 
-        "customers_count": Customer.objects.count(),
-        "tep_count": TEPCode.objects.count(),
-        "materials_count": Material.objects.count(),
-        "users_count": User.objects.count(),
-        "forecasts_count": Forecast.objects.count(),
+        "customers_count": len(snap.customers),
+        "tep_count": len(snap.teps),
+        "materials_count": len(snap.materials),
+        "users_count": approx_count(User.objects.all()),
+        "forecasts_count": approx_count(Forecast.objects.all(), snap.version),
 
         "customers": customers,
         "q": q,
 
         "mq": mq,
         "material_total": material_total,
+        "material_truncated": material_truncated,
         "material_list": material_list,
-        "page_obj": page_obj,
 
         "uq": uq,
         "user_total": user_total,
@@ -1121,7 +1126,7 @@ def admin_dashboard(request):
 
         "fq": fq,
         "fcustomer": fcustomer,
-        "forecasts_list": forecasts_page,  # Changed from forecasts_list to forecasts_page
+        "forecasts_list": forecasts_page,
         "forecasts_total": forecasts_total,
         "forecasts_monthly_json": forecasts_monthly_json,
         "all_customers": Customer.objects.all().order_by("customer_name"),
@@ -1159,6 +1164,24 @@ def toggle_user_active(request, user_id):
     return redirect(reverse("app:admin_dashboard") + "?tab=users")
 
 
+@login_required
+@user_passes_test(is_admin)
+def admin_profiles(request):
+    return render(request, "admin/profiles.html", {"captures": list_captures()})
+
+
+@login_required
+@user_passes_test(is_admin)
+def admin_profile_download(request, capture_id, kind):
+    if kind not in CAPTURE_KINDS or not is_capture_id(capture_id):
+        raise Http404("No such profile.")
+    try:
+        f = open(capture_path(capture_id, kind), "rb")
+    except FileNotFoundError:
+        raise Http404("No such profile.")
+    return FileResponse(f, as_attachment=True, filename=f"{capture_id}.{kind}")
+
+
 @login_required
 @user_passes_test(is_admin)
 def create_employee(request):
@@ -1185,78 +1208,35 @@ def admin_csv_upload(request):
 
     if request.method == "POST" and request.FILES.get("csv_file"):
         f = request.FILES["csv_file"]
-        raw = f.read()
+        digest = hash_file(f)
+        previous = previous_import("master")
+        if previous and previous.content_hash == digest:
+            messages.info(request, "CSV is identical to the previous upload; nothing to import.")
+            return redirect(next_url)
 
-        content = None
-        for enc in ("utf-8-sig", "utf-16", "cp1252", "latin-1"):
-            try:
-                content = raw.decode(enc)
-                break
-            except UnicodeDecodeError:
-                continue
+        parsed = upload_rows(f)
 
-        if content is None:
+        if parsed is None:
             messages.error(request, "Could not read file encoding. Save as CSV UTF-8 and upload again.")
             return redirect(next_url)
 
-        csv_file = io.StringIO(content)
-        reader = csv.DictReader(csv_file)
-        reader.fieldnames = [h.strip().lstrip("\ufeff") for h in (reader.fieldnames or [])]
-
-        master_inserted = 0
-        master_updated = 0
-        ALLOWED_UNITS = {"pc", "pcs", "m", "g", "kg"}
-
-        def sget(row, *keys, default=""):
-            for k in keys:
-                v = row.get(k)
-                if v is not None and str(v).strip() != "":
-                    return str(v).strip()
-            return default
+        header, rows = parsed
 
         try:
             with transaction.atomic():
-                for row in reader:
-                    mat_partcode = sget(row, "mat_partcode", "material_part_code")
-                    mat_partname = sget(row, "mat_partname", "material_name")
-                    mat_maker = sget(row, "mat_maker", "maker")
-                    unit = sget(row, "unit", default="pc").lower()
-
-                    if unit not in ALLOWED_UNITS:
-                        unit = "pc"
-
-                    if not mat_partcode:
-                        continue
-
-                    master, created_master = MaterialList.objects.get_or_create(
-                        mat_partcode=mat_partcode,
-                        defaults={
-                            "mat_partname": mat_partname or mat_partcode,
-                            "mat_maker": mat_maker or "Unknown",
-                            "unit": unit,
-                        }
-                    )
-
-                    if created_master:
-                        master_inserted += 1
-                    else:
-                        changed = False
-                        if mat_partname and master.mat_partname != mat_partname:
-                            master.mat_partname = mat_partname
-                            changed = True
-                        if mat_maker and master.mat_maker != mat_maker:
-                            master.mat_maker = mat_maker
-                            changed = True
-                        if unit and master.unit != unit:
-                            master.unit = unit
-                            changed = True
-                        if changed:
-                            master.save()
-                            master_updated += 1
+                result = import_masters(
+                    header, rows,
+                    skip_hashes=set(previous.row_hashes or []) if previous else (),
+                )
+                record_import("master", f, digest, result["row_hashes"])
 
+            master_inserted = result["master_inserted"]
+            master_updated = result["master_updated"]
+            skipped = result["skipped"]
             messages.success(
                 request,
-                f"CSV uploaded successfully | master_inserted={master_inserted}, master_updated={master_updated}"
+                f"CSV uploaded successfully | master_inserted={master_inserted}, "
+                f"master_updated={master_updated}, unchanged_rows={skipped}"
             )
             return redirect(next_url)
 
@@ -1287,6 +1267,11 @@ def admin_forecast_csv_upload(request):
     (customer_name, part_number, part_name) are grouped into a single
     Forecast record whose monthly_forecasts list contains all months
     from the CSV.
+
+    Wide format is detected from the header instead: one row per part with
+    a "<Mon-YYYY> qty" and optional "<Mon-YYYY> price" column per month
+    (e.g. "Jan-2026 qty", "Jan-2026 price"); months without a price column
+    use the row's unit_price.
     """
     default_next = reverse("app:admin_dashboard") + "?tab=forecast"
     next_url = request.POST.get("next") or request.GET.get("next") or default_next
@@ -1296,123 +1281,40 @@ def admin_forecast_csv_upload(request):
 
     if request.method == "POST" and request.FILES.get("csv_file"):
         f = request.FILES["csv_file"]
-        raw = f.read()
-
-        content = None
-        for enc in ("utf-8-sig", "utf-16", "cp1252", "latin-1"):
-            try:
-                content = raw.decode(enc)
-                break
-            except UnicodeDecodeError:
-                continue
-
-        if content is None:
-            messages.error(request, "Could not read file encoding. Save as CSV UTF-8 and upload again.")
+        digest = hash_file(f)
+        previous = previous_import("forecast")
+        if previous and previous.content_hash == digest:
+            messages.info(request, "Forecast CSV is identical to the previous upload; nothing to import.")
             return redirect(next_url)
 
-        csv_file = io.StringIO(content)
-        reader = csv.DictReader(csv_file)
-        reader.fieldnames = [h.strip().lstrip("\ufeff") for h in (reader.fieldnames or [])]
-
-        def sget(row, *keys, default=""):
-            for k in keys:
-                v = row.get(k)
-                if v is not None and str(v).strip() != "":
-                    return str(v).strip()
-            return default
-
-        def fnum(val, default=0.0):
-            try:
-                if val is None:
-                    return float(default)
-                s = str(val).strip()
-                if s == "":
-                    return float(default)
-                return float(s)
-            except Exception:
-                return float(default)
-
-        # Group monthly entries by (customer, part_number, part_name)
-        grouped = defaultdict(list)
+        parsed = upload_rows(f)
 
-        for row in reader:
-            customer_name = sget(row, "customer_name", "Customer", "CUSTOMER")
-            part_number = sget(row, "part_number", "Partcode", "PART_NUMBER", "part_code")
-            part_name = sget(row, "part_name", "Partname", "PART_NAME")
-
-            date_str = sget(row, "date", "month_year", "MonthYear")
-            month = sget(row, "month", "Month")
-            year = sget(row, "year", "Year")
-
-            if not date_str:
-                if month and year:
-                    date_str = f"{month}-{year}"
-                elif month:
-                    # Fallback: assume current year if only month is given
-                    from datetime import date
-                    date_str = f"{month}-{date.today().year}"
-
-            unit_price = fnum(row.get("unit_price") or row.get("UnitPrice") or row.get("price"), 0.0)
-            quantity = fnum(row.get("quantity") or row.get("qty") or row.get("Quantity"), 0.0)
-
-            if not (customer_name and part_number and part_name and date_str):
-                continue
-
-            key = (customer_name, part_number, part_name)
-            grouped[key].append({
-                "date": date_str,
-                "unit_price": unit_price,
-                "quantity": quantity,
-            })
-
-        if not grouped:
-            messages.error(request, "No valid forecast rows found in CSV.")
+        if parsed is None:
+            messages.error(request, "Could not read file encoding. Save as CSV UTF-8 and upload again.")
             return redirect(next_url)
 
-        created_count = 0
-        updated_count = 0
+        header, rows = parsed
 
         try:
             with transaction.atomic():
-                for (cust_name, part_no, part_nm), monthly in grouped.items():
-                    customer, _ = Customer.objects.get_or_create(
-                        customer_name=cust_name,
-                        defaults={"parts": []}
-                    )
+                result = import_forecasts(
+                    header, rows,
+                    seen_groups=set(previous.row_hashes or []) if previous else (),
+                    default_year=date.today().year,
+                )
+                if not result["groups"]:
+                    messages.error(request, "No valid forecast rows found in CSV.")
+                    return redirect(next_url)
 
-                    forecast = Forecast.objects.filter(
-                        customer=customer,
-                        part_number=part_no
-                    ).first()
-
-                    if forecast:
-                        forecast.part_name = part_nm or forecast.part_name
-                        forecast.monthly_forecasts = monthly
-                        forecast.save()
-                        updated_count += 1
-                    else:
-                        Forecast.objects.create(
-                            customer=customer,
-                            part_number=part_no,
-                            part_name=part_nm,
-                            monthly_forecasts=monthly,
-                        )
-                        created_count += 1
-
-                    # Ensure the part exists in customer.parts
-                    parts = customer.parts or []
-                    exists = any(
-                        isinstance(p, dict) and str(p.get("Partcode", "")).strip() == part_no
-                        for p in parts
-                    )
-                    if not exists:
-                        parts.append({"Partcode": part_no, "Partname": part_nm})
-                        customer.parts = parts
-                        customer.save(update_fields=["parts"])
+                record_import("forecast", f, digest, result["row_hashes"])
 
+            created_count = result["created"]
+            updated_count = result["updated"]
+            unchanged_count = result["unchanged"]
             messages.success(
                 request,
-                f"Forecast CSV uploaded successfully | created={created_count}, updated={updated_count}"
+                f"Forecast CSV uploaded successfully | created={created_count}, updated={updated_count}, "
+                f"unchanged={unchanged_count}"
             )
         except Exception as e:
             messages.error(request, f"Forecast CSV upload failed: {e}")
@@ -1422,43 +1324,58 @@ def admin_forecast_csv_upload(request):
     return redirect(next_url)
 
 
-@login_required
-def customer_list(request):
-    q = (request.GET.get("q") or "").strip()
-    customers = build_customer_table(q)
-    return render(request, "customer_list.html", {"customers": customers, "q": q})
-
-
-@never_cache
-@login_required
-def customer_detail(request, tep_id: int):
-    tep = get_object_or_404(
-        TEPCode.objects.select_related("customer"),
-        id=tep_id
-    )
+def _tep_panel_context(tep_id):
+    """
+    Context for the TEP material views. TEP, customer and part name come
+    from the read model; the materials queryset is only evaluated when the
+    template's cached fragments (keyed by tep_id + tep_version) miss.
+    """
+    try:
+        tep_id = int(tep_id)
+    except (TypeError, ValueError):
+        raise Http404("No TEPCode matches the given query.")
 
-    materials = (
-        Material.objects
-        .filter(tep_code=tep)
-        .order_by("mat_partname")
-    )
+    snap = get_snapshot()
+    tep = snap.teps.get(tep_id)
+    if tep is None:
+        raise Http404("No TEPCode matches the given query.")
+    customer = snap.customers[tep.customer_id]
 
     selected_part = (tep.part_code or "").strip()
-    selected_part_name = ""
-
-    for p in (tep.customer.parts or []):
-        if isinstance(p, dict) and str(p.get("Partcode", "")).strip() == selected_part:
-            selected_part_name = str(p.get("Partname", "")).strip()
-            break
+    selected_part_name = next((pn for pc, pn in customer.parts if pc == selected_part), "")
 
-    return render(request, "customer_detail.html", {
-        "customer": tep.customer,
-        "materials": materials,
+    return {
+        "customer": customer,
+        "materials": Material.objects.filter(tep_code_id=tep.id).order_by("mat_partname"),
         "selected_tep": tep.tep_code,
         "selected_part": selected_part,
         "selected_part_name": selected_part_name,
         "tep_id": tep.id,
-    })
+        "tep_version": snap.tep_version(tep.id),
+        # Never cache what an open transaction may still roll back.
+        "panel_cache_seconds": 0 if connection.in_atomic_block else getattr(settings, "TELS_PANEL_CACHE_SECONDS", 600),
+    }
+
+
+@login_required
+def customer_part_map(request, customer_id: int):
+    """JSON part -> TEP map for one customer row of the customer tables."""
+    customer = get_object_or_404(Customer.objects.only("id", "parts"), id=customer_id)
+    return JsonResponse(_part_code_map(customer))
+
+
+@login_required
+def customer_list(request):
+    q = (request.GET.get("q") or "").strip()
+    sort = "-name" if request.GET.get("sort") == "-name" else "name"
+    customers = build_customer_table(q, request.GET.get("cursor", ""), descending=sort == "-name")
+    return render(request, "customer_list.html", {"customers": customers, "q": q, "sort": sort})
+
+
+@never_cache
+@login_required
+def customer_detail(request, tep_id: int):
+    return render(request, "customer_detail.html", _tep_panel_context(tep_id))
 
 
 @login_required
@@ -1500,7 +1417,7 @@ def add_material_to_tep(request):
 
     tep = get_object_or_404(TEPCode, id=tep_id)
 
-    master = MaterialList.objects.filter(mat_partcode=mat_partcode).first()
+    master = get_snapshot().master(mat_partcode)
     if not master:
         messages.error(request, f"mat_partcode not found in master list: {mat_partcode}")
         return redirect("app:admin_dashboard")
@@ -0,0 +1,176 @@
+"""
+Streaming reader for .xlsx workbooks, standard library only.
+
+The first worksheet's XML is walked with iterparse one <row> at a time and
+every finished row is cleared from the tree, so memory stays bounded by
+the shared-strings table rather than by the sheet. Cells come back as
+strings, just like csv.reader, so the rows feed the same import pipeline.
+
+Date-formatted cells are rendered as "Jan-2026", the month key format the
+forecast importer already understands.
+"""
+import re
+import zipfile
+from datetime import datetime, timedelta
+from xml.etree.ElementTree import iterparse
+
+
+NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+ZIP_MAGIC = b"PK\x03\x04"
+
+# Built-in number formats that display dates (ECMA-376 18.8.30).
+_DATE_FORMAT_IDS = set(range(14, 23)) | set(range(27, 37)) | set(range(45, 48)) | set(range(50, 59))
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+
+
+def is_xlsx(head: bytes):
+    return head.startswith(ZIP_MAGIC)
+
+
+def _col_index(ref):
+    """'C12' -> 2"""
+    n = 0
+    for ch in ref:
+        if not ch.isalpha():
+            break
+        n = n * 26 + (ord(ch.upper()) - 64)
+    return n - 1
+
+
+def _first_sheet_path(zf):
+    names = set(zf.namelist())
+    try:
+        with zf.open("xl/workbook.xml") as f:
+            sheet = next(
+                (el for _, el in iterparse(f) if el.tag == f"{NS}sheet"),
+                None,
+            )
+        rid = sheet.get(f"{REL_NS}id") if sheet is not None else None
+        if rid:
+            with zf.open("xl/_rels/workbook.xml.rels") as f:
+                for _, el in iterparse(f):
+                    if el.tag == f"{PKG_REL_NS}Relationship" and el.get("Id") == rid:
+                        target = el.get("Target", "").lstrip("/")
+                        path = target if target.startswith("xl/") else f"xl/{target}"
+                        if path in names:
+                            return path
+    except KeyError:
+        pass
+    return "xl/worksheets/sheet1.xml"
+
+
+def _shared_strings(zf):
+    try:
+        f = zf.open("xl/sharedStrings.xml")
+    except KeyError:
+        return []
+
+    out = []
+    with f:
+        for _, el in iterparse(f):
+            if el.tag == f"{NS}si":
+                # Plain <t> plus rich-text runs <r><t>; phonetic hints (<rPh>) are skipped.
+                parts = []
+                for child in el:
+                    if child.tag == f"{NS}t":
+                        parts.append(child.text or "")
+                    elif child.tag == f"{NS}r":
+                        parts.extend(t.text or "" for t in child.iter(f"{NS}t"))
+                out.append("".join(parts))
+                el.clear()
+    return out
+
+
+def _is_date_format(code):
+    code = re.sub(r'"[^"]*"|\[[^\]]*\]|\\.', "", code or "").lower()
+    return any(ch in code for ch in "dmy") and "general" not in code
+
+
+def _date_styles(zf):
+    """Indexes into cellXfs whose number format displays a date."""
+    try:
+        f = zf.open("xl/styles.xml")
+    except KeyError:
+        return set()
+
+    custom_dates = set()
+    xf_formats = []
+    with f:
+        in_cell_xfs = False
+        for event, el in iterparse(f, events=("start", "end")):
+            if el.tag == f"{NS}cellXfs":
+                in_cell_xfs = event == "start"
+            elif event == "end" and el.tag == f"{NS}numFmt":
+                if _is_date_format(el.get("formatCode")):
+                    custom_dates.add(int(el.get("numFmtId", "-1")))
+            elif event == "end" and el.tag == f"{NS}xf" and in_cell_xfs:
+                xf_formats.append(int(el.get("numFmtId", "0")))
+
+    return {
+        i for i, fmt in enumerate(xf_formats)
+        if fmt in _DATE_FORMAT_IDS or fmt in custom_dates
+    }
+
+
+def _cell_value(c, shared, date_styles):
+    kind = c.get("t", "n")
+    if kind == "inlineStr":
+        return "".join(t.text or "" for t in c.iter(f"{NS}t"))
+
+    v = c.find(f"{NS}v")
+    raw = v.text if v is not None and v.text is not None else ""
+    if kind == "s":
+        return shared[int(raw)] if raw else ""
+    if kind == "b":
+        return "TRUE" if raw == "1" else "FALSE"
+    if kind == "n" and raw and int(c.get("s", "0")) in date_styles:
+        try:
+            return (_EXCEL_EPOCH + timedelta(days=float(raw))).strftime("%b-%Y")
+        except (ValueError, OverflowError):
+            return raw
+    return raw
+
+
+def _sheet_rows(zf, path, shared, date_styles):
+    with zf.open(path) as f:
+        sheet_data = None
+        for event, el in iterparse(f, events=("start", "end")):
+            if event == "start":
+                if el.tag == f"{NS}sheetData":
+                    sheet_data = el
+                continue
+            if el.tag != f"{NS}row":
+                continue
+
+            row = []
+            for c in el.iter(f"{NS}c"):
+                ref = c.get("r")
+                idx = _col_index(ref) if ref else len(row)
+                if idx >= len(row):
+                    row.extend([""] * (idx - len(row) + 1))
+                row[idx] = _cell_value(c, shared, date_styles)
+            yield row
+
+            # Drop rows already handed out so the tree never grows.
+            if sheet_data is not None:
+                sheet_data.clear()
+            else:
+                el.clear()
+
+
+def xlsx_rows(fileobj):
+    """
+    (header, row iterator) for the first worksheet of an .xlsx file object,
+    shaped like importing.csv_rows(). The file must stay open (and seekable)
+    while the rows are consumed.
+    """
+    zf = zipfile.ZipFile(fileobj)
+    shared = _shared_strings(zf)
+    date_styles = _date_styles(zf)
+    rows = _sheet_rows(zf, _first_sheet_path(zf), shared, date_styles)
+
+    header = next(rows, [])
+    return [h.strip().lstrip("\ufeff") for h in header], rows
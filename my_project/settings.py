@@ -44,10 +44,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "app.slowlog.SlowQueryMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "app.profiling.ProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -124,3 +126,41 @@ LOGOUT_REDIRECT_URL = "/login/"
 
 
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
+
+
+# CSV import pipeline (app/importing.py): rows per parsed chunk, the row
+# count from which parsing moves to a process pool, and its size
+# (None = one worker per CPU).
+TELS_IMPORT_CHUNK_ROWS = 2000
+TELS_IMPORT_PARALLEL_MIN_ROWS = 10000
+TELS_IMPORT_WORKERS = None
+
+# Stored uploads (app/storage.py): retention defaults for `manage.py tels_prune_uploads`.
+TELS_UPLOAD_KEEP_PER_KIND = 20
+TELS_UPLOAD_MAX_BYTES = None
+
+# Seconds a rendered TEP material panel stays in the cache. Entries are keyed
+# by the TEP's read-model version, so edits never serve a stale panel.
+TELS_PANEL_CACHE_SECONDS = 600
+
+# Dashboard totals (app/pagination.approx_count) for tables outside the change
+# log, e.g. users, are cached this many seconds.
+TELS_APPROX_COUNT_SECONDS = 60
+
+# Fuzzy master-list search (app/trigram.py): minimum share of the query's
+# trigrams a material must contain to be returned.
+TELS_TRIGRAM_THRESHOLD = 0.5
+
+# When master-list edits reach the Material rows copying them (app/propagation.py):
+# "inline", "on_commit" or "thread" (background worker after commit).
+TELS_MASTER_PROPAGATION = "on_commit"
+
+# Per-request CPU profiles (app/profiling.py), captured for superusers on
+# ?_profile=1 or "X-Profile: 1": where they are written and how many are kept.
+TELS_PROFILE_DIR = BASE_DIR / "profiles"
+TELS_PROFILE_KEEP = 50
+
+# Slow-query log (app/slowlog.py): statements slower than this many ms are
+# stored with their query plan (None disables), keeping the newest N rows.
+TELS_SLOW_QUERY_MS = 100
+TELS_SLOW_QUERY_KEEP = 500